@@ -0,0 +1,14 @@
+import requests
+from requests.adapters import HTTPAdapter
+
+# Pooled HTTP session shared by the download stages (blur filter, resolution probe,
+# perceptual dedup): one requests.Session used by all worker threads, with a
+# connection pool large enough that every worker keeps its connection alive.
+
+
+def make_session(pool_size):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
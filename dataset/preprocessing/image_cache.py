@@ -0,0 +1,195 @@
+import contextlib
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+# On-disk, content-addressed image cache shared by the blur filter and Q-Align scoring.
+#
+# Layout under cache_dir:
+#   objects/ab/<sha256 of content>  image bytes, stored once per distinct content
+#   index.db                        SQLite index shared by every process using the cache:
+#     objects (hash, size, last_used)  one row per stored object, last_used is the LRU order
+#     urls (url, hash)                 content hash each URL served
+#     stats (total_bytes)              running size of all objects, so the cap is global
+#
+# Object files are written to a unique temporary name and renamed into place, so readers
+# in other processes never see partial files. Eviction picks the least recently used
+# rows from the index (no directory scans) and drops the objects together with every
+# URL that pointed at them, in one transaction; an evicted object simply turns into a
+# cache miss. The index is in WAL mode, so lookups in one process never wait for a
+# writer in another.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    hash TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS objects_last_used ON objects (last_used);
+CREATE TABLE IF NOT EXISTS urls (
+    url TEXT PRIMARY KEY,
+    hash TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS urls_hash ON urls (hash);
+CREATE TABLE IF NOT EXISTS stats (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    total_bytes INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO stats (id, total_bytes) VALUES (0, 0);
+"""
+
+EVICT_CHUNK = 1000  # index rows read per step while evicting
+
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _atomic_write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class ImageCache:
+    def __init__(self, cache_dir, max_bytes=500 * 1024 ** 3):
+        """
+        Args:
+            cache_dir (str): Directory holding the cache (created if missing).
+            max_bytes (int): Size cap for cached image bytes, shared by every process
+                             using cache_dir; least recently used objects are evicted
+                             down to 90% of it when exceeded.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.objects_dir = os.path.join(cache_dir, 'objects')
+        self.index_path = os.path.join(cache_dir, 'index.db')
+        os.makedirs(self.objects_dir, exist_ok=True)
+
+        self._local = threading.local()  # one index connection per thread
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Autocommit mode: transactions are opened explicitly with BEGIN IMMEDIATE
+            conn = sqlite3.connect(self.index_path, timeout=60, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front, so read-then-update is atomic
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _object_path(self, content_hash):
+        return os.path.join(self.objects_dir, content_hash[:2], content_hash)
+
+    def size(self):
+        """Bytes currently cached, across every process sharing cache_dir."""
+        return self._connect().execute("SELECT total_bytes FROM stats").fetchone()[0]
+
+    def content_hash(self, url):
+        row = self._connect().execute("SELECT hash FROM urls WHERE url = ?", (url,)).fetchone()
+        return row[0] if row else None
+
+    def path(self, url):
+        """Local path of the cached image for `url`, or None on a miss."""
+        content_hash = self.content_hash(url)
+        if content_hash is None:
+            return None
+        with self._transaction() as conn:
+            # Mark as recently used; no row means it was evicted since the lookup
+            touched = conn.execute("UPDATE objects SET last_used = ? WHERE hash = ?",
+                                   (time.time(), content_hash)).rowcount
+        object_path = self._object_path(content_hash)
+        if not touched or not os.path.exists(object_path):
+            return None
+        return object_path
+
+    def get(self, url):
+        object_path = self.path(url)
+        if object_path is None:
+            return None
+        try:
+            with open(object_path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, url, data):
+        content_hash = _sha256(data)
+        object_path = self._object_path(content_hash)
+        # The row goes in before the file: a crash in between leaves a counted row
+        # without a file (a miss, rewritten by the next put), never an uncounted file
+        with self._transaction() as conn:
+            added = conn.execute("INSERT OR IGNORE INTO objects (hash, size, last_used) VALUES (?, ?, ?)",
+                                 (content_hash, len(data), time.time())).rowcount
+            if added:
+                conn.execute("UPDATE stats SET total_bytes = total_bytes + ?", (len(data),))
+            else:
+                conn.execute("UPDATE objects SET last_used = ? WHERE hash = ?", (time.time(), content_hash))
+            conn.execute("INSERT OR REPLACE INTO urls (url, hash) VALUES (?, ?)", (url, content_hash))
+            total = conn.execute("SELECT total_bytes FROM stats").fetchone()[0]
+        if not os.path.exists(object_path):
+            _atomic_write(object_path, data)
+
+        if total > self.max_bytes:
+            self.evict()
+        return content_hash
+
+    def fetch(self, url, download_fn):
+        """Return the bytes for `url`, calling download_fn(url) and caching the result on a miss."""
+        data = self.get(url)
+        if data is None:
+            data = download_fn(url)
+            self.put(url, data)
+        return data
+
+    def evict(self, target_bytes=None):
+        # Delete least recently used objects until the cache is below target_bytes.
+        # The rows (and the URLs pointing at them) are dropped under the index's write
+        # lock, so concurrent evictions in other processes never free the same bytes twice
+        if target_bytes is None:
+            target_bytes = int(self.max_bytes * 0.9)
+        evicted = []
+        with self._transaction() as conn:
+            total = conn.execute("SELECT total_bytes FROM stats").fetchone()[0]
+            while total > target_bytes:
+                rows = conn.execute("SELECT hash, size FROM objects ORDER BY last_used LIMIT ?",
+                                    (EVICT_CHUNK,)).fetchall()
+                if not rows:
+                    total = 0  # nothing left to evict
+                    break
+                chunk = []
+                for content_hash, size in rows:
+                    if total <= target_bytes:
+                        break
+                    chunk.append(content_hash)
+                    total -= size
+                conn.executemany("DELETE FROM objects WHERE hash = ?", [(h,) for h in chunk])
+                conn.executemany("DELETE FROM urls WHERE hash = ?", [(h,) for h in chunk])
+                evicted.extend(chunk)
+            conn.execute("UPDATE stats SET total_bytes = ?", (total,))
+        for content_hash in evicted:
+            try:
+                os.remove(self._object_path(content_hash))
+            except FileNotFoundError:
+                pass
+        return len(evicted)
+
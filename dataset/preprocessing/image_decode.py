@@ -0,0 +1,101 @@
+import io
+import mmap
+from contextlib import contextmanager
+
+import cv2
+import numpy as np
+from PIL import Image
+
+# Reduced-resolution image decoding shared by the scoring stages (blur filter, Q-Align).
+#
+# Each stage asks for the resolution it actually needs and the codec does as little
+# work as possible to get there:
+#   * JPEG is decoded directly at 1/2, 1/4 or 1/8 size in the DCT domain, through
+#     OpenCV's IMREAD_REDUCED_GRAYSCALE_* flags for grayscale and PIL's draft() for RGB.
+#     Other formats are decoded in full and then resized.
+#   * A source is either the encoded bytes or a local file path (e.g. an ImageCache
+#     object); files are memory-mapped instead of being read into a new buffer.
+#
+# Full-resolution decoding (reduction=1 / max_side=None) is unchanged from the original
+# scripts: PIL decode, convert("RGB"), then RGB -> gray with OpenCV where needed.
+
+REDUCTIONS = (8, 4, 2)
+
+_REDUCED_GRAYSCALE = {
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+
+
+def decode_reduction(scale):
+    """
+    Largest decode-time reduction (8, 4 or 2) that divides `scale`, or 1 when scale is
+    None / not divisible, i.e. when the stage needs the full resolution.
+    """
+    if not scale:
+        return 1
+    for reduction in REDUCTIONS:
+        if scale % reduction == 0:
+            return reduction
+    return 1
+
+
+@contextmanager
+def open_source(source):
+    # Buffer over the encoded image: the bytes themselves, or a read-only mmap of a file
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        yield source
+        return
+    with open(source, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        yield buf
+
+
+def _pil_open(buf):
+    # mmap objects are file-like already; plain bytes need a stream wrapper
+    return Image.open(buf if isinstance(buf, mmap.mmap) else io.BytesIO(buf))
+
+
+def image_size(source):
+    """(width, height) from the image header, without decoding the pixels."""
+    with open_source(source) as buf:
+        return _pil_open(buf).size
+
+
+def decode_gray(source, reduction=1):
+    """
+    Decode to a uint8 grayscale array, `reduction` times smaller on each side
+    (1, 2, 4 or 8; 1 decodes at full resolution exactly as before).
+    """
+    with open_source(source) as buf:
+        if reduction == 1:
+            im = _pil_open(buf).convert("RGB")
+            return cv2.cvtColor(np.array(im), cv2.COLOR_RGB2GRAY)
+
+        encoded = np.frombuffer(buf, dtype=np.uint8)
+        gray = cv2.imdecode(encoded, _REDUCED_GRAYSCALE[reduction])
+        del encoded  # release the mmap export before the file is closed
+        if gray is not None:
+            return gray
+
+        # Formats OpenCV cannot read: decode with PIL and reduce by area averaging
+        im = _pil_open(buf).convert("L")
+    width, height = im.size
+    return cv2.resize(np.array(im), (max(1, width // reduction), max(1, height // reduction)),
+                      interpolation=cv2.INTER_AREA)
+
+
+def decode_rgb(source, max_side=None):
+    """
+    Decode to an RGB PIL image whose longer side is at most `max_side` (None keeps the
+    full resolution). JPEGs are DCT-downscaled to the nearest size above max_side
+    before the final LANCZOS resize.
+    """
+    with open_source(source) as buf:
+        im = _pil_open(buf)
+        if max_side is not None:
+            im.draft("RGB", (max_side, max_side))
+        im = im.convert("RGB")
+    if max_side is not None:
+        im.thumbnail((max_side, max_side), Image.LANCZOS)
+    return im
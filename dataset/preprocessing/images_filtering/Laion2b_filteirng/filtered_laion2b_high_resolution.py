@@ -1,54 +1,76 @@
 import pandas as pd
 import os
+import sys
 from glob import glob
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from filter_engine import filter_high_resolution, LAION_HIGH_RESOLUTION_COLUMNS, FILTER_CONFIG
+from parquet_stream import iter_high_resolution_batches, write_batches
+from shard_executor import run_shards, print_summary
+from shard_manifest import ShardManifest, run_incremental_shards
+
 # Define the directory containing input parquet files
 parquet_dir = ''  # Update this if needed
 
 # Define output directory for filtered parquet files
 output_parquet_dir = ''  # Update as needed
-os.makedirs(output_parquet_dir, exist_ok=True)
-
-def filter_images(row):
-    w = row['WIDTH']
-    h = row['HEIGHT']
-    url = row['URL']
-    caption = row['TEXT']
-    aesthetic = row['aesthetic']
-    
-    aspect_ratio = w / h
-    resolution = h * w
-    tested_side = max(h, w)
-
-    if (
-        (resolution >= 3840 * 2160) and
-        (tested_side >= 3840) and
-        (0.6 <= aspect_ratio <= 1.5)
-    ):
-        return {'width': w, 'height': h, 'url': url, 'caption': caption, 'aesthetic_score':aesthetic}
+
+# Read shards row group by row group, decoding only WIDTH/HEIGHT up front and
+# skipping row groups whose statistics rule them out. Keeps memory bounded by
+# one row group; set to False to load each shard whole with pd.read_parquet.
+streaming = True
+
+# Number of worker processes used to filter shards in parallel (1 = sequential)
+num_workers = os.cpu_count()
+
+# Skip shards whose input file and filter configuration are unchanged since the
+# last run (tracked by size, mtime and content hash in the manifest below)
+incremental = True
+manifest_file = os.path.join(output_parquet_dir, 'shard_manifest.json')
+
+def filter_images(df):
+    # Vectorized: resolution >= 3840x2160, long side >= 3840, aspect ratio in [0.6, 1.5]
+    return filter_high_resolution(df, LAION_HIGH_RESOLUTION_COLUMNS, 'WIDTH', 'HEIGHT')
+
+def process_shard(file):
+    # Construct a unique output filename based on the input file name
+    base_name = os.path.basename(file)
+    base_name_no_ext = os.path.splitext(base_name)[0]
+    output_parquet_file = os.path.join(output_parquet_dir, f"{base_name_no_ext}_filtered.parquet")
+
+    if streaming:
+        stats = {}
+        batches = iter_high_resolution_batches(file, LAION_HIGH_RESOLUTION_COLUMNS, 'WIDTH', 'HEIGHT', stats)
+        num_kept = write_batches(batches, output_parquet_file)
+        counts = {
+            'total_num': stats['rows'],
+            'kept_num': num_kept,
+            'skipped_row_groups': stats['skipped_row_groups'],
+        }
     else:
-        return None
-
-# List all parquet files in the directory
-parquet_files = glob(os.path.join(parquet_dir, "*.parquet"))
-
-for file in parquet_files:
-    print(f"Processing {file}...")
-    df = pd.read_parquet(file)
-    
-    # Apply the filtering function to each row
-    filtered = df.apply(filter_images, axis=1).dropna().tolist()
-    
-    # If there are filtered results, save them
-    if filtered:
-        filtered_df = pd.DataFrame(filtered)
-
-        # Construct a unique output filename based on the input file name
-        base_name = os.path.basename(file)
-        base_name_no_ext = os.path.splitext(base_name)[0]
-        output_parquet_file = os.path.join(output_parquet_dir, f"{base_name_no_ext}_filtered.parquet")
-
-        filtered_df.to_parquet(output_parquet_file, index=False)
-        print(f"Filtered results saved to {output_parquet_file}")
+        df = pd.read_parquet(file)
+
+        # Apply the filtering masks to the whole shard at once
+        filtered_df = filter_images(df)
+        num_kept = len(filtered_df)
+        if num_kept:
+            filtered_df.to_parquet(output_parquet_file, index=False)
+        counts = {'total_num': len(df), 'kept_num': num_kept}
+
+    counts['empty_shards'] = int(num_kept == 0)
+    return counts, [output_parquet_file] if num_kept else []
+
+if __name__ == "__main__":
+    os.makedirs(output_parquet_dir, exist_ok=True)
+
+    # List all parquet files in the directory
+    parquet_files = glob(os.path.join(parquet_dir, "*.parquet"))
+
+    if incremental:
+        run_config = dict(FILTER_CONFIG, script=os.path.basename(__file__), output_dir=os.path.abspath(output_parquet_dir), streaming=streaming)
+        manifest = ShardManifest(manifest_file, run_config)
+        summary = run_incremental_shards(process_shard, parquet_files, manifest, num_workers=num_workers)
     else:
-        print(f"No results matched the criteria for {file}.")
+        summary = run_shards(process_shard, parquet_files, num_workers=num_workers)
+    print_summary(summary)
+    print(f"Filtered results saved to {output_parquet_dir}")
@@ -1,59 +1,64 @@
 import pandas as pd
 import os
+import sys
 from glob import glob
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from filter_engine import filter_labels, UNKNOWN_LABELS, UNKNOWN_COLUMNS, FILTER_CONFIG
+from shard_executor import run_shards, print_summary
+from shard_manifest import ShardManifest, run_incremental_shards
+
 # Define the directory containing input parquet files
 parquet_dir = ''  # Update this if needed
 
 # Define output directory for filtered parquet files
 output_parquet_dir = ''  # Update as needed
-os.makedirs(output_parquet_dir, exist_ok=True)
-
-error_num = 0
-total_num = 0
-
-def filter_images(row):
-    global error_num
-    global total_num
-    w = row['width']
-    h = row['height']
-    url = row['url']
-    caption = row['caption']
-    aesthetic = row['aesthetic_score']
-    shot_type = row['shot_type']
-    style = row['style']
-    aespect_ratio = row['aespect_ratio']
-
-    if (shot_type == 'unknown' or shot_type == 'Unknown' or style == 'unknown' or style == 'Unknown'):
-        error_num += 1
-        total_num += 1
-        return None
-    else:
-        total_num += 1
-        return {'width': w, 'height': h, 'url': url, 'caption': caption, 'aesthetic_score':aesthetic, 'shot_type':shot_type, 'style':style, 'aespect_ratio': aespect_ratio} 
 
-# List all parquet files in the directory
-parquet_files = glob(os.path.join(parquet_dir, "*.parquet"))
+# Number of worker processes used to filter shards in parallel (1 = sequential)
+num_workers = os.cpu_count()
+
+# Skip shards whose input file and filter configuration are unchanged since the
+# last run (tracked by size, mtime and content hash in the manifest below)
+incremental = True
+manifest_file = os.path.join(output_parquet_dir, 'shard_manifest.json')
 
-for file in parquet_files:
-    print(f"Processing {file}...")
+def filter_images(df):
+    return filter_labels(df, UNKNOWN_LABELS, UNKNOWN_COLUMNS, 'shot_type')
+
+def process_shard(file):
     df = pd.read_parquet(file)
     
-    # Apply the filtering function to each row
-    filtered = df.apply(filter_images, axis=1).dropna().tolist()
+    # Apply the filtering masks to the whole shard at once
+    filtered_df = filter_images(df)
     
     # If there are filtered results, save them
-    if filtered:
-        filtered_df = pd.DataFrame(filtered)
-
+    outputs = []
+    if not filtered_df.empty:
         # Construct a unique output filename based on the input file name
         base_name = os.path.basename(file)
         base_name_no_ext = os.path.splitext(base_name)[0]
         output_parquet_file = os.path.join(output_parquet_dir, f"{base_name_no_ext}_filtered.parquet")
 
         filtered_df.to_parquet(output_parquet_file, index=False)
-        print(f"Filtered results saved to {output_parquet_file}")
+        outputs.append(output_parquet_file)
     else:
         print(f"No results matched the criteria for {file}.")
 
-print(f"Total number of images processed: {total_num} with {error_num} unknowns.")
+    # Per-shard counters, merged by the executor (globals don't survive worker processes)
+    counts = {'total_num': len(df), 'error_num': len(df) - len(filtered_df)}
+    return counts, outputs
+
+if __name__ == "__main__":
+    os.makedirs(output_parquet_dir, exist_ok=True)
+
+    # List all parquet files in the directory
+    parquet_files = glob(os.path.join(parquet_dir, "*.parquet"))
+
+    if incremental:
+        run_config = dict(FILTER_CONFIG, script=os.path.basename(__file__), output_dir=os.path.abspath(output_parquet_dir))
+        manifest = ShardManifest(manifest_file, run_config)
+        summary = run_incremental_shards(process_shard, parquet_files, manifest, num_workers=num_workers)
+    else:
+        summary = run_shards(process_shard, parquet_files, num_workers=num_workers)
+    print_summary(summary)
+    print(f"Total number of images processed: {summary['total_num']} with {summary['error_num']} unknowns.")
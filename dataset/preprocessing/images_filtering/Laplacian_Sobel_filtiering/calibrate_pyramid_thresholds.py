@@ -0,0 +1,166 @@
+import numpy as np
+import pandas as pd
+import requests
+import json
+import os
+import sys
+import time
+
+from quality_metrics import sobel_patch_variances, flat_patch_ratio, laplacian_variance
+from image_pipeline import score_image
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from image_decode import decode_gray
+
+# Fit reduced-scale (pyramid mode) thresholds that reproduce the full-resolution
+# accept/reject decisions of laplacian_blur_sobel_operator_filtering_b.py.
+#
+# Every sample image is scored twice: at full resolution in float64 and at 1/SCALE
+# in float32 (decoded at reduced size when REDUCED_DECODE is set, as in the filter). Each reduced threshold is chosen to best agree with its full-resolution
+# counterpart's decision, then the combined decision is compared with the
+# full-resolution decision (and with the 'label' column when the sample has one).
+
+# === Configuration ===
+SAMPLE_CSV = ""  # sample with a 'path' (local file) or 'url' column, optional 'label' (1 = accept, 0 = reject)
+SCALE = 4
+REDUCED_DECODE = True  # keep in sync with the filtering script
+OUTPUT_FILE = f"pyramid_thresholds_x{SCALE}.json"
+NUM_CANDIDATES = 512  # candidate thresholds tried per metric
+
+# Full-resolution thresholds being reproduced (keep in sync with the filtering script)
+patch_size = 240
+flat_threshold = 100
+flat_ratio_cutoff = 0.65
+Laplacian_Threshold_low = 100
+Laplacian_Threshold_high = 10000
+
+def load_source(row):
+    # Local path (decoded memory-mapped) or downloaded bytes
+    if isinstance(row.get('path'), str) and row['path']:
+        return row['path']
+    with requests.get(row['url'], timeout=10) as response:
+        response.raise_for_status()
+        return response.content
+
+def candidates(values):
+    return np.unique(np.quantile(values, np.linspace(0, 1, NUM_CANDIDATES)))
+
+def best_threshold(agreement_fn, thresholds):
+    # Threshold with the highest agreement (ties go to the first, i.e. smallest, one)
+    scores = np.array([agreement_fn(t) for t in thresholds])
+    best = int(np.argmax(scores))
+    return float(thresholds[best]), float(scores[best])
+
+def decisions(lap, flat_ratio, low, high):
+    # True = accepted, mirroring the check in the filtering script
+    return (lap > low) & (lap < high) & (flat_ratio < flat_ratio_cutoff)
+
+if __name__ == "__main__":
+    sample = pd.read_csv(SAMPLE_CSV, engine="python", dtype=str)
+
+    full_lap, full_flat_ratio = [], []
+    reduced_lap, reduced_variances = [], []
+    labels = []
+    full_time = reduced_time = 0.0
+
+    for idx, row in sample.iterrows():
+        try:
+            source = load_source(row)
+            # Both timings start from the encoded image, so decode savings show up too
+            start = time.perf_counter()
+            gray = decode_gray(source)
+        except Exception as e:
+            print(f"Skipping sample {idx}: {e}")
+            continue
+
+        lap = laplacian_variance(gray)
+        variances = sobel_patch_variances(gray, patch_size)
+        full_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        reduced = score_image(source, patch_size, scale=SCALE, reduced_decode=REDUCED_DECODE)
+        lap_r, variances_r = reduced['lap'], reduced['variances']
+        reduced_time += time.perf_counter() - start
+
+        full_lap.append(lap)
+        full_flat_ratio.append(flat_patch_ratio(variances, flat_threshold))
+        reduced_lap.append(lap_r)
+        reduced_variances.append(variances_r.ravel())
+        if 'label' in sample.columns and pd.notna(row['label']):
+            labels.append(int(float(row['label'])))
+        else:
+            labels.append(None)
+
+    if not full_lap:
+        print("No sample images could be scored.")
+        sys.exit(1)
+
+    full_lap = np.array(full_lap)
+    full_flat_ratio = np.array(full_flat_ratio)
+    reduced_lap = np.array(reduced_lap)
+
+    # Fit each reduced threshold against the full-resolution decision it replaces
+    too_blurry = full_lap <= Laplacian_Threshold_low
+    too_noisy = full_lap >= Laplacian_Threshold_high
+    too_flat = full_flat_ratio >= flat_ratio_cutoff
+
+    lap_candidates = candidates(reduced_lap)
+    low, low_agreement = best_threshold(lambda t: np.mean((reduced_lap <= t) == too_blurry), lap_candidates)
+    high, high_agreement = best_threshold(lambda t: np.mean((reduced_lap >= t) == too_noisy), lap_candidates[::-1])
+
+    def flat_agreement(t):
+        ratios = np.array([flat_patch_ratio(v, t) for v in reduced_variances])
+        return np.mean((ratios >= flat_ratio_cutoff) == too_flat)
+
+    flat, flat_agreement_rate = best_threshold(flat_agreement, candidates(np.concatenate(reduced_variances)))
+
+    # Agreement of the combined reduced-scale decision
+    reduced_flat_ratio = np.array([flat_patch_ratio(v, flat) for v in reduced_variances])
+    full_decision = decisions(full_lap, full_flat_ratio, Laplacian_Threshold_low, Laplacian_Threshold_high)
+    reduced_decision = decisions(reduced_lap, reduced_flat_ratio, low, high)
+    overall_agreement = float(np.mean(full_decision == reduced_decision))
+
+    labeled = np.array([label is not None for label in labels])
+    label_agreement = None
+    if labeled.any():
+        label_values = np.array([bool(label) for label in labels if label is not None])
+        label_agreement = {
+            'full_resolution': float(np.mean(full_decision[labeled] == label_values)),
+            'reduced': float(np.mean(reduced_decision[labeled] == label_values)),
+            'num_labeled': int(labeled.sum()),
+        }
+
+    result = {
+        'scale': SCALE,
+        'reduced_decode': REDUCED_DECODE,
+        'Laplacian_Threshold_low': low,
+        'Laplacian_Threshold_high': high,
+        'flat_threshold': flat,
+        'flat_ratio_cutoff': flat_ratio_cutoff,
+        'num_samples': len(full_lap),
+        'agreement': {
+            'Laplacian_Threshold_low': low_agreement,
+            'Laplacian_Threshold_high': high_agreement,
+            'flat_threshold': flat_agreement_rate,
+            'decision': overall_agreement,
+        },
+        'label_agreement': label_agreement,
+        'seconds_per_image': {
+            'full_resolution': full_time / len(full_lap),
+            'reduced': reduced_time / len(full_lap),
+        },
+    }
+    with open(OUTPUT_FILE, "w") as f:
+        json.dump(result, f, indent=4)
+
+    print(f"Calibrated {len(full_lap)} images at 1/{SCALE} scale:")
+    print(f"  Laplacian_Threshold_low  {Laplacian_Threshold_low} -> {low:.4g} (agreement {low_agreement:.2%})")
+    print(f"  Laplacian_Threshold_high {Laplacian_Threshold_high} -> {high:.4g} (agreement {high_agreement:.2%})")
+    print(f"  flat_threshold           {flat_threshold} -> {flat:.4g} (agreement {flat_agreement_rate:.2%})")
+    print(f"  Accept/reject agreement with full resolution: {overall_agreement:.2%}")
+    if label_agreement is not None:
+        print(f"  Agreement with labels: full resolution {label_agreement['full_resolution']:.2%}, "
+              f"reduced {label_agreement['reduced']:.2%} ({label_agreement['num_labeled']} labeled)")
+    print(f"  Decode + metric time per image: {result['seconds_per_image']['full_resolution']:.3f}s -> "
+          f"{result['seconds_per_image']['reduced']:.3f}s")
+    print(f"Thresholds saved to {OUTPUT_FILE}")
@@ -0,0 +1,119 @@
+import json
+import os
+
+# Append-only JSONL journal of blur-filter decisions, one line per processed input row:
+#   {"i": <row index>, "s": "accepted" | "rejected" | "error", ...extra fields}
+#
+# Appending a line costs O(1) regardless of how many rows were accepted so far, lines are
+# fsynced in batches, and a line torn by a crash mid-write is cut off on the next open.
+# Resuming is exact: every row with an entry is skipped, every other row is processed,
+# except rows whose last entry is an error from one of `retry_stages` (e.g. a download
+# timeout), which are processed again until they have failed max_attempts times, and
+# rows the caller reopens (e.g. scored rows whose metrics never reached the store).
+
+ACCEPTED = "accepted"
+REJECTED = "rejected"
+ERROR = "error"
+
+
+def read_entries(path):
+    """
+    Return (entries, valid_bytes): the decoded journal lines and the byte length of
+    the intact prefix. A trailing partial or corrupt line is ignored.
+    """
+    entries = []
+    valid_bytes = 0
+    if not os.path.exists(path):
+        return entries, valid_bytes
+    with open(path, 'rb') as f:
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                break
+            valid_bytes += len(line)
+    return entries, valid_bytes
+
+
+class CheckpointJournal:
+    def __init__(self, path, fsync_every=1000, retry_stages=(), max_attempts=3):
+        """
+        Open (or create) the journal at `path`, dropping any torn tail line.
+
+        Args:
+            path (str): Journal file.
+            fsync_every (int): Number of appended entries between fsyncs.
+            retry_stages (tuple): Error stages (e.g. 'download') treated as transient:
+                                  such rows are not done and are retried on resume.
+            max_attempts (int): Failures in a retryable stage after which a row stays
+                                an error.
+        """
+        self.path = path
+        self.fsync_every = fsync_every
+
+        entries, valid_bytes = read_entries(path)
+        self.status = {}
+        attempts = {}
+        self.retry = set()
+        self.scored = set()  # rows whose last entry carries metrics ('lap')
+        for entry in entries:
+            index = entry['i']
+            self.status[index] = entry['s']
+            self.retry.discard(index)
+            if 'lap' in entry:
+                self.scored.add(index)
+            else:
+                self.scored.discard(index)
+            if entry['s'] == ERROR and entry.get('stage') in retry_stages:
+                attempts[index] = attempts.get(index, 0) + 1
+                if attempts[index] < max_attempts:
+                    self.retry.add(index)
+
+        self._file = open(path, 'ab')
+        self._file.truncate(valid_bytes)
+        self._unsynced = 0
+
+    def is_done(self, index):
+        return index in self.status and index not in self.retry
+
+    def reopen(self, indices):
+        """Mark rows as not done, so this run processes them again."""
+        self.retry.update(int(index) for index in indices)
+
+    def num_accepted(self):
+        return sum(1 for status in self.status.values() if status == ACCEPTED)
+
+    def append(self, index, status, **fields):
+        entry = {'i': int(index), 's': status}
+        entry.update(fields)
+        self._file.write((json.dumps(entry, default=str) + '\n').encode('utf-8'))
+        self.status[int(index)] = status
+        self.retry.discard(int(index))
+        if 'lap' in fields:
+            self.scored.add(int(index))
+        else:
+            self.scored.discard(int(index))
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_every:
+            self.sync()
+
+    def sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+
+    def close(self):
+        if not self._file.closed:
+            self.sync()
+            self._file.close()
+
+    def compact(self, df, output_path):
+        """
+        Write the accepted rows of `df` (indexed by position, like the journal) to
+        output_path in input order and return how many were written.
+        """
+        accepted = sorted(index for index, status in self.status.items() if status == ACCEPTED)
+        df.iloc[accepted].to_csv(output_path, index=False)
+        return len(accepted)
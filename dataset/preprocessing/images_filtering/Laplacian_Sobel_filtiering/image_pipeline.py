@@ -0,0 +1,146 @@
+import multiprocessing
+import os
+import signal
+import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import requests
+
+from quality_metrics import sobel_patch_variances, laplacian_variance
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from image_decode import decode_gray, decode_reduction, image_size
+from http_session import make_session
+
+# Staged download -> decode/score pipeline for the blur filter:
+#   * a thread pool downloads images over one pooled requests.Session,
+#   * each downloaded image (or the path of its cached copy, re-downloaded by the
+#     worker if the cache evicted it before the worker opened it) is handed to a process
+#     pool that decodes it and computes the Laplacian variance and the per-patch Sobel
+#     variance map; with reduced_decode, pyramid mode decodes JPEGs directly at a
+#     reduced size instead of decoding the full image and shrinking it,
+#   * at most max_in_flight images are downloaded or being scored at any time, and
+#     results are yielded in input order so index-based checkpoints stay valid.
+
+
+def download(session, url, timeout):
+    with session.get(url, timeout=timeout) as response:
+        response.raise_for_status()
+        return response.content
+
+
+def score_image(source, patch_size, scale=None, reduced_decode=False):
+    """
+    Decode `source` (image bytes or a local file path) and compute the blur metrics.
+
+    With reduced_decode in pyramid mode, the largest decode-time reduction dividing
+    `scale` is applied by the decoder and the metrics only reduce by the rest, so the
+    patches cover the same image area. The result is close to, not identical with,
+    full decode + area reduction; calibrate thresholds with the same setting.
+    """
+    reduction = decode_reduction(scale) if reduced_decode else 1
+    gray = decode_gray(source, reduction)
+    if reduction > 1:
+        width, height = image_size(source)
+        patch_size, scale = patch_size // reduction, scale // reduction
+    else:
+        height, width = gray.shape
+    return {
+        'lap': laplacian_variance(gray, scale=scale),
+        'variances': sobel_patch_variances(gray, patch_size, scale=scale),
+        'width': width,
+        'height': height,
+    }
+
+
+def score_cached(path, url, timeout, patch_size, scale=None, reduced_decode=False):
+    """
+    score_image on a cached file. If the cache evicted the file before this worker
+    opened it, the image is downloaded again instead of failing the row.
+    """
+    try:
+        return score_image(path, patch_size, scale, reduced_decode)
+    except FileNotFoundError:
+        with requests.Session() as session:
+            data = download(session, url, timeout)
+    return score_image(data, patch_size, scale, reduced_decode)
+
+
+def _init_score_worker():
+    # Workers must not run the parent's checkpoint-on-signal handlers; the parent
+    # handles Ctrl+C / SIGTERM and shuts the pool down.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+
+def _resolve(index, url, download_future):
+    # Wait for one item and turn it into a result dict; failures are reported, not raised
+    try:
+        score_future = download_future.result()
+    except Exception as e:
+        return {'index': index, 'url': url, 'stage': 'download', 'error': e}
+    try:
+        result = score_future.result()
+    except Exception as e:
+        return {'index': index, 'url': url, 'stage': 'score', 'error': e}
+    result.update(index=index, url=url, stage='done', error=None)
+    return result
+
+
+def iter_scored(items, patch_size, scale=None, download_workers=32, score_workers=None,
+                max_in_flight=128, timeout=10, session=None, cache=None, reduced_decode=False):
+    """
+    Download and score images concurrently, yielding results in input order.
+
+    Args:
+        items (iterable): (index, url) pairs.
+        patch_size (int): Sobel patch size at full resolution.
+        scale (int): Pyramid scale passed to the metrics (None = full resolution).
+        download_workers (int): Concurrent downloads (also the HTTP connection pool size).
+        score_workers (int): Decode/score processes (default os.cpu_count()).
+        max_in_flight (int): Upper bound on images downloaded or queued but not yet
+                             yielded, which bounds the memory held by image bytes.
+        timeout (float): Per-request timeout in seconds.
+        session (requests.Session): Optional session to use instead of a pooled default.
+        cache (ImageCache): Optional shared image cache; hits skip the download and
+                            are decoded from the memory-mapped cache file.
+        reduced_decode (bool): Decode at reduced size in pyramid mode (see score_image).
+
+    Yields:
+        dict: 'index', 'url', 'stage' ('download', 'score' or 'done') and 'error'
+              (None on success), plus 'lap', 'variances', 'width' and 'height' on success.
+    """
+    if session is None:
+        session = make_session(download_workers)
+
+    # Scoring jobs are submitted from download threads, so start workers with "spawn"
+    # rather than forking a multi-threaded process
+    mp_context = multiprocessing.get_context("spawn")
+    with ThreadPoolExecutor(max_workers=download_workers) as downloads, \
+            ProcessPoolExecutor(max_workers=score_workers, mp_context=mp_context,
+                                initializer=_init_score_worker) as scorers:
+
+        def fetch_and_submit(url):
+            if cache is not None:
+                # Hand cache hits to the worker as a path instead of pickling the bytes
+                source = cache.path(url)
+                if source is not None:
+                    return scorers.submit(score_cached, source, url, timeout, patch_size, scale, reduced_decode)
+                source = cache.fetch(url, lambda u: download(session, u, timeout))
+            else:
+                source = download(session, url, timeout)
+            return scorers.submit(score_image, source, patch_size, scale, reduced_decode)
+
+        pending = deque()
+        try:
+            for index, url in items:
+                pending.append((index, url, downloads.submit(fetch_and_submit, url)))
+                if len(pending) >= max_in_flight:
+                    yield _resolve(*pending.popleft())
+            while pending:
+                yield _resolve(*pending.popleft())
+        finally:
+            # Consumer stopped early (e.g. on a shutdown signal): drop queued downloads
+            for _, _, download_future in pending:
+                download_future.cancel()
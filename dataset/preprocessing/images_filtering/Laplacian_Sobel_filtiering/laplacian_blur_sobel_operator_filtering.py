@@ -4,33 +4,22 @@ import pandas as pd
 import requests
 from PIL import Image
 
+from quality_metrics import sobel_patch_variances, flat_patch_ratio
+
 patch_size = 240
 flat_threshold = 800
 Laplacian_Threshold_low = 150
 Laplacian_Threshold_high = 8000
 
-def sobel_variance(image):
-    # Calculate Sobel gradients in x and y directions
-    sobel_x = cv2.Sobel(image, cv2.CV_64F, 1, 0, ksize=3)
-    sobel_y = cv2.Sobel(image, cv2.CV_64F, 0, 1, ksize=3)
-    magnitude = cv2.magnitude(sobel_x, sobel_y)
-    height, width = magnitude.shape
-
-    total_processed_patch = 0
-    flat_region_count = 0
-
-    # Process image in non-overlapping patches
-    for i in range(0, height, patch_size):
-        for j in range(0, width, patch_size):
-            patch = magnitude[i:min(i + patch_size, height), j:min(j + patch_size, width)]
-            total_processed_patch += 1
-            var_sobel = np.var(patch)
-            if var_sobel < flat_threshold:
-                flat_region_count += 1
-
-    flat_ratio = flat_region_count / total_processed_patch if total_processed_patch > 0 else 0
+def sobel_variance(image, return_variances=False):
+    # Variance of the Sobel magnitude over non-overlapping patches, computed in one shot
+    variances = sobel_patch_variances(image, patch_size)
+    flat_ratio = flat_patch_ratio(variances, flat_threshold)
     # If more than 50% of patches are flat, return True
-    return flat_ratio >= 0.5
+    is_flat = flat_ratio >= 0.5
+    if return_variances:
+        return is_flat, variances
+    return is_flat
 
 def laplacian_variance(image):
     return cv2.Laplacian(image, cv2.CV_64F).var()
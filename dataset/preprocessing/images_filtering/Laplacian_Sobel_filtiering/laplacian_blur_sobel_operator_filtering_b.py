@@ -1,12 +1,18 @@
-import cv2
-import numpy as np
 import pandas as pd
-import requests
-from PIL import Image
 import logging
 import os
 import signal
 import sys
+import json
+
+from quality_metrics import flat_patch_ratio
+from image_pipeline import iter_scored
+from checkpoint_journal import CheckpointJournal, ACCEPTED, REJECTED, ERROR
+from metrics_store import MetricsStoreWriter, missing_urls
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from image_cache import ImageCache
+from resolution_probe import ProbeCache
 
 # === Configuration ===
 patch_size = 240
@@ -14,11 +20,56 @@ flat_threshold = 100
 Laplacian_Threshold_low = 100
 Laplacian_Threshold_high = 10000
 
-CHECKPOINT_INTERVAL = 50000
-CHECKPOINT_FILE = "checkpoint.csv"
-PROGRESS_FILE = "progress_checkpoint.txt"
+# Pyramid mode: compute both metrics on the grayscale image reduced by PYRAMID_SCALE
+# in float32 (None = full resolution in float64). The thresholds above are then
+# replaced by the reduced-scale ones fitted by calibrate_pyramid_thresholds.py.
+PYRAMID_SCALE = None
+PYRAMID_THRESHOLDS_FILE = ""  # JSON written by calibrate_pyramid_thresholds.py
+# In pyramid mode, let the JPEG decoder produce the reduced image directly (DCT-domain
+# 1/2, 1/4 or 1/8 decode) instead of decoding at full size first. Must match the
+# setting the thresholds were calibrated with.
+REDUCED_DECODE = True
+
+# Concurrency: downloads run on a thread pool sharing one pooled HTTP session, and
+# decoding/scoring runs on a process pool. MAX_IN_FLIGHT bounds how many images are
+# held in memory between the two stages; results are still handled in input order.
+DOWNLOAD_WORKERS = 32
+SCORE_WORKERS = os.cpu_count()
+MAX_IN_FLIGHT = 128
+DOWNLOAD_TIMEOUT = 10
+
+# Content-addressed image cache shared with Q-Align scoring, so threshold reruns and
+# later stages don't download the same images again ("" disables the cache)
+IMAGE_CACHE_DIR = ""
+IMAGE_CACHE_MAX_BYTES = 500 * 1024 ** 3
+
+# Append-only journal with one entry per processed row (accepted, rejected or error);
+# entries are fsynced every JOURNAL_FSYNC_INTERVAL rows and on shutdown, and the
+# accepted rows are compacted into FILTERED_OUTPUT_FILE at the end of the run
+JOURNAL_FILE = "checkpoint_journal.jsonl"
+JOURNAL_FSYNC_INTERVAL = 1000
+# Failed rows whose error came from one of these stages are retried on the next run
+# (e.g. download timeouts), up to MAX_ATTEMPTS failures in total
+RETRY_ERROR_STAGES = ('download',)
+MAX_ATTEMPTS = 3
+FILTERED_OUTPUT_FILE = "filtered_images.csv"
 CSV_INPUT_FILE = ""  # your input CSV file
 
+# Probe cache written by Resolution_probe/probe_resolution.py: rows whose real
+# resolution the probe found below 4K are journaled as rejected without being
+# downloaded ("" disables the check)
+PROBE_CACHE_FILE = ""
+
+# Columnar store of every computed metric keyed by URL (including the per-patch
+# variance map), used by rethreshold_metrics.py to re-tune thresholds offline
+# ("" disables the store)
+METRICS_STORE_DIR = "blur_metrics"
+METRICS_ROWS_PER_PART = 100_000
+
+journal = None  # opened in main
+metrics = None
+shutdown_requested = False
+
 # === Logging Setup ===
 logging.basicConfig(
     filename='image_processing_third_trail.log',
@@ -28,60 +79,43 @@ logging.basicConfig(
 
 # === Graceful Shutdown Handler ===
 def graceful_shutdown(signum, frame):
-    logging.info("Received termination signal. Saving progress before exit.")
-    save_checkpoint(current_index, good_rows)
-    sys.exit(0)
+    # Only set a flag: the handler can interrupt journal.append or a metrics write, so
+    # the main loop stops at the next result and closes both from there
+    global shutdown_requested
+    if journal is None:
+        sys.exit(0)  # nothing to save yet
+    shutdown_requested = True
 
 signal.signal(signal.SIGINT, graceful_shutdown)   # handle Ctrl+C
 signal.signal(signal.SIGTERM, graceful_shutdown)  # handle termination signal
 
-# === Checkpoint Saving Function ===
-def save_checkpoint(idx, good_rows):
-    try:
-        pd.DataFrame(good_rows).to_csv(CHECKPOINT_FILE, index=False)
-        with open(PROGRESS_FILE, "w") as pf:
-            pf.write(str(idx))
-        logging.info(f"Checkpoint saved at image index: {idx}")
-    except Exception as e:
-        logging.error(f"Error saving checkpoint at index {idx}: {e}")
-
-# === Image Quality Functions ===
-def sobel_variance(image):
-    try:
-        # Calculate Sobel gradients in x and y directions
-        sobel_x = cv2.Sobel(image, cv2.CV_64F, 1, 0, ksize=3)
-        sobel_y = cv2.Sobel(image, cv2.CV_64F, 0, 1, ksize=3)
-        magnitude = cv2.magnitude(sobel_x, sobel_y)
-        height, width = magnitude.shape
-
-        total_processed_patch = 0
-        flat_region_count = 0
-
-        # Process image in non-overlapping patches
-        for i in range(0, height, patch_size):
-            for j in range(0, width, patch_size):
-                patch = magnitude[i:min(i + patch_size, height), j:min(j + patch_size, width)]
-                total_processed_patch += 1
-                var_sobel = np.var(patch)
-                if var_sobel < flat_threshold:
-                    flat_region_count += 1
-
-        flat_ratio = flat_region_count / total_processed_patch if total_processed_patch > 0 else 0
-        # If more than 50% of patches are flat, consider it as low-quality
-        return flat_ratio >= 0.65
-    except Exception as e:
-        logging.error(f"Error in sobel_variance calculation: {e}")
-        return True  # Assume flat (reject) if error occurs
-
-def laplacian_variance(image):
-    try:
-        return cv2.Laplacian(image, cv2.CV_64F).var()
-    except Exception as e:
-        logging.error(f"Error in laplacian_variance calculation: {e}")
-        return 0  # Return a value that will likely cause the image to be skipped
+# === Image Quality Decision ===
+def flat_detection(variances):
+    # If more than 65% of patches are flat, consider it as low-quality
+    return flat_patch_ratio(variances, flat_threshold) >= 0.65
+
+# === Pyramid Thresholds ===
+def load_pyramid_thresholds(path, scale, reduced_decode):
+    with open(path, "r") as f:
+        calibrated = json.load(f)
+    if calibrated["scale"] != scale:
+        raise ValueError(f"Thresholds in {path} were fitted at scale {calibrated['scale']}, not {scale}.")
+    if calibrated.get("reduced_decode", False) != reduced_decode:
+        raise ValueError(f"Thresholds in {path} were fitted with reduced_decode={calibrated.get('reduced_decode', False)}.")
+    return calibrated["Laplacian_Threshold_low"], calibrated["Laplacian_Threshold_high"], calibrated["flat_threshold"]
 
 # === Main Processing ===
 if __name__ == "__main__":
+    if PYRAMID_SCALE is not None:
+        try:
+            Laplacian_Threshold_low, Laplacian_Threshold_high, flat_threshold = load_pyramid_thresholds(
+                PYRAMID_THRESHOLDS_FILE, PYRAMID_SCALE, REDUCED_DECODE)
+            logging.info(f"Pyramid mode at 1/{PYRAMID_SCALE} scale with thresholds "
+                         f"{Laplacian_Threshold_low}/{Laplacian_Threshold_high}/{flat_threshold}")
+        except Exception as e:
+            logging.error(f"Error loading pyramid thresholds: {e}")
+            sys.exit(1)
+
     try:
         # Read input CSV containing image URLs
         df = pd.read_csv(CSV_INPUT_FILE, engine="python", dtype=str)
@@ -89,89 +123,114 @@ if __name__ == "__main__":
         logging.error(f"Error reading CSV file: {e}")
         sys.exit(1)
 
-    # Initialize or resume checkpoint
-    if os.path.exists(PROGRESS_FILE):
-        try:
-            with open(PROGRESS_FILE, "r") as pf:
-                last_index = int(pf.read().strip())
-            logging.info(f"Resuming from index {last_index + 1}")
-        except Exception as e:
-            logging.error(f"Error reading progress file: {e}")
-            last_index = -1
-    else:
-        last_index = -1
-
-    if os.path.exists(CHECKPOINT_FILE):
-        try:
-            good_rows_df = pd.read_csv(CHECKPOINT_FILE, dtype=str)
-            good_rows = good_rows_df.to_dict('records')
-            logging.info(f"Loaded {len(good_rows)} previously accepted images.")
-        except Exception as e:
-            logging.error(f"Error reading checkpoint file: {e}")
-            good_rows = []
-    else:
-        good_rows = []
+    # Initialize or resume from the journal: every row with an entry is already done,
+    # except rows whose download failed fewer than MAX_ATTEMPTS times
+    try:
+        journal = CheckpointJournal(JOURNAL_FILE, fsync_every=JOURNAL_FSYNC_INTERVAL,
+                                    retry_stages=RETRY_ERROR_STAGES, max_attempts=MAX_ATTEMPTS)
+    except Exception as e:
+        logging.error(f"Error opening journal file: {e}")
+        sys.exit(1)
+    if journal.status:
+        logging.info(f"Resuming: {len(journal.status) - len(journal.retry)} rows already processed, "
+                     f"{journal.num_accepted()} accepted, {len(journal.retry)} failed rows to retry.")
+
+    if METRICS_STORE_DIR:
+        # Rows scored by a run killed before its buffered metrics were written are in the
+        # journal but not in the store: score them again so the store stays complete
+        scored = sorted(journal.scored)
+        if scored:
+            missing = missing_urls(METRICS_STORE_DIR, df['url'].iloc[scored])
+            rescore = [idx for idx in scored if df['url'].iloc[idx] in missing]
+            if rescore:
+                logging.info(f"{len(rescore)} scored rows are missing from the metrics store; scoring them again.")
+                journal.reopen(rescore)
+        metrics = MetricsStoreWriter(METRICS_STORE_DIR, patch_size, scale=PYRAMID_SCALE,
+                                     flat_threshold=flat_threshold, rows_per_part=METRICS_ROWS_PER_PART)
+
+    probe_cache = ProbeCache(PROBE_CACHE_FILE) if PROBE_CACHE_FILE else None
 
     total_images = len(df)
-    current_index = last_index  # will update in loop
+    current_index = -1  # will update in loop
 
-    try:
-        # Process images starting from the next index
-        for idx in range(last_index + 1, total_images):
-            current_index = idx  # update current index for checkpointing and signal handling
-            row = df.iloc[idx]
-            url_link = row.get('url', None)
-            if not url_link:
+    def pending_items():
+        # (index, url) pairs still to process, in input order
+        for idx in range(total_images):
+            if journal.is_done(idx):
+                continue
+            url_link = df.iloc[idx].get('url', None)
+            if not isinstance(url_link, str) or not url_link:
                 logging.warning(f"Row {idx} missing URL. Skipping.")
+                journal.append(idx, ERROR, error="missing url")
                 continue
-
-            try:
-                # Use a context manager to ensure the connection is properly closed
-                with requests.get(url_link, stream=True, timeout=10) as response:
-                    response.raise_for_status()
-                    # Open image using PIL and convert to RGB
-                    im = Image.open(response.raw).convert("RGB")
-            except Exception as e:
-                logging.error(f"Error downloading or opening image at index {idx} ({url_link}): {e}")
+            if probe_cache is not None and probe_cache.rejected(url_link):
+                journal.append(idx, REJECTED, stage='probe')
                 continue
+            yield idx, url_link
 
-            try:
-                # Convert image to numpy array and then to grayscale
-                img_np = np.array(im)
-                gray_img = cv2.cvtColor(img_np, cv2.COLOR_RGB2GRAY)
-            except Exception as e:
-                logging.error(f"Error processing image at index {idx}: {e}")
+    results = None
+    try:
+        # Process the remaining rows; downloads and scoring overlap, but results
+        # arrive in order and are journaled as they come in
+        results = iter_scored(
+            pending_items(),
+            patch_size,
+            scale=PYRAMID_SCALE,
+            download_workers=DOWNLOAD_WORKERS,
+            score_workers=SCORE_WORKERS,
+            max_in_flight=MAX_IN_FLIGHT,
+            timeout=DOWNLOAD_TIMEOUT,
+            cache=ImageCache(IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_BYTES) if IMAGE_CACHE_DIR else None,
+            reduced_decode=REDUCED_DECODE,
+        )
+        for result in results:
+            if shutdown_requested:
+                break
+            idx = result['index']
+            current_index = idx  # update current index for error reporting
+
+            if result['stage'] == 'download':
+                logging.error(f"Error downloading or opening image at index {idx} ({result['url']}): {result['error']}")
+                journal.append(idx, ERROR, stage='download', error=result['error'])
                 continue
-
-            try:
-                result_lap = laplacian_variance(gray_img)
-                result_sobel = sobel_variance(gray_img)
-            except Exception as e:
-                logging.error(f"Error in quality checks for image at index {idx}: {e}")
+            if result['stage'] == 'score':
+                logging.error(f"Error processing image at index {idx}: {result['error']}")
+                journal.append(idx, ERROR, stage='score', error=result['error'])
                 continue
 
+            result_lap = result['lap']
+            result_sobel = flat_detection(result['variances'])
+
+            if metrics is not None:
+                metrics.add(result['url'], result_lap, result['variances'], result['width'], result['height'])
+
             logging.info(f"Image {idx} - Laplacian Variance: {result_lap}, Flat detection: {result_sobel}")
 
             # Check quality thresholds and decide acceptance
             if result_lap <= Laplacian_Threshold_low or result_lap >= Laplacian_Threshold_high or result_sobel:
                 logging.info(f"Image {idx} rejected based on quality thresholds.")
+                status = REJECTED
             else:
                 logging.info(f"Image {idx} accepted.")
-                good_rows.append(row)
-
-            # Save checkpoint every CHECKPOINT_INTERVAL images processed
-            if (idx + 1) % CHECKPOINT_INTERVAL == 0:
-                save_checkpoint(idx, good_rows)
+                status = ACCEPTED
+            journal.append(idx, status, lap=float(result_lap), flat=bool(result_sobel))
 
-    except KeyboardInterrupt:
-        logging.info("KeyboardInterrupt caught. Saving current progress...")
-        save_checkpoint(current_index, good_rows)
-        sys.exit(0)
     except Exception as e:
         logging.error(f"Unexpected error at image index {current_index}: {e}")
-        save_checkpoint(current_index, good_rows)
         sys.exit(1)
+    finally:
+        # Whichever way the loop ends (done, error or termination signal): cancel the
+        # queued downloads, then flush the metrics store and the journal
+        if results is not None:
+            results.close()
+        if metrics is not None:
+            metrics.close()
+        journal.close()
+
+    if shutdown_requested:
+        logging.info("Received termination signal. Progress saved, exiting.")
+        sys.exit(0)
 
-    # Final save after processing all images
-    save_checkpoint(current_index, good_rows)
-    logging.info("Processing complete. Final checkpoint saved.")
+    # Compact the accepted rows into the final filtered file
+    num_accepted = journal.compact(df, FILTERED_OUTPUT_FILE)
+    logging.info(f"Processing complete. {num_accepted} accepted images saved to {FILTERED_OUTPUT_FILE}.")
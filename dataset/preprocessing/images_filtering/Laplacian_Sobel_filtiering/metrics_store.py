@@ -0,0 +1,155 @@
+import os
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from quality_metrics import flat_patch_ratio
+
+# Columnar store of every metric the blur filter computes, keyed by URL, so thresholds
+# can be re-tuned offline (rethreshold_metrics.py) without downloading images again.
+#
+# Layout: <store_dir>/part-XXXXX.parquet, one row per scored image:
+#   url, lap, width, height, patch_size, scale (0 = full resolution), flat_ratio at the
+#   flat_threshold used during the run, and the full per-patch Sobel variance map
+#   flattened row-major into a list<double>, so any flat_threshold can be re-applied exactly.
+#
+# Rows are buffered and written as atomic parts of rows_per_part rows. Rows buffered at a
+# crash are lost from the store while their decisions are already in the checkpoint
+# journal, so the blur filter looks them up with missing_urls on resume and scores them
+# again; if a URL is stored more than once the last copy wins when reading.
+
+SCHEMA = pa.schema([
+    ('url', pa.string()),
+    ('lap', pa.float64()),
+    ('width', pa.int32()),
+    ('height', pa.int32()),
+    ('patch_size', pa.int32()),
+    ('scale', pa.int32()),
+    ('flat_ratio', pa.float64()),
+    ('variances', pa.list_(pa.float64())),
+])
+
+
+def _part_files(store_dir):
+    if not os.path.isdir(store_dir):
+        return []
+    return sorted(
+        os.path.join(store_dir, name) for name in os.listdir(store_dir)
+        if name.startswith('part-') and name.endswith('.parquet')
+    )
+
+
+def _part_index(path):
+    return int(os.path.basename(path)[len('part-'):-len('.parquet')])
+
+
+class MetricsStoreWriter:
+    def __init__(self, store_dir, patch_size, scale=None, flat_threshold=None, rows_per_part=100_000):
+        """
+        Args:
+            store_dir (str): Directory holding the parquet parts (created if missing).
+            patch_size (int): Sobel patch size the variances were computed with.
+            scale (int): Pyramid scale of the metrics (None = full resolution).
+            flat_threshold (float): Threshold used for the stored flat_ratio column.
+            rows_per_part (int): Rows buffered before a part is written.
+        """
+        self.store_dir = store_dir
+        self.patch_size = patch_size
+        self.scale = scale or 0
+        self.flat_threshold = flat_threshold
+        self.rows_per_part = rows_per_part
+
+        os.makedirs(store_dir, exist_ok=True)
+        # Continue numbering after the highest existing part (numbering may have gaps,
+        # e.g. after parts were deleted); leftover .tmp files are incomplete parts
+        for name in os.listdir(store_dir):
+            if name.endswith('.tmp'):
+                os.remove(os.path.join(store_dir, name))
+        self.parts = max((_part_index(path) + 1 for path in _part_files(store_dir)), default=0)
+        self.buffer = {name: [] for name in SCHEMA.names}
+
+    def add(self, url, lap, variances, width, height):
+        variances = np.asarray(variances, dtype=np.float64)
+        flat_ratio = None
+        if self.flat_threshold is not None:
+            flat_ratio = float(flat_patch_ratio(variances, self.flat_threshold))
+        row = {
+            'url': url,
+            'lap': float(lap),
+            'width': int(width),
+            'height': int(height),
+            'patch_size': self.patch_size,
+            'scale': self.scale,
+            'flat_ratio': flat_ratio,
+            'variances': variances.ravel().tolist(),
+        }
+        for name, value in row.items():
+            self.buffer[name].append(value)
+        if len(self.buffer['url']) >= self.rows_per_part:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer['url']:
+            return
+        part_path = os.path.join(self.store_dir, f"part-{self.parts:05d}.parquet")
+        tmp_path = f"{part_path}.tmp"
+        pq.write_table(pa.table(self.buffer, schema=SCHEMA), tmp_path)
+        os.replace(tmp_path, part_path)
+        self.parts += 1
+        self.buffer = {name: [] for name in SCHEMA.names}
+
+    def close(self):
+        self.flush()
+
+
+def read_metrics(store_dir, columns=None):
+    """
+    Read the store into a pyarrow Table (one row per URL, last copy wins).
+
+    Args:
+        store_dir (str): Store directory.
+        columns (list): Columns to read (default all); 'url' is always included.
+    """
+    if columns is not None and 'url' not in columns:
+        columns = ['url'] + list(columns)
+    parts = _part_files(store_dir)
+    if not parts:
+        return SCHEMA.empty_table() if columns is None else SCHEMA.empty_table().select(columns)
+    table = pa.concat_tables(pq.read_table(path, columns=columns) for path in parts)
+
+    # Drop earlier duplicates of a URL, keeping the most recently written row
+    urls = table.column('url').to_pandas()
+    keep = ~urls.duplicated(keep='last').to_numpy()
+    if not keep.all():
+        table = table.filter(pa.array(keep))
+    return table
+
+
+def missing_urls(store_dir, urls):
+    """
+    Set of the given URLs that have no row in the store, e.g. rows a killed writer
+    still held in its buffer. Only the url column of each part is read.
+    """
+    candidates = pa.array(list(urls), type=pa.string())
+    found = np.zeros(len(candidates), dtype=bool)
+    for path in _part_files(store_dir):
+        stored = pq.read_table(path, columns=['url']).column('url').combine_chunks()
+        found |= pc.is_in(candidates, value_set=stored).to_numpy(zero_copy_only=False)
+    return set(candidates.filter(pa.array(~found)).to_pylist())
+
+
+def flat_ratios(variances, flat_threshold):
+    """
+    Fraction of patches below flat_threshold for every row of a list<double> column,
+    computed for the whole column at once (0 for images without patches).
+    """
+    if isinstance(variances, pa.ChunkedArray):
+        variances = variances.combine_chunks()
+    lengths = pc.list_value_length(variances).to_numpy(zero_copy_only=False)
+    values = pc.list_flatten(variances).to_numpy(zero_copy_only=False)
+    parents = pc.list_parent_indices(variances).to_numpy(zero_copy_only=False)
+    flat_counts = np.bincount(parents[values < flat_threshold], minlength=len(lengths))
+    return np.divide(flat_counts, lengths, out=np.zeros(len(lengths)), where=lengths > 0)
+
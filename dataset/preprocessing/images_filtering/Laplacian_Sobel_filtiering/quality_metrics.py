@@ -0,0 +1,95 @@
+import cv2
+import numpy as np
+
+
+def reduce_image(image, scale):
+    """
+    Area-average a grayscale image down by an integer factor and return it as float32.
+    scale=1 only converts the dtype.
+    """
+    if scale > 1:
+        height, width = image.shape
+        image = cv2.resize(image, (max(1, width // scale), max(1, height // scale)), interpolation=cv2.INTER_AREA)
+    return image.astype(np.float32, copy=False)
+
+
+def sobel_magnitude(image, ddepth=cv2.CV_64F):
+    # Gradient magnitude from Sobel derivatives in x and y directions
+    sobel_x = cv2.Sobel(image, ddepth, 1, 0, ksize=3)
+    sobel_y = cv2.Sobel(image, ddepth, 0, 1, ksize=3)
+    return cv2.magnitude(sobel_x, sobel_y)
+
+
+def _split(length, patch_size):
+    # (start, stop, number of patches, patch length) for the full patches and the ragged edge
+    full = (length // patch_size) * patch_size
+    parts = []
+    if full > 0:
+        parts.append((0, full, length // patch_size, patch_size))
+    if full < length:
+        parts.append((full, length, 1, length - full))
+    return parts
+
+
+def patch_variances(values, patch_size):
+    """
+    Variance of every non-overlapping patch_size x patch_size patch of a 2D array.
+
+    Patches along the bottom and right edges are smaller when the size is not a
+    multiple of patch_size, exactly like slicing values[i:i + patch_size, j:j + patch_size].
+    The array is split into at most four regions (full patches, right edge, bottom
+    edge, corner); each is viewed as blocks and reduced to per-patch sums and sums
+    of squares in one call, giving var = E[x^2] - E[x]^2.
+
+    Returns:
+        np.ndarray: (ceil(height / patch_size), ceil(width / patch_size)) variance map.
+    """
+    height, width = values.shape
+    rows = _split(height, patch_size)
+    cols = _split(width, patch_size)
+    variances = np.empty((-(-height // patch_size), -(-width // patch_size)), dtype=np.float64)
+
+    row_offset = 0
+    for r0, r1, num_rows, patch_h in rows:
+        col_offset = 0
+        for c0, c1, num_cols, patch_w in cols:
+            blocks = values[r0:r1, c0:c1].reshape(num_rows, patch_h, num_cols, patch_w)
+            count = patch_h * patch_w
+            mean = blocks.sum(axis=3, dtype=np.float64).sum(axis=1) / count
+            mean_sq = np.einsum('ijkl,ijkl->ik', blocks, blocks, dtype=np.float64) / count
+            # Clamp the tiny negative values rounding can produce for constant patches
+            variances[row_offset:row_offset + num_rows, col_offset:col_offset + num_cols] = np.maximum(mean_sq - mean * mean, 0)
+            col_offset += num_cols
+        row_offset += num_rows
+    return variances
+
+
+def sobel_patch_variances(image, patch_size, scale=None):
+    """
+    Per-patch variance map of the Sobel magnitude.
+
+    With scale=None the full-resolution image is processed in float64 as before.
+    With an integer scale (pyramid mode) the image is first reduced by that factor
+    and processed in float32, and the patch size shrinks by the same factor so every
+    patch still covers the same image area. Reduced-scale variances are not on the
+    same scale as full-resolution ones; use thresholds fitted by
+    calibrate_pyramid_thresholds.py.
+    """
+    if scale is None:
+        return patch_variances(sobel_magnitude(image), patch_size)
+    reduced = reduce_image(image, scale)
+    return patch_variances(sobel_magnitude(reduced, cv2.CV_32F), max(1, patch_size // scale))
+
+
+def laplacian_variance(image, scale=None):
+    # Same convention as sobel_patch_variances: scale=None is the original float64 path
+    if scale is None:
+        return cv2.Laplacian(image, cv2.CV_64F).var()
+    return float(cv2.Laplacian(reduce_image(image, scale), cv2.CV_32F).var())
+
+
+def flat_patch_ratio(variances, flat_threshold):
+    # Fraction of patches whose Sobel magnitude variance is below flat_threshold
+    if variances.size == 0:
+        return 0
+    return np.count_nonzero(variances < flat_threshold) / variances.size
@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+import sys
+import time
+
+from metrics_store import read_metrics, flat_ratios
+
+# Re-apply blur/flatness thresholds to the metrics store written by
+# laplacian_blur_sobel_operator_filtering_b.py, without any image I/O.
+#
+# The decision is the one the filter makes: accept when
+#   Laplacian_Threshold_low < lap < Laplacian_Threshold_high
+# and the fraction of patches with variance < flat_threshold is below flat_ratio_cutoff.
+# Thresholds must be on the scale the metrics were computed at (see the 'scale' column).
+
+# === Configuration ===
+METRICS_STORE_DIR = ""  # metrics store directory of the filtering run
+CSV_INPUT_FILE = ""  # optional: original input CSV, to write full rows instead of URLs only
+OUTPUT_FILE = "rethresholded_images.csv"
+
+flat_threshold = 100
+flat_ratio_cutoff = 0.65  # 0.5 in laplacian_blur_sobel_operator_filtering.py
+Laplacian_Threshold_low = 100
+Laplacian_Threshold_high = 10000
+
+if __name__ == "__main__":
+    start = time.perf_counter()
+    metrics = read_metrics(METRICS_STORE_DIR, columns=['lap', 'scale', 'variances'])
+    if metrics.num_rows == 0:
+        print(f"No metrics found in {METRICS_STORE_DIR}.")
+        sys.exit(1)
+
+    scales = np.unique(metrics.column('scale').to_numpy())
+    if len(scales) > 1:
+        print(f"Warning: the store mixes metrics computed at scales {scales.tolist()} (0 = full resolution); "
+              f"one set of thresholds cannot fit all of them.")
+
+    lap = metrics.column('lap').to_numpy()
+    flat_ratio = flat_ratios(metrics.column('variances'), flat_threshold)
+
+    too_blurry = lap <= Laplacian_Threshold_low
+    too_noisy = lap >= Laplacian_Threshold_high
+    too_flat = flat_ratio >= flat_ratio_cutoff
+    accepted = ~(too_blurry | too_noisy | too_flat)
+
+    urls = metrics.column('url').to_pandas()[accepted]
+    if CSV_INPUT_FILE:
+        df = pd.read_csv(CSV_INPUT_FILE, engine="python", dtype=str)
+        df[df['url'].isin(set(urls))].to_csv(OUTPUT_FILE, index=False)
+    else:
+        urls.to_frame().to_csv(OUTPUT_FILE, index=False)
+
+    total = metrics.num_rows
+    print(f"Re-thresholded {total} images in {time.perf_counter() - start:.2f}s:")
+    print(f"  too blurry (lap <= {Laplacian_Threshold_low}): {int(too_blurry.sum())}")
+    print(f"  too noisy (lap >= {Laplacian_Threshold_high}): {int(too_noisy.sum())}")
+    print(f"  too flat (ratio >= {flat_ratio_cutoff} at flat_threshold {flat_threshold}): {int(too_flat.sum())}")
+    print(f"  accepted: {int(accepted.sum())} ({accepted.mean():.2%})")
+    print(f"Accepted images saved to {OUTPUT_FILE}")
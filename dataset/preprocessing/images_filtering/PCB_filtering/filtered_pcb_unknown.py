@@ -1,5 +1,9 @@
 import pandas as pd
 import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from url_index import UrlIndex, url_hashes
 
 # Path to the single CSV file
 csv_file = ''  # Update with the actual path to your input file
@@ -8,6 +12,10 @@ csv_file = ''  # Update with the actual path to your input file
 output_csv_dir = ''  # Update as needed
 os.makedirs(output_csv_dir, exist_ok=True)
 
+# Cross-source URL index shared with the LAION-2B / PD12M pipelines ('' disables it):
+# rows whose URL another source already produced are dropped before anything downloads them
+url_index_file = ''
+
 # Read the entire CSV, preserving all columns
 df = pd.read_csv(csv_file)
 
@@ -21,6 +29,19 @@ df_filtered = df[(df['shot_distance'] != 'unknown') & (df['style'] != 'unknown')
 # Prepare output filename
 base_name = os.path.basename(csv_file)
 base_name_no_ext = os.path.splitext(base_name)[0]
+
+# Drop URLs already in the index (and repeats within this file), then claim the rest
+duplicate_num = 0
+if url_index_file:
+    url_index = UrlIndex(url_index_file)
+    owner = f"pcb/{base_name}"
+    url_index.release(owner)
+    has_url = df_filtered['url'].notna().to_numpy()
+    keep = ~has_url
+    keep[has_url] = url_index.claim(url_hashes(df_filtered['url'][has_url]), owner)
+    duplicate_num = int((~keep).sum())
+    df_filtered = df_filtered[keep]
+    url_index.save()
 output_csv_file = os.path.join(output_csv_dir, f"{base_name_no_ext}_without_unknown.csv")
 
 # Write the filtered DataFrame to a new CSV
@@ -29,10 +50,12 @@ df_filtered.to_csv(output_csv_file, index=False)
 # Print some stats
 total_num = len(df)
 filtered_num = len(df_filtered)
-error_num = total_num - filtered_num
+error_num = total_num - filtered_num - duplicate_num
 
 print(f"Processed {csv_file}")
 print(f"Total rows: {total_num}")
 print(f"Filtered rows: {filtered_num}")
 print(f"Rows removed (unknown shot_distance or style): {error_num}")
+if url_index_file:
+    print(f"Rows removed (URL already indexed): {duplicate_num}")
 print(f"Filtered CSV saved to {output_csv_file}")
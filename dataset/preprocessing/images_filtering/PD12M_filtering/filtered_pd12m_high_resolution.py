@@ -1,59 +1,73 @@
 import pandas as pd
 import os
+import sys
 from glob import glob
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from filter_engine import filter_high_resolution, PD12M_HIGH_RESOLUTION_COLUMNS
+from shard_executor import run_shards, print_summary
+from streaming_writer import CsvStreamWriter, ParquetPartWriter
+
 # Define the directory containing parquet files
 parquet_dir = ''  # Update this to the correct relative path to your parquet files
 output_csv_dir = ''  # Update this to the correct relative path for output
 output_csv = os.path.join(output_csv_dir, '4K_PD12M.csv')
 
-# Ensure the output directory exists
-os.makedirs(output_csv_dir, exist_ok=True)
-
-# Filtering function
-def filter_images(row):
-    w = row['width']
-    h = row['height']
-    url = row['url']
-    caption = row['caption']
-   
-    
-    aspect_ratio = w / h
-    resolution = h * w
-    tested_side = max(h, w)
-    
-    if (
-        (resolution >= 3840 * 2160) and
-        (tested_side >= 3840) and
-        (0.6 <= aspect_ratio <= 1.5)
-    ):
-        return {'width': w, 'height': h, 'url': url, 'caption':caption}
-    else:
-        return None
+# Accepted rows are written out as each shard finishes, so memory stays at one
+# shard and a crash only loses the shards still in flight:
+#   'csv'     - append to output_csv
+#   'parquet' - rolling part-XXXXX.parquet files of rows_per_part rows in output_parts_dir
+#               (each shard is written through to the open part, so the part size
+#               does not affect memory)
+output_format = 'csv'
+output_parts_dir = os.path.join(output_csv_dir, '4K_PD12M_parts')
+rows_per_part = 1_000_000
 
-# List all parquet files in the directory
-parquet_files = glob(os.path.join(parquet_dir, "*.parquet"))
+# Number of worker processes used to filter shards in parallel (1 = sequential)
+num_workers = os.cpu_count()
 
-# Process each parquet file
-filtered_results = []
+# Filtering function (vectorized over the whole shard)
+def filter_images(df):
+    return filter_high_resolution(df, PD12M_HIGH_RESOLUTION_COLUMNS, 'width', 'height')
 
-for file in parquet_files:
-    print(f"Processing {file}...")
+def process_shard(file):
     df = pd.read_parquet(file)
-    
-    # Apply the filtering function to each row
-    filtered = df.apply(filter_images, axis=1)
-    
-    # Drop rows that didn't pass the filter (i.e., `None`)
-    filtered = filtered.dropna().tolist()
-    
-    # Append results
-    filtered_results.extend(filtered)
-
-# Convert results into a DataFrame
-filtered_df = pd.DataFrame(filtered_results)
-
-# Save to CSV
-filtered_df.to_csv(output_csv, index=False)
-
-print(f"Filtered results saved to {output_csv}")
+
+    # Apply the filtering masks to the whole shard at once
+    filtered = filter_images(df)
+    return {'total_num': len(df), 'kept_num': len(filtered)}, filtered
+
+if __name__ == "__main__":
+    # Ensure the output directory exists
+    os.makedirs(output_csv_dir, exist_ok=True)
+
+    if output_format == 'csv':
+        writer = CsvStreamWriter(output_csv)
+    elif output_format == 'parquet':
+        writer = ParquetPartWriter(output_parts_dir, rows_per_part)
+    else:
+        raise ValueError(f"Unknown output_format '{output_format}', expected 'csv' or 'parquet'.")
+
+    # List all parquet files in the directory, skipping shards finished by an earlier run
+    parquet_files = glob(os.path.join(parquet_dir, "*.parquet"))
+    pending_files = [file for file in parquet_files if os.path.abspath(file) not in writer.done]
+    if len(pending_files) < len(parquet_files):
+        print(f"Resuming: {len(parquet_files) - len(pending_files)} shards already written.")
+
+    # Process each parquet file, streaming the accepted rows to disk as shards finish
+    summary = run_shards(
+        process_shard,
+        pending_files,
+        num_workers=num_workers,
+        on_result=writer.write,
+    )
+    # Keep the progress file only when shards failed, so a rerun retries just those
+    writer.close(complete=summary['failed_shards'] == 0)
+    print_summary(summary)
+    if summary['failed_shards']:
+        print(f"{summary['failed_shards']} shards failed; rerun to retry them.")
+
+    if output_format == 'csv':
+        print(f"Filtered results saved to {output_csv}")
+    else:
+        print(f"Filtered results saved to {output_parts_dir}")
@@ -0,0 +1,79 @@
+import pandas as pd
+import os
+import sys
+from glob import glob
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from filter_engine import FILTER_CONFIG
+from curation_pipeline import curate, required_columns, PD12M_PIPELINE, DEFAULT_STAGES
+from shard_executor import run_shards, print_summary
+from shard_manifest import ShardManifest, run_incremental_shards
+from url_index import UrlIndex, ShardUrlDedup
+
+# Fused high_resolution -> error -> unknown pass: each annotated input shard is read
+# once and written once, without the intermediate 4K_PD12M.csv / *_filtered.csv round-trips.
+
+# Define the directory containing annotated input parquet files
+parquet_dir = ''  # Update this if needed
+
+# Define output directory for curated CSV files
+output_csv_dir = ''  # Update as needed
+
+# Stages to run, in order (any subset of 'high_resolution', 'error', 'unknown')
+stages = DEFAULT_STAGES
+
+# Number of worker processes used to filter shards in parallel (1 = sequential)
+num_workers = os.cpu_count()
+
+# Skip shards whose input file and filter configuration are unchanged since the
+# last run (tracked by size, mtime and content hash in the manifest below)
+incremental = True
+manifest_file = os.path.join(output_csv_dir, 'shard_manifest.json')
+
+# Cross-source URL index shared with the other sources' filters ('' disables it): rows
+# whose URL another shard or source already produced are dropped from the outputs as
+# shards finish, before anything downloads them
+url_index_file = ''  # e.g. the same url_index.npz for LAION-2B, PD12M and PCB
+url_index_save_interval = 50  # shards between index saves
+
+def process_shard(file):
+    df = pd.read_parquet(file, columns=required_columns(PD12M_PIPELINE, stages))
+    curated_df, counts = curate(df, PD12M_PIPELINE, stages)
+
+    outputs = []
+    if not curated_df.empty:
+        # Construct a unique output filename based on the input file name
+        base_name = os.path.basename(file)
+        base_name_no_ext = os.path.splitext(base_name)[0]
+        output_csv_file = os.path.join(output_csv_dir, f"{base_name_no_ext}_curated.csv")
+
+        curated_df.to_csv(output_csv_file, index=False)
+        outputs.append(output_csv_file)
+    else:
+        print(f"No results matched the criteria for {file}.")
+    return counts, outputs
+
+if __name__ == "__main__":
+    os.makedirs(output_csv_dir, exist_ok=True)
+
+    # List all parquet files in the directory
+    parquet_files = glob(os.path.join(parquet_dir, "*.parquet"))
+
+    manifest = None
+    if incremental:
+        run_config = dict(FILTER_CONFIG, script=os.path.basename(__file__), output_dir=os.path.abspath(output_csv_dir), stages=list(stages))
+        manifest = ShardManifest(manifest_file, run_config)
+
+    # The manifest is saved together with the index, and both are saved even if a shard fails
+    url_dedup = ShardUrlDedup(UrlIndex(url_index_file), 'pd12m', save_interval=url_index_save_interval,
+                              manifest=manifest) if url_index_file else None
+    try:
+        if incremental:
+            summary = run_incremental_shards(process_shard, parquet_files, manifest, num_workers=num_workers, on_result=url_dedup)
+        else:
+            summary = run_shards(process_shard, parquet_files, num_workers=num_workers, on_result=url_dedup)
+    finally:
+        if url_dedup is not None:
+            url_dedup.close()
+    print_summary(summary)
+    print(f"Curated results saved to {output_csv_dir}")
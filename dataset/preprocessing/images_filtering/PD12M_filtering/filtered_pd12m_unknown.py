@@ -1,5 +1,9 @@
 import pandas as pd
 import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from filter_engine import filter_labels, UNKNOWN_LABELS, UNKNOWN_COLUMNS
 
 # Path to the single CSV file
 csv_file = ''  # Update with the actual path to your input file
@@ -11,48 +15,22 @@ os.makedirs(output_csv_dir, exist_ok=True)
 error_num = 0
 total_num = 0
 
-def filter_images(row):
+def filter_images(df):
     global error_num
     global total_num
-    
-    w = row['width']
-    h = row['height']
-    url = row['url']
-    caption = row['caption']
-    aesthetic = row['aesthetic_score']
-    shot_type = row['shot_type']
-    style = row['style']
-    aespect_ratio = row['aespect_ratio']
-
-    # Check for errors
-    if (shot_type == 'Unknown' or shot_type == 'unknown' or 
-        style == 'Unknown' or style == 'unknown'):
-        error_num += 1
-        total_num += 1
-        return None
-    else:
-        total_num += 1
-        return {
-            'width': w, 
-            'height': h, 
-            'url': url, 
-            'caption': caption,
-            'aesthetic_score': aesthetic, 
-            'shot_type': shot_type, 
-            'style': style,
-            'aespect_ratio': aespect_ratio
-        }
+    filtered_df = filter_labels(df, UNKNOWN_LABELS, UNKNOWN_COLUMNS, 'shot_type')
+    total_num += len(df)
+    error_num += len(df) - len(filtered_df)
+    return filtered_df
 
 print(f"Processing {csv_file}...")
 # Read the CSV file
 df = pd.read_csv(csv_file)
 
-# Apply the filtering function to each row
-filtered = df.apply(filter_images, axis=1).dropna().tolist()
-
-if filtered:
-    filtered_df = pd.DataFrame(filtered)
+# Apply the filtering masks to the whole file at once
+filtered_df = filter_images(df)
 
+if not filtered_df.empty:
     # Construct output filename
     base_name = os.path.basename(csv_file)
     base_name_no_ext = os.path.splitext(base_name)[0]
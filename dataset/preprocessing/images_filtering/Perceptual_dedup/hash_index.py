@@ -0,0 +1,114 @@
+from itertools import combinations
+
+import numpy as np
+
+# Near-duplicate clustering over tens of millions of 64-bit perceptual hashes.
+#
+# Candidates come from block-permutation tables (as in simhash near-duplicate
+# detection): the 64 bits are split into num_blocks blocks, and for every choice of
+# key_blocks of them the hashes are sorted by the bits of the chosen blocks. Two hashes
+# that differ in at most num_blocks - key_blocks bits leave at least key_blocks blocks
+# untouched, so they land in the same bucket of at least one table; pairs up to
+# max_distance apart are found whenever their differing bits fall in at most that many
+# blocks. Wider keys keep buckets small (8 blocks, 3 per key = 24-bit keys). Each
+# table is one argsort of the hashes with their bits permuted so the key blocks come
+# first, and everything is vectorized numpy: O(n log n) per table instead of quadratic.
+#
+# Within a bucket each entry is compared with the next `window` entries in hash
+# order. Buckets no larger than window + 1 are compared exhaustively; in larger ones
+# (e.g. thousands of blank images) neighbours are still linked, which chains equal
+# hashes together.
+#
+# Verified pairs are merged into clusters with connected components (min-label
+# propagation with pointer jumping), and clusters are numbered 0..k-1.
+
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def hamming(a, b):
+    """Element-wise Hamming distance between two uint64 arrays."""
+    x = np.ascontiguousarray(np.bitwise_xor(a, b), dtype=np.uint64)
+    if hasattr(np, 'bitwise_count'):  # numpy >= 2.0
+        return np.bitwise_count(x)
+    return _POPCOUNT[x.view(np.uint8).reshape(-1, 8)].sum(axis=1)
+
+
+def tables(num_blocks=8, key_blocks=3, bits=64):
+    """
+    (block order, key bits) of every table: the (lo, width) blocks with the key_blocks
+    chosen ones first, and the number of bits they span.
+    """
+    edges = np.linspace(0, bits, num_blocks + 1).round().astype(int)
+    blocks = [(int(lo), int(hi - lo)) for lo, hi in zip(edges[:-1], edges[1:])]
+    layouts = []
+    for chosen in combinations(range(num_blocks), key_blocks):
+        order = [blocks[i] for i in chosen] + [block for i, block in enumerate(blocks) if i not in chosen]
+        layouts.append((order, sum(blocks[i][1] for i in chosen)))
+    return layouts
+
+
+def permute_bits(hashes, block_order, bits=64):
+    # Move the blocks to the given order, first block in the most significant bits
+    permuted = np.zeros_like(hashes)
+    position = bits
+    for lo, width in block_order:
+        position -= width
+        block = (hashes >> np.uint64(lo)) & np.uint64((1 << width) - 1)
+        permuted |= block << np.uint64(position)
+    return permuted
+
+
+def near_duplicate_pairs(hashes, max_distance, num_blocks=8, key_blocks=3, window=64, verify=None):
+    """
+    Index pairs (left, right) of entries whose hashes differ in at most max_distance bits.
+
+    Args:
+        hashes (np.ndarray): uint64 hashes the tables are built on.
+        max_distance (int): Hamming threshold of the verification.
+        num_blocks / key_blocks (int): Table layout; every pair within
+                                       num_blocks - key_blocks bits is found.
+        window (int): Bucket neighbours each entry is compared with.
+        verify (list): Optional (other_hashes, other_max_distance) pairs a candidate
+                       must also satisfy (e.g. the dHash of the same images).
+    """
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    lefts, rights = [], []
+    for block_order, key_bits in tables(num_blocks, key_blocks):
+        permuted = permute_bits(hashes, block_order)
+        order = np.argsort(permuted)
+        sorted_keys = permuted[order] >> np.uint64(64 - key_bits)
+        # Positions whose bucket continues at position + offset; shrinks as offset grows
+        active = np.flatnonzero(sorted_keys[:-1] == sorted_keys[1:])
+        for offset in range(1, window + 1):
+            if offset > 1:
+                active = active[active + offset < len(order)]
+                active = active[sorted_keys[active] == sorted_keys[active + offset]]
+            if not len(active):
+                break  # no bucket has more than `offset` entries
+            left, right = order[active], order[active + offset]
+            ok = hamming(hashes[left], hashes[right]) <= max_distance
+            for other, other_max in verify or []:
+                ok &= hamming(other[left], other[right]) <= other_max
+            lefts.append(left[ok])
+            rights.append(right[ok])
+    if not lefts:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(lefts), np.concatenate(rights)
+
+
+def cluster_ids(n, left, right):
+    """Cluster id (0..k-1, in order of first member) of each of n entries, given linked pairs."""
+    labels = np.arange(n)
+    while len(left):
+        low = np.minimum(labels[left], labels[right])
+        updated = labels.copy()
+        np.minimum.at(updated, left, low)
+        np.minimum.at(updated, right, low)
+        updated = updated[updated]  # pointer jumping: adopt the label's own label
+        if np.array_equal(updated, labels):
+            break
+        labels = updated
+    # Labels are the smallest member index of each component, so this numbering
+    # follows the order of each cluster's first member
+    _, ids = np.unique(labels, return_inverse=True)
+    return ids
@@ -0,0 +1,188 @@
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from perceptual_hash import hash_image
+from hash_index import near_duplicate_pairs, cluster_ids
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from image_cache import ImageCache
+from http_session import make_session
+
+# Near-duplicate removal across the LAION-2B, PD12M and PCB candidate lists, run before
+# the blur filter and Q-Align scoring so each duplicated stock photo only goes through
+# the expensive stages once.
+#
+#   1. Every distinct URL is downloaded (or read from the shared image cache) and
+#      hashed from a 1/8-size decode; hashes are appended to HASH_FILE in chunks, so an
+#      interrupted run resumes where it stopped. Failed downloads are recorded too but
+#      hashed again on the next run (the last row of a URL wins).
+#   2. Images whose pHash and dHash are both within the thresholds are linked and
+#      grouped into clusters (see hash_index.py). The largest image of each cluster
+#      (ties: earlier source in INPUT_FILES, then input order) is its representative.
+#   3. CLUSTERS_FILE lists every URL with its cluster id, and OUTPUT_DIR gets one CSV
+#      per source holding only the rows of representatives. Images that could not be
+#      hashed are kept as single-image clusters.
+
+# === Configuration ===
+INPUT_FILES = {  # source name -> candidate CSV with a URL column
+    'laion2b': '',  # Update with the actual paths to your candidate files
+    'pd12m': '',
+    'pcb': '',
+}
+URL_COLUMN = 'url'
+OUTPUT_DIR = ''  # Update as needed; gets <input name>_dedup.csv per source
+HASH_FILE = "perceptual_hashes.csv"
+CLUSTERS_FILE = "dedup_clusters.csv"
+
+# Two images are near-duplicates when both hash distances are within these (of 64 bits)
+PHASH_MAX_DISTANCE = 6
+DHASH_MAX_DISTANCE = 10
+# Index layout (see hash_index.py): pairs within NUM_BLOCKS - KEY_BLOCKS bits are always
+# found, farther ones up to PHASH_MAX_DISTANCE when their differing bits are clustered
+NUM_BLOCKS = 8
+KEY_BLOCKS = 3
+NEIGHBOR_WINDOW = 64  # bucket neighbours compared per entry
+
+DOWNLOAD_WORKERS = 32
+DOWNLOAD_TIMEOUT = 10
+CHUNK_SIZE = 10_000  # URLs hashed between appends to HASH_FILE
+
+# Shared on-disk image cache (same directory as the blur filter / Q-Align, "" disables it)
+IMAGE_CACHE_DIR = ""
+IMAGE_CACHE_MAX_BYTES = 500 * 1024 ** 3
+
+HASH_COLUMNS = ['url', 'source', 'phash', 'dhash', 'width', 'height', 'error']
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def load_hashes(path):
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=HASH_COLUMNS)
+    return pd.read_csv(path, dtype={'url': str, 'source': str, 'phash': 'uint64', 'dhash': 'uint64',
+                                    'error': str})
+
+def settled_urls(hashes):
+    # URLs hashed successfully; the ones whose download or decode failed are retried
+    return set(hashes.loc[hashes['error'].fillna('') == '', 'url'])
+
+def pending_urls(url_source, hashes):
+    # (url, source) pairs still to hash, in source order
+    hashed = settled_urls(hashes)
+    return [(url, source) for url, source in url_source.items() if url not in hashed]
+
+def download(session, url):
+    with session.get(url, timeout=DOWNLOAD_TIMEOUT) as response:
+        response.raise_for_status()
+        return response.content
+
+def hash_url(url, session, cache):
+    try:
+        if cache is not None:
+            source = cache.path(url)
+            if source is None:
+                source = cache.fetch(url, lambda u: download(session, u))
+        else:
+            source = download(session, url)
+        result = hash_image(source)
+        result.update(url=url, error='')
+    except Exception as e:
+        result = {'url': url, 'phash': np.uint64(0), 'dhash': np.uint64(0), 'width': 0, 'height': 0,
+                  'error': str(e) or type(e).__name__}
+    return result
+
+def hash_pending(pending):
+    # pending: (url, source) pairs not in HASH_FILE yet
+    session = make_session(DOWNLOAD_WORKERS)
+    cache = ImageCache(IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_BYTES) if IMAGE_CACHE_DIR else None
+    write_header = not os.path.exists(HASH_FILE)
+    with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as pool:
+        for start in range(0, len(pending), CHUNK_SIZE):
+            chunk = pending[start:start + CHUNK_SIZE]
+            rows = list(pool.map(lambda url: hash_url(url, session, cache), [url for url, _ in chunk]))
+            for row, (_, source) in zip(rows, chunk):
+                row['source'] = source
+            pd.DataFrame(rows, columns=HASH_COLUMNS).to_csv(HASH_FILE, mode='a', header=write_header, index=False)
+            write_header = False
+            errors = sum(bool(row['error']) for row in rows)
+            logging.info(f"Hashed {start + len(chunk)}/{len(pending)} images ({errors} errors in this chunk)")
+
+if __name__ == "__main__":
+    sources = {name: path for name, path in INPUT_FILES.items() if path}
+    if not sources:
+        logging.error("No input files configured.")
+        sys.exit(1)
+    try:
+        inputs = {name: pd.read_csv(path, dtype=str) for name, path in sources.items()}
+    except Exception as e:
+        logging.error(f"Error reading input CSV files: {e}")
+        sys.exit(1)
+
+    # Distinct URLs in source order; a URL listed by several sources belongs to the first
+    url_source = {}
+    for name, df in inputs.items():
+        for url in df[URL_COLUMN].dropna():
+            url_source.setdefault(url, name)
+
+    # 1. Hash every URL not hashed by an earlier run (or that failed in it)
+    pending = pending_urls(url_source, load_hashes(HASH_FILE))
+    logging.info(f"{len(url_source)} distinct URLs, {len(url_source) - len(pending)} already hashed.")
+    try:
+        hash_pending(pending)
+    except KeyboardInterrupt:
+        logging.info("KeyboardInterrupt caught. Hashes so far are saved; rerun to resume.")
+        sys.exit(0)
+
+    # 2. Cluster near-duplicates
+    hashes = load_hashes(HASH_FILE).drop_duplicates('url', keep='last')
+    hashes = hashes[hashes['url'].isin(url_source)].copy()
+    source_rank = {name: rank for rank, name in enumerate(INPUT_FILES)}
+    hashes['order'] = hashes['url'].map({url: i for i, url in enumerate(url_source)})
+    hashes['source'] = hashes['url'].map(url_source)
+    hashes = hashes.sort_values('order').reset_index(drop=True)
+
+    ok = hashes['error'].fillna('') == ''
+    hashed_rows = np.flatnonzero(ok.to_numpy())
+    left, right = near_duplicate_pairs(
+        hashes['phash'].to_numpy()[hashed_rows], PHASH_MAX_DISTANCE, num_blocks=NUM_BLOCKS, key_blocks=KEY_BLOCKS,
+        window=NEIGHBOR_WINDOW,
+        verify=[(hashes['dhash'].to_numpy()[hashed_rows], DHASH_MAX_DISTANCE)])
+    ids = cluster_ids(len(hashed_rows), left, right)
+
+    # Failed images become single-image clusters after the real ones
+    cluster = np.empty(len(hashes), dtype=np.int64)
+    cluster[hashed_rows] = ids
+    num_failed = len(hashes) - len(hashed_rows)
+    cluster[np.flatnonzero(~ok.to_numpy())] = np.arange(num_failed) + (ids.max() + 1 if len(ids) else 0)
+    hashes['cluster_id'] = cluster
+
+    # Representative: largest image, then earlier source, then input order
+    hashes['pixels'] = hashes['width'].astype(np.int64) * hashes['height'].astype(np.int64)
+    hashes['source_rank'] = hashes['source'].map(source_rank)
+    ranked = hashes.sort_values(['cluster_id', 'pixels', 'source_rank', 'order'],
+                                ascending=[True, False, True, True])
+    representatives = set(ranked.drop_duplicates('cluster_id')['url'])
+    hashes['cluster_size'] = hashes.groupby('cluster_id')['url'].transform('size')
+    hashes['representative'] = hashes['url'].isin(representatives)
+    hashes[['url', 'source', 'cluster_id', 'cluster_size', 'representative', 'phash', 'dhash',
+            'width', 'height', 'error']].to_csv(CLUSTERS_FILE, index=False)
+
+    num_clusters = hashes['cluster_id'].nunique()
+    logging.info(f"{len(hashes)} images in {num_clusters} clusters "
+                 f"({len(hashes) - num_clusters} near-duplicates, {num_failed} could not be hashed); "
+                 f"clusters saved to {CLUSTERS_FILE}")
+
+    # 3. Keep the representatives' rows in each source file
+    os.makedirs(OUTPUT_DIR or '.', exist_ok=True)
+    for name, df in inputs.items():
+        keep = df[URL_COLUMN].map(lambda url: url in representatives and url_source[url] == name)
+        # Also drop repeated rows of the same URL within a source
+        kept = df[keep.fillna(False).astype(bool)].drop_duplicates(URL_COLUMN)
+        base_name = os.path.splitext(os.path.basename(sources[name]))[0]
+        output_path = os.path.join(OUTPUT_DIR, f"{base_name}_dedup.csv")
+        kept.to_csv(output_path, index=False)
+        logging.info(f"{name}: kept {len(kept)}/{len(df)} rows; saved to {output_path}")
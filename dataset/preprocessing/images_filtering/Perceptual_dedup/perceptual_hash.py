@@ -0,0 +1,46 @@
+import os
+import sys
+
+import cv2
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from image_decode import decode_gray, image_size
+
+# 64-bit perceptual hashes of an image's grayscale content:
+#   * pHash: sign of the 8x8 lowest DCT frequencies of a 32x32 thumbnail against their
+#     median (robust to rescaling, recompression and small color changes),
+#   * dHash: sign of the horizontal gradient of a 9x8 thumbnail.
+# Both only look at a 32x32 thumbnail, so images are decoded at 1/8 size (JPEGs in the
+# DCT domain), which is far cheaper than a full 4K decode and gives the same hashes up
+# to a bit or two.
+
+HASH_REDUCTION = 8
+
+
+def _pack(bits):
+    # 64 booleans -> unsigned 64-bit integer (first bit is the most significant)
+    return np.uint64(int.from_bytes(np.packbits(bits).tobytes(), 'big'))
+
+
+def phash(gray):
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8].flatten()
+    return _pack(low > np.median(low))
+
+
+def dhash(gray):
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA).astype(np.int16)
+    return _pack((small[:, 1:] > small[:, :-1]).flatten())
+
+
+def hash_image(source, reduction=HASH_REDUCTION):
+    """
+    Hash `source` (image bytes or a local file path).
+
+    Returns:
+        dict: 'phash' and 'dhash' (numpy uint64) and the full-resolution 'width' and 'height'.
+    """
+    gray = decode_gray(source, reduction)
+    width, height = image_size(source)
+    return {'phash': phash(gray), 'dhash': dhash(gray), 'width': width, 'height': height}
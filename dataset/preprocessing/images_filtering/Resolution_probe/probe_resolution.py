@@ -0,0 +1,119 @@
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from glob import glob
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from filter_engine import high_resolution_mask
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from resolution_probe import probe_url, ProbeCache, OK, UNPARSED, ERROR
+from http_session import make_session
+
+# Resolution probe between the metadata filters and the download stages: the
+# WIDTH/HEIGHT metadata the high-resolution filter trusts is stale for part of the
+# URLs, so the real dimensions are read from the first KB of every image (HTTP Range
+# request + JPEG/PNG/WebP header parse, see resolution_probe.py) and images below the
+# 4K cutoff of filter_engine are dropped before anything downloads them in full.
+#
+# Results are appended to probe_cache_file, so reruns only probe new URLs and URLs
+# whose request failed (timeouts, server errors), and the blur filter and Q-Align
+# scoring skip URLs the cache marks as rejected.
+
+# Curated outputs of the metadata filters (parquet or CSV, glob pattern)
+input_files = ''  # Update with the actual path / pattern of your input files
+
+# Output directory for the probed files (<input name>_probed.<ext>)
+output_dir = ''  # Update as needed
+
+url_column = 'url'
+probe_cache_file = 'resolution_probe.jsonl'
+
+# Bytes requested first, doubled up to max_probe_bytes while the header is incomplete
+probe_bytes = 16 * 1024
+max_probe_bytes = 256 * 1024
+probe_workers = 64
+probe_timeout = 10
+chunk_size = 10_000  # URLs probed between cache appends
+
+# Rows whose probe could not decide: keep images with an unparsed header (e.g. GIF,
+# AVIF), drop ones whose request failed (the full download would fail as well)
+keep_unparsed = True
+keep_errors = False
+
+def read_table(path):
+    return pd.read_parquet(path) if path.endswith('.parquet') else pd.read_csv(path, dtype=str, keep_default_na=False)
+
+def write_table(df, path):
+    if path.endswith('.parquet'):
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+
+def probe_pending(urls, cache, pool, session):
+    for start in range(0, len(urls), chunk_size):
+        chunk = urls[start:start + chunk_size]
+        records = list(pool.map(
+            lambda url: probe_url(session, url, probe_bytes, max_probe_bytes, probe_timeout), chunk))
+        ok = np.array([record['status'] == OK for record in records])
+        widths = np.array([record['width'] if record['status'] == OK else np.nan for record in records], dtype=np.float64)
+        heights = np.array([record['height'] if record['status'] == OK else np.nan for record in records], dtype=np.float64)
+        passed = high_resolution_mask(widths, heights)
+        for record, record_ok, record_passed in zip(records, ok, passed):
+            record['passed'] = bool(record_passed) if record_ok else None
+        cache.add(records)
+        print(f"  probed {start + len(chunk)}/{len(urls)} URLs")
+
+if __name__ == "__main__":
+    os.makedirs(output_dir, exist_ok=True)
+    files = sorted(glob(input_files))
+    if not files:
+        print(f"No input files match {input_files}.")
+        sys.exit(1)
+
+    cache = ProbeCache(probe_cache_file)
+    session = make_session(probe_workers)
+    totals = {'rows': 0, 'kept': 0, 'passed': 0, 'too_small': 0, UNPARSED: 0, ERROR: 0}
+    try:
+        with ThreadPoolExecutor(max_workers=probe_workers) as pool:
+            for file in files:
+                df = read_table(file)
+                urls = df[url_column].dropna().unique().tolist()
+                pending = [url for url in urls if url and not cache.settled(url)]
+                print(f"{os.path.basename(file)}: {len(df)} rows, {len(pending)} URLs to probe")
+                probe_pending(pending, cache, pool, session)
+
+                records = [cache.get(url) or {'status': ERROR, 'passed': None} for url in df[url_column]]
+                status = np.array([record['status'] for record in records])
+                passed = np.array([record.get('passed') is True for record in records])
+                keep = passed | ((status == UNPARSED) & keep_unparsed) | ((status == ERROR) & keep_errors)
+                df['probed_width'] = pd.array([record.get('width') for record in records], dtype='Int64')
+                df['probed_height'] = pd.array([record.get('height') for record in records], dtype='Int64')
+                df['probed_format'] = [record.get('format') for record in records]
+
+                base_name, ext = os.path.splitext(os.path.basename(file))
+                output_file = os.path.join(output_dir, f"{base_name}_probed{ext}")
+                write_table(df[keep], output_file)
+
+                too_small = int(((status == OK) & ~passed).sum())
+                print(f"  kept {int(keep.sum())}/{len(df)}: {int(passed.sum())} passed, {too_small} below 4K, "
+                      f"{int((status == UNPARSED).sum())} unparsed, {int((status == ERROR).sum())} errors; "
+                      f"saved to {output_file}")
+                totals['rows'] += len(df)
+                totals['kept'] += int(keep.sum())
+                totals['passed'] += int(passed.sum())
+                totals['too_small'] += too_small
+                totals[UNPARSED] += int((status == UNPARSED).sum())
+                totals[ERROR] += int((status == ERROR).sum())
+    except KeyboardInterrupt:
+        print("KeyboardInterrupt caught. Probe results so far are cached; rerun to resume.")
+        sys.exit(0)
+    finally:
+        cache.close()
+
+    print("Run summary:")
+    for key, value in totals.items():
+        print(f"  {key}: {value}")
@@ -0,0 +1,88 @@
+import numpy as np
+
+from filter_engine import (
+    high_resolution_mask,
+    label_mask,
+    select_columns,
+    ERROR_LABELS,
+    UNKNOWN_LABELS,
+)
+
+# Stages of the high_resolution -> error -> unknown chain, in the order the
+# standalone scripts run them. Each computes a keep-mask over the raw shard.
+STAGES = {
+    'high_resolution': lambda df, cfg: high_resolution_mask(df[cfg['width_col']], df[cfg['height_col']]),
+    'error': lambda df, cfg: label_mask(df[cfg['shot_col']], df[cfg['style_col']], ERROR_LABELS),
+    'unknown': lambda df, cfg: label_mask(df[cfg['shot_col']], df[cfg['style_col']], UNKNOWN_LABELS),
+}
+DEFAULT_STAGES = ('high_resolution', 'error', 'unknown')
+
+# The fused pipelines read annotated shards (raw metadata plus the shot_distance/style
+# labels) and emit the same columns as the last script of the chain.
+LAION_PIPELINE = {
+    'width_col': 'WIDTH',
+    'height_col': 'HEIGHT',
+    'shot_col': 'shot_distance',
+    'style_col': 'style',
+    'columns': {
+        'width': 'WIDTH',
+        'height': 'HEIGHT',
+        'url': 'URL',
+        'caption': 'TEXT',
+        'aesthetic_score': 'aesthetic',
+        'shot_type': 'shot_distance',
+        'style': 'style',
+    },
+}
+PD12M_PIPELINE = {
+    'width_col': 'width',
+    'height_col': 'height',
+    'shot_col': 'shot_distance',
+    'style_col': 'style',
+    'columns': {
+        'width': 'width',
+        'height': 'height',
+        'url': 'url',
+        'caption': 'caption',
+        'aesthetic_score': 'aesthetic_score',
+        'shot_type': 'shot_distance',
+        'style': 'style',
+    },
+}
+
+
+def required_columns(config, stages=DEFAULT_STAGES):
+    # Input columns the pipeline touches, so shards can be read with column projection
+    needed = list(config['columns'].values())
+    if 'high_resolution' in stages:
+        needed += [config['width_col'], config['height_col']]
+    if 'error' in stages or 'unknown' in stages:
+        needed += [config['shot_col'], config['style_col']]
+    return list(dict.fromkeys(needed))
+
+
+def curate(df, config, stages=DEFAULT_STAGES):
+    """
+    Run the chained filter stages over one shard in memory.
+
+    Args:
+        df (pd.DataFrame): Raw annotated shard.
+        config (dict): LAION_PIPELINE or PD12M_PIPELINE style column configuration.
+        stages (tuple): Stage names from STAGES, applied in order.
+
+    Returns:
+        tuple: (curated DataFrame, counts) where counts holds 'total_num', 'kept_num'
+               and '<stage>_rejected' for every stage. A row is counted against the
+               first stage that rejects it, as it would be in the chained scripts.
+    """
+    keep = np.ones(len(df), dtype=bool)
+    counts = {'total_num': len(df)}
+    for name in stages:
+        stage_keep = STAGES[name](df, config)
+        counts[f'{name}_rejected'] = int(np.count_nonzero(keep & ~stage_keep))
+        keep &= stage_keep
+
+    curated = select_columns(df, keep, config['columns'])
+    curated['aespect_ratio'] = curated['width'] / curated['height']
+    counts['kept_num'] = len(curated)
+    return curated, counts
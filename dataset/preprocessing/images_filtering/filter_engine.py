@@ -0,0 +1,123 @@
+import numpy as np
+import pandas as pd
+
+# Thresholds shared by the LAION-2B and PD12M metadata filters
+MIN_RESOLUTION = 3840 * 2160
+MIN_LONG_SIDE = 3840
+MIN_ASPECT_RATIO = 0.6
+MAX_ASPECT_RATIO = 1.5
+
+# Labels rejected by the *_error and *_unknown filters (matched exactly, like the original scripts)
+ERROR_LABELS = ('Error', 'error')
+UNKNOWN_LABELS = ('Unknown', 'unknown')
+
+# Everything that changes which rows the filters keep, recorded in run manifests
+FILTER_CONFIG = {
+    'min_resolution': MIN_RESOLUTION,
+    'min_long_side': MIN_LONG_SIDE,
+    'aspect_ratio_range': [MIN_ASPECT_RATIO, MAX_ASPECT_RATIO],
+    'error_labels': list(ERROR_LABELS),
+    'unknown_labels': list(UNKNOWN_LABELS),
+}
+
+# Output column -> input column, in the order the original scripts emitted them
+LAION_HIGH_RESOLUTION_COLUMNS = {
+    'width': 'WIDTH',
+    'height': 'HEIGHT',
+    'url': 'URL',
+    'caption': 'TEXT',
+    'aesthetic_score': 'aesthetic',
+}
+PD12M_HIGH_RESOLUTION_COLUMNS = {
+    'width': 'width',
+    'height': 'height',
+    'url': 'url',
+    'caption': 'caption',
+}
+# The error filters read 'shot_distance' and write it back out as 'shot_type'
+ERROR_COLUMNS = {
+    'width': 'width',
+    'height': 'height',
+    'url': 'url',
+    'caption': 'caption',
+    'aesthetic_score': 'aesthetic_score',
+    'shot_type': 'shot_distance',
+    'style': 'style',
+}
+UNKNOWN_COLUMNS = {
+    'width': 'width',
+    'height': 'height',
+    'url': 'url',
+    'caption': 'caption',
+    'aesthetic_score': 'aesthetic_score',
+    'shot_type': 'shot_type',
+    'style': 'style',
+    'aespect_ratio': 'aespect_ratio',
+}
+
+
+def _as_float(values):
+    # Works for pandas Series, NumPy arrays and pyarrow (Chunked)Arrays; nulls become NaN
+    return np.asarray(values, dtype=np.float64)
+
+
+def _isin(values, labels):
+    if not isinstance(values, pd.Series):
+        values = pd.Series(np.asarray(values, dtype=object))
+    return values.isin(labels).to_numpy()
+
+
+def high_resolution_mask(width, height):
+    """
+    Boolean mask of rows that are at least 4K (3840x2160 pixels, long side >= 3840)
+    with an aspect ratio between 0.6 and 1.5. Rows with missing or zero dimensions fail.
+    """
+    w = _as_float(width)
+    h = _as_float(height)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        aspect_ratio = w / h
+    return (
+        (w * h >= MIN_RESOLUTION) &
+        (np.maximum(w, h) >= MIN_LONG_SIDE) &
+        (aspect_ratio >= MIN_ASPECT_RATIO) &
+        (aspect_ratio <= MAX_ASPECT_RATIO)
+    )
+
+
+def label_mask(shot_type, style, labels):
+    # True for rows to keep, i.e. neither label column holds one of `labels`
+    return ~(_isin(shot_type, labels) | _isin(style, labels))
+
+
+def select_columns(df, mask, columns):
+    """
+    Keep the rows of `df` selected by `mask` and rename them according to `columns`
+    (an output -> input column mapping), returning a fresh zero-based DataFrame.
+    """
+    selected = df.loc[mask, list(columns.values())]
+    selected.columns = list(columns.keys())
+    return selected.reset_index(drop=True)
+
+
+def filter_high_resolution(df, columns, width_col, height_col):
+    mask = high_resolution_mask(df[width_col], df[height_col])
+    return select_columns(df, mask, columns)
+
+
+def filter_labels(df, labels, columns, shot_col, style_col='style', add_aspect_ratio=False):
+    """
+    Drop rows whose shot type or style is one of `labels`.
+
+    Args:
+        df (pd.DataFrame): Input rows.
+        labels (tuple): Label values to reject, e.g. ERROR_LABELS or UNKNOWN_LABELS.
+        columns (dict): Output -> input column mapping for the kept rows.
+        shot_col (str): Input column holding the shot type/distance label.
+        style_col (str): Input column holding the style label.
+        add_aspect_ratio (bool): Append an 'aespect_ratio' column computed as width / height.
+    """
+    mask = label_mask(df[shot_col], df[style_col], labels)
+    filtered = select_columns(df, mask, columns)
+    if add_aspect_ratio:
+        filtered['aespect_ratio'] = filtered['width'] / filtered['height']
+    return filtered
@@ -0,0 +1,123 @@
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from filter_engine import (
+    high_resolution_mask,
+    MIN_RESOLUTION,
+    MIN_LONG_SIDE,
+    MIN_ASPECT_RATIO,
+    MAX_ASPECT_RATIO,
+)
+
+
+def _column_range(row_group, name):
+    # (min, max) from the row group statistics, or None when they are missing
+    for j in range(row_group.num_columns):
+        column = row_group.column(j)
+        if column.path_in_schema != name:
+            continue
+        stats = column.statistics
+        if stats is None or not stats.has_min_max:
+            return None
+        return stats.min, stats.max
+    return None
+
+
+def row_group_may_pass(row_group, width_col, height_col):
+    """
+    Use the min/max statistics of a row group to decide whether any of its rows
+    could pass the high resolution filter. Returns True when statistics are missing.
+    """
+    width_range = _column_range(row_group, width_col)
+    height_range = _column_range(row_group, height_col)
+    if width_range is None or height_range is None:
+        return True
+    min_w, max_w = width_range
+    min_h, max_h = height_range
+
+    if max_w * max_h < MIN_RESOLUTION:
+        return False
+    if max(max_w, max_h) < MIN_LONG_SIDE:
+        return False
+    # Widest and narrowest aspect ratios any row in this group can have
+    if min_h > 0 and max_w / min_h < MIN_ASPECT_RATIO:
+        return False
+    if max_h > 0 and min_w / max_h > MAX_ASPECT_RATIO:
+        return False
+    return True
+
+
+def iter_high_resolution_batches(path, columns, width_col, height_col, stats=None):
+    """
+    Stream a parquet shard row group by row group and yield the rows passing the
+    high resolution filter as pyarrow Tables renamed according to `columns`.
+
+    Only the width/height columns are decoded for every row group; the remaining
+    columns are read only for row groups with at least one passing row, and row
+    groups whose statistics rule them out are skipped without decoding anything.
+    Peak memory is therefore one row group, independent of the shard size.
+
+    Args:
+        path (str): Parquet shard to read.
+        columns (dict): Output -> input column mapping (see filter_engine).
+        width_col (str): Input column holding the image width.
+        height_col (str): Input column holding the image height.
+        stats (dict): Optional dict updated with 'rows', 'kept', 'row_groups'
+                      and 'skipped_row_groups' counters.
+    """
+    if stats is None:
+        stats = {}
+    for key in ('rows', 'kept', 'row_groups', 'skipped_row_groups'):
+        stats.setdefault(key, 0)
+
+    parquet_file = pq.ParquetFile(path)
+    payload_cols = [c for c in columns.values() if c not in (width_col, height_col)]
+
+    for i in range(parquet_file.num_row_groups):
+        row_group = parquet_file.metadata.row_group(i)
+        stats['row_groups'] += 1
+        stats['rows'] += row_group.num_rows
+
+        if not row_group_may_pass(row_group, width_col, height_col):
+            stats['skipped_row_groups'] += 1
+            continue
+
+        dims = parquet_file.read_row_group(i, columns=[width_col, height_col])
+        mask = high_resolution_mask(dims.column(width_col), dims.column(height_col))
+        if not mask.any():
+            continue
+        mask = pa.array(mask)
+
+        dims = dims.filter(mask)
+        payload = parquet_file.read_row_group(i, columns=payload_cols).filter(mask)
+
+        arrays = []
+        for input_col in columns.values():
+            source = dims if input_col in (width_col, height_col) else payload
+            arrays.append(source.column(input_col))
+        batch = pa.table(arrays, names=list(columns.keys()))
+
+        stats['kept'] += batch.num_rows
+        yield batch
+
+
+def write_batches(batches, output_path):
+    """
+    Write an iterable of pyarrow Tables to a single parquet file as they arrive.
+    The file is only created once the first non-empty batch shows up.
+    Returns the number of rows written.
+    """
+    writer = None
+    written = 0
+    try:
+        for batch in batches:
+            if batch.num_rows == 0:
+                continue
+            if writer is None:
+                writer = pq.ParquetWriter(output_path, batch.schema)
+            writer.write_table(batch.cast(writer.schema))
+            written += batch.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+    return written
@@ -0,0 +1,76 @@
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+
+def _format_counts(counts):
+    return ", ".join(f"{key}={value}" for key, value in counts.items())
+
+
+def run_shards(process_shard, files, num_workers=None, on_result=None):
+    """
+    Fan shards out across a process pool and merge the per-shard counters.
+
+    Counters are returned by the workers instead of being kept in module globals,
+    which are private to each worker process and would silently stay at zero in
+    the parent.
+
+    Args:
+        process_shard (callable): Top-level (picklable) function taking a shard path
+                                  and returning a (counts, result) tuple, where
+                                  counts is a dict of integers.
+        files (list): Shard paths to process.
+        num_workers (int): Worker processes to use. Defaults to os.cpu_count();
+                           1 runs every shard inline in the current process.
+        on_result (callable): Optional on_result(file, result) called in the parent
+                              process for every finished shard.
+
+    Returns:
+        Counter: Counters summed over all shards, plus 'shards' and 'failed_shards'.
+    """
+    if num_workers is None:
+        num_workers = os.cpu_count() or 1
+    num_workers = max(1, min(num_workers, len(files)))
+
+    summary = Counter(shards=0, failed_shards=0)
+    start = time.time()
+
+    def collect(done, file, outcome):
+        counts, result = outcome
+        summary.update(counts)
+        summary['shards'] += 1
+        if on_result is not None:
+            on_result(file, result)
+        elapsed = time.time() - start
+        print(f"[{done}/{len(files)}] {os.path.basename(file)}: {_format_counts(counts)} ({elapsed:.1f}s elapsed)")
+
+    if num_workers == 1:
+        for done, file in enumerate(files, start=1):
+            try:
+                outcome = process_shard(file)
+            except Exception as e:
+                print(f"[{done}/{len(files)}] Error processing {file}: {e}")
+                summary['failed_shards'] += 1
+                continue
+            collect(done, file, outcome)
+        return summary
+
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        futures = {executor.submit(process_shard, file): file for file in files}
+        for done, future in enumerate(as_completed(futures), start=1):
+            file = futures[future]
+            try:
+                outcome = future.result()
+            except Exception as e:
+                print(f"[{done}/{len(files)}] Error processing {file}: {e}")
+                summary['failed_shards'] += 1
+                continue
+            collect(done, file, outcome)
+    return summary
+
+
+def print_summary(summary):
+    print("Run summary:")
+    for key, value in summary.items():
+        print(f"  {key}: {value}")
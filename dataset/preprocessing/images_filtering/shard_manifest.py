@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+
+from shard_executor import run_shards
+
+MANIFEST_VERSION = 1
+HASH_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+def content_hash(path):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def fingerprint(path):
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'hash': content_hash(path)}
+
+
+def config_hash(config):
+    encoded = json.dumps(config, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.blake2b(encoded, digest_size=16).hexdigest()
+
+
+class ShardManifest:
+    """
+    JSON manifest of processed input shards, used to skip unchanged shards on re-runs.
+
+    Every entry records the input's size, mtime and content hash, the hash of the
+    filter configuration that produced it and the output files it wrote. A shard is
+    unchanged when its size and mtime match (or, if only the mtime moved, its content
+    hash matches), the configuration hash matches and all recorded outputs still exist.
+
+    The manifest is saved after every recorded shard unless `autosave` is off, in which
+    case whoever turned it off saves it (see url_index.ShardUrlDedup).
+    """
+
+    def __init__(self, path, config):
+        self.path = path
+        self.config_hash = config_hash(config)
+        self.entries = {}
+        self.autosave = True
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except (ValueError, UnicodeDecodeError) as e:
+                # Truncated or corrupt (e.g. a partial copy): nothing in it can be
+                # trusted, so every shard is reprocessed and the manifest rewritten
+                print(f"Ignoring unreadable shard manifest {path}: {e}")
+                data = {}
+            if isinstance(data, dict) and data.get('version') == MANIFEST_VERSION:
+                self.entries = data.get('shards', {})
+
+    def _key(self, file):
+        return os.path.abspath(file)
+
+    def is_unchanged(self, file):
+        entry = self.entries.get(self._key(file))
+        if entry is None or entry['config_hash'] != self.config_hash:
+            return False
+        if not all(os.path.exists(output) for output in entry['outputs']):
+            return False
+
+        stat = os.stat(file)
+        if stat.st_size != entry['size']:
+            return False
+        if stat.st_mtime_ns != entry['mtime_ns']:
+            # Touched or re-downloaded: only trust it if the bytes are identical
+            if content_hash(file) != entry['hash']:
+                return False
+            entry['mtime_ns'] = stat.st_mtime_ns
+        return True
+
+    def invalidate(self, file):
+        # Drop the entry and delete the outputs produced from the stale input/config
+        entry = self.entries.pop(self._key(file), None)
+        if entry is None:
+            return
+        for output in entry['outputs']:
+            if os.path.exists(output):
+                os.remove(output)
+
+    def pending(self, files):
+        """Return the shards that need processing, invalidating their previous outputs."""
+        pending = []
+        for file in files:
+            if not self.is_unchanged(file):
+                self.invalidate(file)
+                pending.append(file)
+        self.save()
+        return pending
+
+    def record(self, file, result):
+        entry = dict(result['fingerprint'])
+        entry['config_hash'] = self.config_hash
+        entry['outputs'] = [os.path.abspath(output) for output in result['outputs']]
+        self.entries[self._key(file)] = entry
+        if self.autosave:
+            self.save()
+
+    def save(self):
+        # Write to a temporary file and rename so a crash never leaves a torn manifest
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': MANIFEST_VERSION, 'shards': self.entries}, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+
+class _Fingerprinted:
+    # Picklable wrapper that fingerprints the input inside the worker process, so
+    # content hashing is spread across the pool instead of done serially by the parent.
+    def __init__(self, process_shard):
+        self.process_shard = process_shard
+
+    def __call__(self, file):
+        shard_fingerprint = fingerprint(file)
+        counts, outputs = self.process_shard(file)
+        return counts, {'fingerprint': shard_fingerprint, 'outputs': outputs}
+
+
+def run_incremental_shards(process_shard, files, manifest, num_workers=None, on_result=None):
+    """
+    Like shard_executor.run_shards, but skip shards the manifest reports as unchanged.
+    `process_shard(file)` must return (counts, list of output paths it wrote), and the
+    optional on_result(file, outputs) runs in the parent before the shard is recorded.
+    """
+    pending = manifest.pending(files)
+    print(f"{len(files) - len(pending)} shards unchanged since the last run, {len(pending)} to process.")
+
+    def record(file, result):
+        if on_result is not None:
+            on_result(file, result['outputs'])
+        manifest.record(file, result)
+
+    summary = run_shards(_Fingerprinted(process_shard), pending, num_workers=num_workers, on_result=record)
+    summary['unchanged_shards'] = len(files) - len(pending)
+    return summary
@@ -0,0 +1,165 @@
+import json
+import os
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+def _load_json(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _save_json(path, data):
+    # Write to a temporary file and rename so a crash never leaves a torn progress file
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class CsvStreamWriter:
+    """
+    Append each finished shard's accepted rows to a single CSV.
+
+    After every shard the CSV is fsynced and its byte size is recorded together
+    with the finished shard in '<path>.progress.json'. On restart the CSV is
+    truncated back to the last recorded size, so rows appended by a shard that did
+    not finish recording are dropped, and `done` lists the shards to skip.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.progress_path = f"{path}.progress.json"
+        state = _load_json(self.progress_path, {'done': [], 'offset': 0})
+        self.done = set(state['done'])
+        self.offset = state['offset']
+
+        if os.path.exists(path):
+            with open(path, 'r+b') as f:
+                f.truncate(self.offset)
+
+    def write(self, shard, df):
+        if not df.empty:
+            with open(self.path, 'a', encoding='utf-8', newline='') as f:
+                df.to_csv(f, header=self.offset == 0, index=False)
+                f.flush()
+                os.fsync(f.fileno())
+            self.offset = os.path.getsize(self.path)
+        self.done.add(os.path.abspath(shard))
+        _save_json(self.progress_path, {'done': sorted(self.done), 'offset': self.offset})
+
+    def close(self, complete=True):
+        """
+        Finish the output. With complete=True (every shard succeeded) the progress
+        file is removed, so the next run writes the CSV from scratch instead of
+        skipping every shard; otherwise it is kept and a rerun retries the rest.
+        """
+        # Keep the previous behaviour of always producing the output file
+        if not os.path.exists(self.path):
+            open(self.path, 'w').close()
+        if complete and os.path.exists(self.progress_path):
+            os.remove(self.progress_path)
+
+
+class ParquetPartWriter:
+    """
+    Write accepted rows to rolling part-XXXXX.parquet files of at least
+    `rows_per_part` rows (the last part may be smaller). Each shard's rows are
+    written straight to the open part as a row group, so memory stays at one shard
+    whatever the part size.
+
+    The open part is written as '<part>.tmp' and renamed once it is full (or on
+    close); '<output_dir>/progress.json' then records how many parts exist and which
+    shards they cover. On restart the unfinished .tmp part and parts beyond the
+    recorded count are removed, and their shards are processed again.
+
+    Every shard is cast to the part's schema. Pass `schema` to fix it up front;
+    otherwise it is inferred from the first shard (or the last finished part on a
+    restart) and widened with pa.unify_schemas when a later shard needs it, e.g. a
+    column that was all-null so far or int64 values turning into doubles. A part
+    cannot change its schema, so widening finishes the open part early.
+    """
+
+    def __init__(self, output_dir, rows_per_part=1_000_000, schema=None):
+        self.output_dir = output_dir
+        self.rows_per_part = rows_per_part
+        self.progress_path = os.path.join(output_dir, 'progress.json')
+        state = _load_json(self.progress_path, {'done': [], 'parts': 0})
+        self.done = set(state['done'])
+        self.parts = state['parts']
+
+        self.fixed_schema = schema is not None
+        self.schema = schema
+        self.part_writer = None
+        self.part_rows = 0
+        self.part_shards = []
+
+        os.makedirs(output_dir, exist_ok=True)
+        for name in os.listdir(output_dir):
+            if name.startswith('part-') and name.endswith('.parquet.tmp'):
+                os.remove(os.path.join(output_dir, name))
+            elif name.startswith('part-') and name.endswith('.parquet'):
+                if int(name[len('part-'):-len('.parquet')]) >= self.parts:
+                    os.remove(os.path.join(output_dir, name))
+        if self.schema is None and self.parts:
+            self.schema = pq.read_schema(self.part_path(self.parts - 1))
+
+    def part_path(self, index):
+        return os.path.join(self.output_dir, f"part-{index:05d}.parquet")
+
+    def write(self, shard, df):
+        if not df.empty:
+            table = self._conform(pa.Table.from_pandas(df, preserve_index=False))
+            if self.part_writer is None:
+                self.part_writer = pq.ParquetWriter(f"{self.part_path(self.parts)}.tmp", self.schema)
+            self.part_writer.write_table(table)
+            self.part_rows += len(df)
+        self.part_shards.append(os.path.abspath(shard))
+        if self.part_writer is None:
+            # Nothing buffered in an open part: the shard is finished right away
+            self.flush()
+        elif self.part_rows >= self.rows_per_part:
+            self.flush()
+
+    def _conform(self, table):
+        # Cast the shard to the part schema, widening that first if the shard needs it
+        if self.schema is None:
+            self.schema = table.schema
+            return table
+        if not self.fixed_schema and not table.schema.equals(self.schema):
+            unified = pa.unify_schemas([self.schema, table.schema], promote_options='permissive')
+            if not unified.equals(self.schema):
+                if self.part_writer is not None:
+                    self.flush()
+                # The newer shard's pandas metadata describes the widened columns
+                self.schema = unified.with_metadata(table.schema.metadata)
+        return table.select(self.schema.names).cast(self.schema)
+
+    def flush(self):
+        # Finish the open part (if any) and record it together with the shards it covers
+        if self.part_writer is not None:
+            self.part_writer.close()
+            part_path = self.part_path(self.parts)
+            os.replace(f"{part_path}.tmp", part_path)
+            self.parts += 1
+        self.done.update(self.part_shards)
+        _save_json(self.progress_path, {'done': sorted(self.done), 'parts': self.parts})
+
+        self.part_writer = None
+        self.part_rows = 0
+        self.part_shards = []
+
+    def close(self, complete=True):
+        """
+        Finish the last part. With complete=True (every shard succeeded) the progress
+        file is removed, so the next run rewrites the parts from scratch instead of
+        skipping every shard; otherwise it is kept and a rerun retries the rest.
+        """
+        self.flush()
+        if complete and os.path.exists(self.progress_path):
+            os.remove(self.progress_path)
@@ -0,0 +1,247 @@
+import hashlib
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+# Persistent cross-source URL index, consulted by the metadata filters so an image URL
+# that already appeared in another source or shard is dropped before anything
+# downloads it.
+#
+# URLs are normalized (see normalize_url) and stored as 64-bit blake2b hashes in a
+# sorted array (8 bytes per URL, plus a 4-byte owner), so a lookup is a vectorized
+# binary search (of sorted queries, which keeps it cache-friendly). Each URL is owned by the shard that claimed it first: re-processing
+# a changed shard first releases its own claims, so it is not deduplicated against its
+# previous run. New claims go to a small sorted "recent" run that is merged into the
+# main arrays (a linear merge of two sorted arrays) once it grows past a fraction of them.
+#
+# Indexes built on different machines are combined with merge(); URLs claimed on both
+# keep the owner from the index merged into.
+
+RECENT_FRACTION = 0.1
+
+# Scheme-relative host and the rest of an http(s) URL, without the fragment
+_HTTP_URL = re.compile(r'(?:[Hh][Tt][Tt][Pp][Ss]?:)?//([^/?#]*)([^#]*)')
+
+
+def normalize_url(url):
+    """
+    Canonical form of a URL: whitespace and fragment removed, http/https folded
+    together, host lowercased, default ports and a trailing '?' dropped.
+    """
+    url = str(url).strip()
+    match = _HTTP_URL.match(url)
+    if match is None:
+        return url.split('#', 1)[0]
+    host, rest = match.groups()
+    host = host.lower()
+    if host.endswith(':80') or host.endswith(':443'):
+        host = host.rsplit(':', 1)[0]
+    if rest.endswith('?'):
+        rest = rest[:-1]
+    if not rest.startswith('/'):
+        rest = '/' + rest
+    return f"//{host}{rest}"
+
+
+def url_hashes(urls):
+    """uint64 hash of each normalized URL (stable across machines and Python versions)."""
+    return np.fromiter(
+        (int.from_bytes(hashlib.blake2b(normalize_url(url).encode('utf-8'), digest_size=8).digest(), 'little')
+         for url in urls),
+        dtype=np.uint64, count=len(urls))
+
+
+def _search(keys, hashes):
+    # Position of each hash in the sorted keys, or -1 when absent
+    order = np.argsort(hashes)
+    positions = np.empty(len(hashes), dtype=np.int64)
+    positions[order] = np.searchsorted(keys, hashes[order])
+    found = positions < len(keys)
+    found[found] = keys[positions[found]] == hashes[found]
+    return np.where(found, positions, -1)
+
+
+def _merge_sorted(keys, owners, new_keys, new_owners):
+    # Merge sorted new_keys (not present in keys) into sorted keys in linear time
+    positions = np.searchsorted(keys, new_keys)
+    return np.insert(keys, positions, new_keys), np.insert(owners, positions, new_owners)
+
+
+class UrlIndex:
+    def __init__(self, path=None):
+        """
+        Args:
+            path (str): .npz file the index is loaded from (if it exists) and saved to.
+        """
+        self.path = path
+        self.keys = np.empty(0, dtype=np.uint64)
+        self.owners = np.empty(0, dtype=np.uint32)
+        self.owner_names = []
+        if path and os.path.exists(path):
+            with np.load(path, allow_pickle=False) as data:
+                self.keys = data['keys']
+                self.owners = data['owners']
+                self.owner_names = data['owner_names'].tolist()
+        self._recent_keys = np.empty(0, dtype=np.uint64)
+        self._recent_owners = np.empty(0, dtype=np.uint32)
+        self._owner_ids = {name: i for i, name in enumerate(self.owner_names)}
+
+    def __len__(self):
+        return len(self.keys) + len(self._recent_keys)
+
+    def _owner_id(self, name):
+        if name not in self._owner_ids:
+            self._owner_ids[name] = len(self.owner_names)
+            self.owner_names.append(name)
+        return self._owner_ids[name]
+
+    def _compact(self):
+        # Merge the recent run into the main sorted arrays
+        if not len(self._recent_keys):
+            return
+        self.keys, self.owners = _merge_sorted(self.keys, self.owners, self._recent_keys, self._recent_owners)
+        self._recent_keys = np.empty(0, dtype=np.uint64)
+        self._recent_owners = np.empty(0, dtype=np.uint32)
+
+    def lookup(self, hashes):
+        """Owner id of each hash, or -1 for hashes not in the index."""
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        owners = np.full(len(hashes), -1, dtype=np.int64)
+        for keys, key_owners in ((self.keys, self.owners), (self._recent_keys, self._recent_owners)):
+            positions = _search(keys, hashes)
+            hit = positions >= 0
+            owners[hit] = key_owners[positions[hit]]
+        return owners
+
+    def release(self, owner):
+        """Forget every URL claimed by `owner` (e.g. before re-processing that shard)."""
+        if owner not in self._owner_ids:
+            return
+        self._compact()
+        keep = self.owners != self._owner_ids[owner]
+        self.keys, self.owners = self.keys[keep], self.owners[keep]
+
+    def claim(self, hashes, owner):
+        """
+        Claim URL hashes for `owner` and return the mask of rows to keep: the first
+        occurrence of every hash not already owned by another shard.
+        """
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        owner_id = self._owner_id(owner)
+        current = self.lookup(hashes)
+        _, first = np.unique(hashes, return_index=True)
+        first_occurrence = np.zeros(len(hashes), dtype=bool)
+        first_occurrence[first] = True
+        keep = first_occurrence & ((current == -1) | (current == owner_id))
+
+        new_keys = np.sort(hashes[first_occurrence & (current == -1)])
+        self._recent_keys, self._recent_owners = _merge_sorted(
+            self._recent_keys, self._recent_owners, new_keys, np.full(len(new_keys), owner_id, dtype=np.uint32))
+        if len(self._recent_keys) > RECENT_FRACTION * len(self.keys):
+            self._compact()
+        return keep
+
+    def merge(self, other):
+        """Add the URLs of another index; URLs already present keep their owner."""
+        other._compact()
+        self._compact()
+        new = self.lookup(other.keys) == -1
+        owner_map = np.array([self._owner_id(name) for name in other.owner_names], dtype=np.uint32)
+        self.keys, self.owners = _merge_sorted(self.keys, self.owners, other.keys[new],
+                                               owner_map[other.owners[new]] if len(owner_map) else other.owners[new])
+        return int(new.sum())
+
+    def save(self, path=None):
+        # Write to a temporary file and rename so a crash never leaves a torn index
+        path = path or self.path
+        self._compact()
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, keys=self.keys, owners=self.owners,
+                 owner_names=np.array(self.owner_names, dtype=str))
+        os.replace(tmp_path, path)
+
+
+def dedup_file(path, url_column, index, owner):
+    """
+    Drop the rows of a parquet/CSV output whose URL another shard already claimed (or
+    that repeat a URL earlier in the file), claiming the rest for `owner`. The file is
+    rewritten only when something was dropped. Returns (rows kept, rows dropped).
+    """
+    is_parquet = path.endswith('.parquet')
+    df = pd.read_parquet(path) if is_parquet else pd.read_csv(path, dtype=str, keep_default_na=False)
+    # Rows without a URL cannot be deduplicated and are left alone
+    has_url = (df[url_column].notna() & (df[url_column].astype(str).str.strip() != '')).to_numpy()
+    keep = np.ones(len(df), dtype=bool)
+    keep[has_url] = index.claim(url_hashes(df[url_column][has_url]), owner)
+    dropped = int((~keep).sum())
+    if dropped:
+        tmp_path = f"{path}.tmp"
+        if is_parquet:
+            df[keep].to_parquet(tmp_path, index=False)
+        else:
+            df[keep].to_csv(tmp_path, index=False)
+        os.replace(tmp_path, path)
+    return len(df) - dropped, dropped
+
+
+class ShardUrlDedup:
+    """
+    on_result hook for the shard runners: deduplicates each shard's outputs against the
+    index in the parent process, as shards finish, and saves the index every
+    save_interval shards and on close().
+
+    With incremental runs, pass the run's ShardManifest: it is then only saved right
+    after the index, so after a crash the manifest never lists a shard whose claims
+    were not saved (such shards are simply processed again).
+    """
+
+    def __init__(self, index, source, url_column='url', save_interval=50, manifest=None):
+        self.index = index
+        self.source = source
+        self.url_column = url_column
+        self.save_interval = save_interval
+        self.manifest = manifest
+        if manifest is not None:
+            manifest.autosave = False
+        self.shards = 0
+        self.dropped = 0
+
+    def __call__(self, file, outputs):
+        owner = f"{self.source}/{os.path.basename(file)}"
+        self.index.release(owner)  # claims from an earlier run of this shard
+        for output in outputs:
+            _, dropped = dedup_file(output, self.url_column, self.index, owner)
+            self.dropped += dropped
+            if dropped:
+                print(f"  {os.path.basename(output)}: dropped {dropped} rows with already indexed URLs")
+        self.shards += 1
+        if self.shards % self.save_interval == 0:
+            self.save()
+
+    def save(self):
+        self.index.save()
+        if self.manifest is not None:
+            self.manifest.save()
+
+    def close(self):
+        self.save()
+        print(f"URL index: dropped {self.dropped} duplicate rows; {len(self.index)} URLs in '{self.index.path}'.")
+
+
+# --- Configuration Section ---
+if __name__ == "__main__":
+    # Index to merge into (created if missing), e.g. the one used by this machine's filters
+    INDEX_FILE = 'url_index.npz'
+
+    # Indexes built on other machines
+    MERGE_FILES = []
+
+    index = UrlIndex(INDEX_FILE)
+    print(f"'{INDEX_FILE}': {len(index)} URLs")
+    for merge_file in MERGE_FILES:
+        added = index.merge(UrlIndex(merge_file))
+        print(f"Merged '{merge_file}': {added} new URLs")
+    index.save()
+    print(f"Saved {len(index)} URLs to '{INDEX_FILE}'.")
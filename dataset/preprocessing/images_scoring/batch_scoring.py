@@ -0,0 +1,213 @@
+import os
+import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from image_decode import decode_rgb
+
+# Batched Q-Align scoring with a prefetching loader:
+#   * a thread pool downloads (or reads from the shared image cache), decodes and
+#     optionally downsizes images while the model is busy; at most `queue_size`
+#     images are loaded or loading at any time,
+#   * loaded images are grouped into batches of `batch_size` and every batch is scored
+#     with one model.score(images, task_=..., input_="image") call per task,
+#   * with share_encoding, the vision encoder runs once per batch: both score() calls
+#     preprocess the batch identically, so the second call reuses the visual features
+#     of the first through a memoized model.encode_images.
+# Any object with that score() signature works as the scorer, e.g. the CPU stand-in
+# model in tests/test_batch_scoring.py.
+
+TASKS = ("quality", "aesthetics")
+
+headers = {
+    "User-Agent": ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+                   "AppleWebKit/537.36 (KHTML, like Gecko) "
+                   "Chrome/115.0.0.0 Safari/537.36")
+}
+
+
+def download_image(url, timeout=None):
+    response = requests.get(url, headers=headers, timeout=timeout)
+    response.raise_for_status()  # Ensure request was successful
+    return response.content
+
+
+def load_image(url, cache=None, max_side=None, timeout=None):
+    """
+    Download (or memory-map the cached copy), decode to RGB and, if max_side is set,
+    shrink the image so its longer side is at most max_side pixels; JPEGs are decoded
+    directly at a reduced size when possible (see image_decode.decode_rgb).
+    """
+    if cache is not None:
+        source = cache.path(url)
+        if source is not None:
+            try:
+                return decode_rgb(source, max_side)
+            except FileNotFoundError:
+                pass  # evicted since the lookup: fetch it again below
+        source = cache.fetch(url, lambda u: download_image(u, timeout))
+    else:
+        source = download_image(url, timeout)
+    return decode_rgb(source, max_side)
+
+
+def iter_loaded(items, load_fn, num_workers=16, queue_size=64):
+    """
+    Load images concurrently, yielding (index, url, image, error) in input order.
+    `image` is None and `error` the exception when loading failed.
+    """
+    with ThreadPoolExecutor(max_workers=num_workers) as pool:
+        pending = deque()
+
+        def resolve(index, url, future):
+            try:
+                return index, url, future.result(), None
+            except Exception as e:
+                return index, url, None, e
+
+        try:
+            for index, url in items:
+                pending.append((index, url, pool.submit(load_fn, url)))
+                if len(pending) >= queue_size:
+                    yield resolve(*pending.popleft())
+            while pending:
+                yield resolve(*pending.popleft())
+        finally:
+            for _, _, future in pending:
+                future.cancel()
+
+
+def _to_floats(scores):
+    # model.score returns a tensor with one score per image; stubs may return lists
+    if hasattr(scores, "tolist"):
+        scores = scores.tolist()
+    if not isinstance(scores, list):
+        scores = [scores]
+    return [float(score) for score in scores]
+
+
+class SharedImageEncoding:
+    """
+    Context manager that memoizes scorer.encode_images on its last input: a call with
+    a tensor equal to the previous one returns the cached features instead of running
+    the vision encoder again. Scorers without encode_images are left untouched.
+    """
+
+    def __init__(self, scorer):
+        self.scorer = scorer
+        self.enabled = callable(getattr(scorer, "encode_images", None))
+        self.encodes = 0
+        self.reuses = 0
+
+    def __enter__(self):
+        if not self.enabled:
+            return self
+        encode_images = self.scorer.encode_images
+        cached = {}
+
+        def shared_encode_images(images):
+            previous = cached.get("images")
+            if (previous is not None and previous.shape == images.shape
+                    and previous.device == images.device and bool((previous == images).all())):
+                self.reuses += 1
+                return cached["features"]
+            features = encode_images(images)
+            cached.update(images=images, features=features)
+            self.encodes += 1
+            return features
+
+        # An instance attribute shadows the method for the duration of the block
+        self.scorer.encode_images = shared_encode_images
+        return self
+
+    def __exit__(self, *exc):
+        if self.enabled:
+            del self.scorer.encode_images
+        return False
+
+
+def score_images(scorer, images, share_encoding=False):
+    """Return {task: [score per image]} with one scorer.score call per task."""
+    if share_encoding:
+        with SharedImageEncoding(scorer):
+            return score_images(scorer, images)
+    return {task: _to_floats(scorer.score(images, task_=task, input_="image")) for task in TASKS}
+
+
+def verify_shared_encoding(scorer, images, tolerance=1e-3):
+    """
+    Score `images` with and without the shared encoder pass and raise ValueError if
+    any score differs by more than `tolerance`. Returns the largest difference.
+    """
+    separate = score_images(scorer, images)
+    shared = score_images(scorer, images, share_encoding=True)
+    max_diff = max(abs(a - b) for task in TASKS for a, b in zip(separate[task], shared[task]))
+    if max_diff > tolerance:
+        raise ValueError(f"Shared-encoding scores differ from separate calls by {max_diff} (> {tolerance}).")
+    return max_diff
+
+
+def _score_batch(scorer, batch, share_encoding=False):
+    # Score a batch; if the batch call fails, score images one by one so a single bad
+    # image only loses its own scores
+    images = [image for _, _, image in batch]
+    try:
+        scores = score_images(scorer, images, share_encoding)
+        return [(index, url, {task: scores[task][i] for task in TASKS}, None)
+                for i, (index, url, _) in enumerate(batch)]
+    except Exception:
+        if len(batch) == 1:
+            raise
+    results = []
+    for item in batch:
+        try:
+            results.extend(_score_batch(scorer, [item], share_encoding))
+        except Exception as e:
+            results.append((item[0], item[1], None, e))
+    return results
+
+
+def iter_batch_scores(scorer, items, load_fn, batch_size=16, num_workers=16, queue_size=None,
+                      share_encoding=False):
+    """
+    Score images in batches while the next ones are being loaded.
+
+    Args:
+        scorer: Object with score(images, task_, input_) (the Q-Align model or a stub).
+        items (iterable): (index, url) pairs.
+        load_fn (callable): url -> PIL image, run on the loader threads.
+        batch_size (int): Images per scorer.score call.
+        num_workers (int): Loader threads.
+        queue_size (int): Maximum loaded-but-unscored images (default 4 batches).
+        share_encoding (bool): Encode each batch once for both tasks (see SharedImageEncoding).
+
+    Yields:
+        tuple: (index, url, scores, error) in input order, where scores is
+               {'quality': float, 'aesthetics': float} or None if error is set.
+    """
+    if queue_size is None:
+        queue_size = 4 * batch_size
+
+    # Items since the last scored batch in input order; failed loads wait here with
+    # their error so they neither break input order nor shrink the batch
+    window = []
+    num_images = 0
+
+    def flush():
+        batch = [(index, url, image) for index, url, image, error in window if error is None]
+        scored = iter(_score_batch(scorer, batch, share_encoding) if batch else [])
+        for index, url, image, error in window:
+            yield (index, url, None, error) if error is not None else next(scored)
+
+    for index, url, image, error in iter_loaded(items, load_fn, num_workers, queue_size):
+        window.append((index, url, image, error))
+        if error is None:
+            num_images += 1
+        if num_images >= batch_size:
+            yield from flush()
+            window, num_images = [], 0
+    if window:
+        yield from flush()
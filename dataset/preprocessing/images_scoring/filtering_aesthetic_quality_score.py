@@ -1,16 +1,109 @@
+import glob
+import json
+import sys
+
 import pandas as pd
 
-df = pd.read_csv("combined.csv")
+from quantile_sketch import QuantileSketch, save_sketches, merge_sketch_files, merge_sketches
+
+# Keep images whose quality and aesthetic scores are both at or above the
+# `quantile` cutoff of their score.
+#
+# mode = "exact" loads every input into memory and uses exact percentiles (the
+# original behaviour). mode = "streaming" makes two passes over any number of score
+# shards with memory independent of the row count:
+#   1. build a mergeable quantile sketch per score (and per group_column value, if
+#      set) and save it to sketch_file; sketches from other machines listed in
+#      extra_sketch_files are merged in before the cutoffs are computed,
+#   2. stream the rows again and append the ones passing the cutoffs to output_csv.
+# The streaming cutoffs equal the exact ones for the model's float16 scores and are
+# within 1e-4 of them otherwise (see quantile_sketch.py).
+# With sketch_only = True only pass 1 runs, so each machine can sketch its own shards
+# and one of them merges the sketch files and filters.
+
+# === Configuration ===
+input_files = "combined.csv"  # CSV path or glob pattern over score shards / checkpoints
+output_csv = 'filtered_images.csv'
+mode = "streaming"  # "streaming" or "exact"
+quantile = 0.20
+score_columns = ['quality_score', 'aesthetic_score']
+group_column = None  # e.g. a source-dataset column to get per-dataset cutoffs
+
+chunksize = 1_000_000
+sketch_file = "score_sketches.npz"
+extra_sketch_files = []  # sketch files from other machines to merge
+sketch_only = False
+
+def sketch_key(score_column, group):
+    return json.dumps([score_column, group])
+
+def iter_chunks(files, columns=None):
+    for path in files:
+        yield from pd.read_csv(path, usecols=columns, chunksize=chunksize)
+
+def chunk_groups(chunk):
+    # (group value, rows) pairs; a single None group without group_column
+    if group_column is None:
+        return [(None, chunk)]
+    return [(str(group), rows) for group, rows in chunk.groupby(chunk[group_column].astype(str), sort=False)]
+
+def passes_cutoffs(rows, cutoffs, group):
+    mask = pd.Series(True, index=rows.index)
+    for column in score_columns:
+        # A group missing from the sketches has no cutoff and is dropped
+        cutoff = cutoffs.get(sketch_key(column, group), float('inf'))
+        mask &= rows[column] >= cutoff
+    return mask
+
+if __name__ == "__main__":
+    files = sorted(glob.glob(input_files))
+    if not files:
+        print(f"No input files match {input_files}.")
+        sys.exit(1)
+
+    if mode == "exact":
+        df = pd.concat((pd.read_csv(path) for path in files), ignore_index=True)
+        cutoffs = {}
+        for group, rows in chunk_groups(df):
+            for column in score_columns:
+                cutoffs[sketch_key(column, group)] = rows[column].quantile(quantile)
+        keep = pd.concat([passes_cutoffs(rows, cutoffs, group) for group, rows in chunk_groups(df)])
+        filtered_df = df[keep.reindex(df.index)]
+        filtered_df.to_csv(output_csv, index=False)
+        print(f"Kept {len(filtered_df)}/{len(df)} images; saved to {output_csv}")
+        sys.exit(0)
+
+    # Pass 1: sketch every score, reading only the columns it needs
+    needed = score_columns + ([group_column] if group_column is not None else [])
+    sketches = {}
+    for chunk in iter_chunks(files, needed):
+        for group, rows in chunk_groups(chunk):
+            for column in score_columns:
+                sketches.setdefault(sketch_key(column, group), QuantileSketch()).update(rows[column])
+    save_sketches(sketch_file, sketches)
+    print(f"Sketched {len(files)} files; sketches saved to {sketch_file}")
+    if sketch_only:
+        sys.exit(0)
 
-# Compute the 20th percentile thresholds for each score
-quality_threshold = df['quality_score'].quantile(0.20)
-aesthetic_threshold = df['aesthetic_score'].quantile(0.20)
+    if extra_sketch_files:
+        merge_sketches(sketches, merge_sketch_files(extra_sketch_files))
+        print(f"Merged {len(extra_sketch_files)} extra sketch files")
 
-# Filter the DataFrame to only include images with both scores above the thresholds
-filtered_df = df[
-    (df['quality_score'] >= quality_threshold) & 
-    (df['aesthetic_score'] >= aesthetic_threshold)
-]
+    cutoffs = {key: sketch.quantile(quantile) for key, sketch in sketches.items()}
+    for key, cutoff in sorted(cutoffs.items()):
+        column, group = json.loads(key)
+        label = column if group is None else f"{column} [{group}]"
+        print(f"  {label}: {quantile:.0%} cutoff {cutoff:.4f} ({sketches[key].count} scores)")
 
-# Optionally, save the filtered DataFrame to a new CSV
-filtered_df.to_csv('filtered_images.csv', index=False)
+    # Pass 2: stream the rows again and append the ones above the cutoffs
+    total = kept = 0
+    with open(output_csv, 'w', encoding='utf-8', newline='') as f:
+        header = True
+        for chunk in iter_chunks(files):
+            keep = pd.concat([passes_cutoffs(rows, cutoffs, group) for group, rows in chunk_groups(chunk)])
+            filtered = chunk[keep.reindex(chunk.index)]
+            filtered.to_csv(f, header=header, index=False)
+            header = False
+            total += len(chunk)
+            kept += len(filtered)
+    print(f"Kept {kept}/{total} images; saved to {output_csv}")
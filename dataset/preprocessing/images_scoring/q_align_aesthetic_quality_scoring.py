@@ -1,10 +1,24 @@
 import os
 os.environ["CUDA_VISIBLE_DEVICES"] = "4"
+import signal
+import sys
+from functools import partial
 import pandas as pd
-import requests
 import torch
 from transformers import AutoModelForCausalLM
-from PIL import Image
+
+from batch_scoring import load_image, iter_batch_scores, verify_shared_encoding
+from score_shards import ScoreShardWriter, load_scores, merge_scores
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from image_cache import ImageCache
+from resolution_probe import ProbeCache
+
+# Content-addressed image cache shared with the blur filter, so images it already
+# downloaded are read from disk ("" disables the cache)
+image_cache_dir = ""
+image_cache_max_bytes = 500 * 1024 ** 3
+image_cache = ImageCache(image_cache_dir, image_cache_max_bytes) if image_cache_dir else None
 
 # Load the model
 model = AutoModelForCausalLM.from_pretrained(
@@ -14,27 +28,22 @@ model = AutoModelForCausalLM.from_pretrained(
     device_map="auto"
 )
 
-def get_image_scores(url):
-    try:
-        headers = {
-            "User-Agent": ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                           "AppleWebKit/537.36 (KHTML, like Gecko) "
-                           "Chrome/115.0.0.0 Safari/537.36")
-        }
-        response = requests.get(url, stream=True, headers=headers)
-        response.raise_for_status()  # Ensure request was successful
-
-        img = Image.open(response.raw).convert("RGB")
-        # Optionally, you can resize if needed:
-        # img = img.resize((512, 512), Image.LANCZOS)
-
-        quality_score = model.score([img], task_="quality", input_="image")
-        aesthetic_score = model.score([img], task_="aesthetics", input_="image")
-
-        return quality_score, aesthetic_score
-    except Exception as e:
-        print(f"Error processing URL {url}: {e}")
-        return None, None
+# Batched scoring: loader threads download, decode and downsize images into a bounded
+# queue while the model scores batches of batch_size images per task
+batch_size = 16
+loader_workers = 16
+prefetch_batches = 4  # loaded images kept ready, in batches
+# Images are shrunk to this longer side before queueing (None keeps full resolution).
+# The model resizes to 448x448 itself, so this mostly bounds queue memory for 4K images.
+prefetch_max_side = 1024
+download_timeout = 30
+
+# Run the vision encoder once per batch for both tasks instead of once per task.
+# At startup the first images are also scored with separate encoder passes, and the
+# run stops if any score differs by more than shared_encoding_tolerance.
+share_image_encoding = True
+verify_shared_encoding_images = batch_size  # images checked at startup, 0 skips the check
+shared_encoding_tolerance = 1e-3
 
 # Read the CSV file (it must have a column named 'url')
 input_csv = ""
@@ -43,55 +52,91 @@ df = pd.read_csv(input_csv, engine="python", dtype=str)
 total_rows = len(df)
 print(f"Total rows to process: {total_rows}")
 
-# Preallocate lists for the scores (ensuring we have a slot for every row)
-quality_scores = [None] * total_rows
-aesthetic_scores = [None] * total_rows
-
+# Score-sharded checkpoints: every checkpoint_interval scored images, only the new
+# scores are written to score_dir as another shard. A restart skips every URL that
+# already has scores there (use a fresh score_dir to rescore from scratch), and the
+# shards are merged into output_csv at the end.
+score_dir = "q_align_scores"
 checkpoint_interval = 20000
+output_csv = f"" # update with your desired output filename
+
+writer = ScoreShardWriter(score_dir, checkpoint_interval)
+scored_urls = set(load_scores(score_dir)["url"])
+# URLs the resolution probe (images_filtering/Resolution_probe) found below 4K are
+# skipped without downloading them ("" disables the check)
+probe_cache_file = ""
+probe_cache = ProbeCache(probe_cache_file) if probe_cache_file else None
+pending = [(idx, url) for idx, url in enumerate(df['url'])
+           if url not in scored_urls and not (probe_cache is not None and probe_cache.rejected(url))]
+if scored_urls:
+    print(f"Resuming: {total_rows - len(pending)} rows already scored, {len(pending)} to go.")
+
 processed_count = 0
 
-for idx, row in df.iterrows():
-    url = row['url']
-    q_score, a_score = get_image_scores(url)
-    
-    # Save the scores by index
-    quality_scores[idx] = q_score
-    aesthetic_scores[idx] = a_score
+load_fn = partial(load_image, cache=image_cache, max_side=prefetch_max_side, timeout=download_timeout)
+
+if share_image_encoding and verify_shared_encoding_images and pending:
+    sample = []
+    for _, url in pending[:verify_shared_encoding_images]:
+        try:
+            sample.append(load_fn(url))
+        except Exception as e:
+            print(f"Error processing URL {url}: {e}")
+    if sample:
+        max_diff = verify_shared_encoding(model, sample, shared_encoding_tolerance)
+        print(f"Shared encoding verified on {len(sample)} images (max score difference {max_diff:.2e}).")
+
+results = iter_batch_scores(
+    model,
+    pending,
+    load_fn,
+    batch_size=batch_size,
+    num_workers=loader_workers,
+    queue_size=prefetch_batches * batch_size,
+    share_encoding=share_image_encoding,
+)
+
+# Ctrl+C and SIGTERM (how cluster jobs are stopped) only set a flag; the loop stops at
+# the next result and the scores buffered since the last shard are written out
+shutdown_requested = False
+
+def request_shutdown(signum, frame):
+    global shutdown_requested
+    shutdown_requested = True
+
+signal.signal(signal.SIGINT, request_shutdown)
+signal.signal(signal.SIGTERM, request_shutdown)
+
+for idx, url, scores, error in results:
+    if shutdown_requested:
+        break
+    if error is not None:
+        print(f"Error processing URL {url}: {error}")
+    else:
+        shard_path = writer.add(idx, url, scores["quality"], scores["aesthetics"])
+        if shard_path is not None:
+            print(f"Checkpoint saved to {shard_path}.")
 
     processed_count += 1
 
-    # Print progress every 1000 images (adjust as needed)
+    # Print progress every 100 images (adjust as needed)
     if processed_count % 100 == 0:
-        print(f"Processed {processed_count}/{total_rows}")
-
-    # Checkpoint every checkpoint_interval images
-    if processed_count % checkpoint_interval == 0:
-        df.loc[:processed_count - 1, "quality_score"] = [
-            score.cpu().item() if score is not None else None
-            for score in quality_scores[:processed_count]
-        ]
-        df.loc[:processed_count - 1, "aesthetic_score"] = [
-            score.cpu().item() if score is not None else None
-            for score in aesthetic_scores[:processed_count]
-        ]
-
-        output_csv = f"checkpoint_{processed_count}_second_cropped.csv"
-        df.to_csv(output_csv, index=False)
-        print(f"Checkpoint saved at {processed_count} images.")
-
-# After processing, if the last checkpoint wasn't exactly at the end, save the final CSV.
-if processed_count % checkpoint_interval != 0:
-    df["quality_score"] = [
-        score.cpu().item() if score is not None else None
-        for score in quality_scores
-    ]
-    df["aesthetic_score"] = [
-        score.cpu().item() if score is not None else None
-        for score in aesthetic_scores
-    ]
-
-    output_csv = f"" # update with your desired output filename
-    df.to_csv(output_csv, index=False)
-    print("Final results saved.")
+        print(f"Processed {processed_count}/{len(pending)}")
+
+if shutdown_requested:
+    # Keep the scores buffered since the last shard
+    results.close()
+    writer.close()
+    print(f"Interrupted after {processed_count} images; scores saved to {score_dir}.")
+    sys.exit(0)
+
+shard_path = writer.close()
+if shard_path is not None:
+    print(f"Last scores saved to {shard_path}.")
+
+# Merge all score shards onto the input rows
+df = merge_scores(df, score_dir)
+df.to_csv(output_csv, index=False)
+print("Final results saved.")
 
 print(f"Finished processing {processed_count} images.")
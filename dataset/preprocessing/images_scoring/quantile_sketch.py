@@ -0,0 +1,128 @@
+import json
+
+import numpy as np
+
+# Mergeable, fixed-size quantile sketches for streaming score cutoffs.
+#
+# Q-Align scores are softmax-weighted averages of 1..5, so they always fall in [1, 5].
+# A fixed-range histogram of that interval with `bins` equal-width buckets is a quantile
+# sketch whose size does not depend on the number of rows and whose merge is a sum of
+# counts (so sketches built on different machines combine losslessly). Each bucket also
+# keeps the sum of its values: a quantile is interpolated between the two neighbouring
+# order statistics exactly like pandas' Series.quantile, with each order statistic
+# estimated by the mean of its bucket. The estimate is within one bucket width
+# ((hi - lo) / bins, 1e-4 by default) of the exact quantile, and equal to it when those
+# buckets hold a single distinct value, which is the case for the model's float16
+# scores (spaced >= 2**-10 apart). Values outside [lo, hi] are counted in the edge
+# buckets and the exact min/max are kept.
+
+
+def _lerp(a, b, t):
+    # numpy's linear interpolation (used by pandas' quantile), bit for bit
+    return b - (b - a) * (1 - t) if t >= 0.5 else a + (b - a) * t
+
+
+class QuantileSketch:
+    def __init__(self, lo=1.0, hi=5.0, bins=40000):
+        self.lo = float(lo)
+        self.hi = float(hi)
+        self.bins = int(bins)
+        self.counts = np.zeros(self.bins, dtype=np.int64)
+        self.sums = np.zeros(self.bins, dtype=np.float64)
+        self.min = np.inf
+        self.max = -np.inf
+
+    @property
+    def count(self):
+        return int(self.counts.sum())
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if values.size == 0:
+            return
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        buckets = ((values - self.lo) * (self.bins / (self.hi - self.lo))).astype(np.int64)
+        np.clip(buckets, 0, self.bins - 1, out=buckets)
+        self.counts += np.bincount(buckets, minlength=self.bins)
+        self.sums += np.bincount(buckets, weights=values, minlength=self.bins)
+
+    def merge(self, other):
+        if (self.lo, self.hi, self.bins) != (other.lo, other.hi, other.bins):
+            raise ValueError("Cannot merge sketches with different ranges or bucket counts.")
+        self.counts += other.counts
+        self.sums += other.sums
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def _order_statistic(self, cumulative, rank):
+        # Estimate of the rank-th smallest value: the mean of the bucket holding it
+        bucket = int(np.searchsorted(cumulative, rank, side='right'))
+        value = self.sums[bucket] / self.counts[bucket]
+        return float(min(max(value, self.min), self.max))
+
+    def quantile(self, q):
+        """
+        Approximate q-quantile with pandas' default linear interpolation, within one
+        bucket width of rows.quantile(q) (see the module comment). NaN for an empty sketch.
+        """
+        total = self.count
+        if total == 0:
+            return float('nan')
+        # Same virtual index as np.quantile's default 'linear' method, which pandas uses
+        position = (total - 1) * q
+        rank = int(np.floor(position))
+        rank = min(max(rank, 0), total - 1)
+        cumulative = np.cumsum(self.counts)
+        lower = self._order_statistic(cumulative, rank)
+        upper = self._order_statistic(cumulative, min(rank + 1, total - 1))
+        return float(_lerp(lower, upper, position - np.floor(position)))
+
+
+def save_sketches(path, sketches):
+    """Save {key: QuantileSketch} (keys are strings) to one .npz file."""
+    keys = sorted(sketches)
+    first = sketches[keys[0]] if keys else QuantileSketch()
+    np.savez_compressed(
+        path,
+        keys=np.array(json.dumps(keys)),
+        params=np.array([first.lo, first.hi, first.bins]),
+        counts=np.stack([sketches[key].counts for key in keys]) if keys else np.zeros((0, first.bins), dtype=np.int64),
+        sums=np.stack([sketches[key].sums for key in keys]) if keys else np.zeros((0, first.bins)),
+        mins=np.array([sketches[key].min for key in keys]),
+        maxs=np.array([sketches[key].max for key in keys]),
+    )
+
+
+def load_sketches(path):
+    with np.load(path) as data:
+        keys = json.loads(str(data['keys']))
+        lo, hi, bins = data['params']
+        sketches = {}
+        for i, key in enumerate(keys):
+            sketch = QuantileSketch(lo, hi, bins)
+            sketch.counts = data['counts'][i].astype(np.int64)
+            sketch.sums = data['sums'][i].astype(np.float64)
+            sketch.min = float(data['mins'][i])
+            sketch.max = float(data['maxs'][i])
+            sketches[key] = sketch
+    return sketches
+
+
+def merge_sketches(sketches, others):
+    """Merge {key: sketch} dict `others` into `sketches` in place and return it."""
+    for key, sketch in others.items():
+        if key in sketches:
+            sketches[key].merge(sketch)
+        else:
+            sketches[key] = sketch
+    return sketches
+
+
+def merge_sketch_files(paths):
+    sketches = {}
+    for path in paths:
+        merge_sketches(sketches, load_sketches(path))
+    return sketches
@@ -0,0 +1,84 @@
+import os
+
+import pandas as pd
+
+# Score-sharded checkpoints for Q-Align scoring.
+#
+# Scores are buffered and written every `rows_per_shard` images as
+# <score_dir>/scores-XXXXX.csv holding only the newly scored rows
+# (index, url, quality_score, aesthetic_score), so each checkpoint costs the same
+# no matter how far the run is. Shards are written to a temporary file and renamed,
+# so a crash loses at most the unwritten buffer. On restart every URL found in the
+# shards is skipped, and merge_scores() joins all shards back onto the input rows.
+
+SCORE_COLUMNS = ["index", "url", "quality_score", "aesthetic_score"]
+
+
+def _shard_files(score_dir):
+    if not os.path.isdir(score_dir):
+        return []
+    return sorted(
+        os.path.join(score_dir, name) for name in os.listdir(score_dir)
+        if name.startswith("scores-") and name.endswith(".csv")
+    )
+
+
+def _shard_index(path):
+    return int(os.path.basename(path)[len("scores-"):-len(".csv")])
+
+
+def load_scores(score_dir):
+    """All scores written so far, one row per URL (the latest one wins)."""
+    shards = _shard_files(score_dir)
+    if not shards:
+        return pd.DataFrame(columns=SCORE_COLUMNS)
+    scores = pd.concat((pd.read_csv(path, dtype={"url": str}) for path in shards), ignore_index=True)
+    return scores.drop_duplicates("url", keep="last")
+
+
+def merge_scores(df, score_dir):
+    """Return df with quality_score / aesthetic_score columns filled from the shards by URL."""
+    scores = load_scores(score_dir).set_index("url")
+    df = df.copy()
+    df["quality_score"] = df["url"].map(scores["quality_score"])
+    df["aesthetic_score"] = df["url"].map(scores["aesthetic_score"])
+    return df
+
+
+class ScoreShardWriter:
+    def __init__(self, score_dir, rows_per_shard=20000):
+        """
+        Args:
+            score_dir (str): Directory holding the score shards (created if missing).
+            rows_per_shard (int): Scored images buffered before a shard is written.
+        """
+        self.score_dir = score_dir
+        self.rows_per_shard = rows_per_shard
+        os.makedirs(score_dir, exist_ok=True)
+        for name in os.listdir(score_dir):
+            if name.endswith(".tmp"):
+                os.remove(os.path.join(score_dir, name))  # shard interrupted mid-write
+        # Continue after the highest existing shard; numbering may have gaps
+        self.shards = max((_shard_index(path) + 1 for path in _shard_files(score_dir)), default=0)
+        self.buffer = []
+
+    def add(self, index, url, quality_score, aesthetic_score):
+        self.buffer.append((index, url, quality_score, aesthetic_score))
+        # Returns the shard path when this call wrote a shard
+        if len(self.buffer) >= self.rows_per_shard:
+            return self.flush()
+        return None
+
+    def flush(self):
+        if not self.buffer:
+            return None
+        shard_path = os.path.join(self.score_dir, f"scores-{self.shards:05d}.csv")
+        tmp_path = f"{shard_path}.tmp"
+        pd.DataFrame(self.buffer, columns=SCORE_COLUMNS).to_csv(tmp_path, index=False)
+        os.replace(tmp_path, shard_path)
+        self.shards += 1
+        self.buffer = []
+        return shard_path
+
+    def close(self):
+        return self.flush()
@@ -0,0 +1,212 @@
+import json
+import os
+import struct
+
+# True image dimensions from the first few KB of the file, fetched with an HTTP Range
+# request, so images whose real resolution is below the 4K cutoff can be rejected
+# before the blur filter or Q-Align download the full multi-MB file.
+#
+#   * parse_header reads width/height from a JPEG (first SOFn segment), PNG (IHDR) or
+#     WebP (VP8 / VP8L / VP8X) prefix, or returns None when the prefix is too short
+#     (e.g. a JPEG whose EXIF/ICC segments come before the frame header).
+#   * probe_url requests probe_bytes and doubles the range up to max_bytes until the
+#     header parses. Servers that ignore Range answer 200 with the whole file; the
+#     body is then streamed only until the header parses and the connection dropped.
+#   * ProbeCache is an append-only JSONL file of probe results keyed by URL, shared
+#     with the downstream stages, which skip URLs the probe rejected. Failed requests
+#     are cached too but probed again on the next run (the last record of a URL wins).
+#
+# Dimensions are the stored ones (like PIL's Image.size), without EXIF rotation.
+
+PROBE_BYTES = 16 * 1024
+MAX_PROBE_BYTES = 256 * 1024
+CHUNK_SIZE = 8 * 1024
+
+# JPEG start-of-frame markers (SOF0-SOF15 except DHT, JPG and DAC)
+_JPEG_SOF = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+# Markers without a length field
+_JPEG_STANDALONE = set(range(0xD0, 0xDA)) | {0x01}
+
+# Probe statuses
+OK = "ok"              # dimensions parsed
+UNPARSED = "unparsed"  # fetched, but no dimensions within max_bytes / unknown format
+ERROR = "error"        # request failed
+
+
+def _parse_jpeg(data):
+    pos = 2
+    while True:
+        if pos + 2 > len(data):
+            return None
+        if data[pos] != 0xFF:
+            raise ValueError("corrupt JPEG marker")
+        marker = data[pos + 1]
+        if marker == 0xFF:  # fill byte
+            pos += 1
+            continue
+        if marker in _JPEG_STANDALONE:
+            pos += 2
+            continue
+        if pos + 4 > len(data):
+            return None
+        if marker == 0xDA:  # start of scan before any frame header
+            raise ValueError("JPEG without a frame header")
+        if marker in _JPEG_SOF:
+            if pos + 9 > len(data):
+                return None
+            height, width = struct.unpack('>HH', data[pos + 5:pos + 9])
+            return width, height
+        pos += 2 + struct.unpack('>H', data[pos + 2:pos + 4])[0]
+
+
+def _parse_webp(data):
+    if len(data) < 30:
+        return None
+    chunk = data[12:16]
+    if chunk == b'VP8 ':
+        width, height = struct.unpack('<HH', data[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b'VP8L':
+        bits = struct.unpack('<I', data[21:25])[0]
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b'VP8X':
+        return (int.from_bytes(data[24:27], 'little') + 1,
+                int.from_bytes(data[27:30], 'little') + 1)
+    raise ValueError(f"unsupported WebP chunk {chunk!r}")
+
+
+def parse_header(data):
+    """
+    (width, height, format) from the start of an image file, or None if more bytes
+    are needed. Raises ValueError for unsupported or corrupt data.
+    """
+    if data[:2] == b'\xff\xd8':
+        size = _parse_jpeg(data)
+        return size + ('JPEG',) if size else None
+    if data[:8] == b'\x89PNG\r\n\x1a\n':
+        if len(data) < 24:
+            return None
+        if data[12:16] != b'IHDR':
+            raise ValueError("PNG without IHDR")
+        return struct.unpack('>II', data[16:24]) + ('PNG',)
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        size = _parse_webp(data)
+        return size + ('WEBP',) if size else None
+    if len(data) < 12:
+        return None
+    raise ValueError("unsupported image format")
+
+
+def _decided(data):
+    # Whether data holds enough of the file to parse (or reject) its header
+    try:
+        return parse_header(data) is not None
+    except ValueError:
+        return True
+
+
+def _read(response, limit, data=b''):
+    # Append the body to data until the header parses or limit bytes are held
+    for chunk in response.iter_content(CHUNK_SIZE):
+        data += chunk
+        if len(data) >= limit or _decided(data):
+            break
+    return data
+
+
+def probe_url(session, url, probe_bytes=PROBE_BYTES, max_bytes=MAX_PROBE_BYTES, timeout=10):
+    """
+    Probe the dimensions of the image at `url` from the start of the file.
+
+    Returns:
+        dict: 'url', 'status' (OK, UNPARSED or ERROR), 'width', 'height', 'format'
+              (None unless OK), 'bytes' fetched, 'range' (whether the server honoured
+              the Range header) and 'error'.
+    """
+    result = {'url': url, 'status': ERROR, 'width': None, 'height': None, 'format': None,
+              'bytes': 0, 'range': None, 'error': None}
+    data = b''
+    try:
+        while True:
+            end = min(max(2 * len(data), probe_bytes), max_bytes)
+            headers = {'Range': f"bytes={len(data)}-{end - 1}"}
+            with session.get(url, headers=headers, stream=True, timeout=timeout) as response:
+                if response.status_code == 416:  # range starts past the end of the file
+                    break
+                response.raise_for_status()
+                if response.status_code == 206:
+                    result['range'] = True
+                    before = len(data)
+                    data = _read(response, end, data)
+                    at_end = len(data) - before < end - before
+                else:
+                    # Range ignored: the body is the whole file, read only its start
+                    result['range'] = False
+                    data = _read(response, max_bytes)
+                    at_end = True
+            if _decided(data) or at_end or len(data) >= max_bytes:
+                break
+
+        result['bytes'] = len(data)
+        parsed = parse_header(data)
+        if parsed is None:
+            result.update(status=UNPARSED, error=f"no dimensions in the first {len(data)} bytes")
+        else:
+            result.update(status=OK, width=parsed[0], height=parsed[1], format=parsed[2])
+    except ValueError as e:
+        result.update(status=UNPARSED, bytes=len(data), error=str(e))
+    except Exception as e:
+        result.update(bytes=len(data), error=str(e) or type(e).__name__)
+    return result
+
+
+class ProbeCache:
+    """
+    Append-only JSONL cache of probe results by URL. Each record carries a 'passed'
+    verdict set by the probe stage (None when the probe could not decide).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.records = {}
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                data = f.read()
+            complete = data[:data.rfind(b'\n') + 1]
+            if len(complete) < len(data):
+                # Torn last line from an interrupted run: drop it so appends start clean
+                with open(path, 'r+b') as f:
+                    f.truncate(len(complete))
+            for line in complete.decode('utf-8').splitlines():
+                record = json.loads(line)
+                self.records[record['url']] = record
+        self._file = None
+
+    def __contains__(self, url):
+        return url in self.records
+
+    def get(self, url):
+        return self.records.get(url)
+
+    def settled(self, url):
+        """True when url has a probe result that is kept (OK or UNPARSED), not a failed request."""
+        record = self.records.get(url)
+        return record is not None and record['status'] != ERROR
+
+    def rejected(self, url):
+        """True when the probe found the image's real resolution too low."""
+        record = self.records.get(url)
+        return record is not None and record.get('passed') is False
+
+    def add(self, records):
+        if self._file is None:
+            self._file = open(self.path, 'a', encoding='utf-8')
+        for record in records:
+            self.records[record['url']] = record
+            self._file.write(json.dumps(record) + '\n')
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
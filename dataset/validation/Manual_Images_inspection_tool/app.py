@@ -1,14 +1,116 @@
-from flask import Flask, send_from_directory, render_template, request, jsonify, url_for
-import json
+from flask import Flask, send_from_directory, send_file, render_template, request, jsonify, url_for, g, abort
+from werkzeug.security import safe_join
 import os
+import threading
+
+from label_store import connect, init_db, set_quality, get_page, count_images, import_json, QUALITY_FILTERS
+from thumbnails import ThumbnailCache, thumbnail_size, FORMATS
 
 app = Flask(__name__)
 
+# Labels live in a SQLite database (see label_store.py); on first start it is created
+# from images.json. Run label_store.py with 'export' to write images.json for filter_images.py.
+# The database and the thumbnail cache are set up on first use (whatever server runs the
+# app), not on import, so importing this module never creates files in the working directory.
+DB_FILE = 'images.db'
+JSON_FILE = 'images.json'
+
+IMAGES_DIR = ''  # Update this with the path to your high-resolution images directory
+
+# Grid previews: generated on demand, cached on disk and evicted LRU under the budget
+THUMBNAIL_CACHE_DIR = 'thumbnail_cache'
+THUMBNAIL_CACHE_MAX_BYTES = 5 * 1024 ** 3
+thumbnail_cache = None  # opened on first use, see get_thumbnail_cache
+
+# Largest page /get_images returns; larger limits are clamped to it
+MAX_PAGE_SIZE = 1000
+
+_setup_lock = threading.Lock()
+_ready_dbs = set()  # DB_FILE values whose schema is set up in this process
+
+def init_store():
+    # Create or migrate the database once per process; requests only open connections
+    with _setup_lock:
+        if DB_FILE in _ready_dbs:
+            return
+        is_new = not os.path.exists(DB_FILE)
+        conn = connect(DB_FILE)
+        init_db(conn)
+        if is_new and os.path.exists(JSON_FILE):
+            print(f"Imported {import_json(conn, JSON_FILE)} entries from '{JSON_FILE}' into '{DB_FILE}'.")
+        conn.close()
+        _ready_dbs.add(DB_FILE)
+
+def get_thumbnail_cache():
+    global thumbnail_cache
+    if thumbnail_cache is None:
+        with _setup_lock:
+            if thumbnail_cache is None:
+                thumbnail_cache = ThumbnailCache(THUMBNAIL_CACHE_DIR, THUMBNAIL_CACHE_MAX_BYTES)
+    return thumbnail_cache
+
+def init_app():
+    # Eager setup for python app.py; other entry points set up on first use
+    init_store()
+    get_thumbnail_cache()
+
+def get_db():
+    # One connection per request context; SQLite connections are not shared across threads
+    if 'db' not in g:
+        if DB_FILE not in _ready_dbs:
+            init_store()
+        g.db = connect(DB_FILE)
+    return g.db
+
+def int_arg(name, default=None):
+    # Integer query parameter; raises ValueError for a value that is not an integer
+    if name not in request.args:
+        return default
+    value = request.args.get(name, type=int)  # None when the conversion fails
+    if value is None:
+        raise ValueError(f"{name} must be an integer")
+    return value
+
+@app.teardown_appcontext
+def close_db(exception):
+    db = g.pop('db', None)
+    if db is not None:
+        db.close()
+
 # Custom route to serve images from your large images folder
 @app.route('/hr_images/<path:filename>')
 def hr_images(filename):
-    images_dir = ''# Update this with the path to your high-resolution images directory
-    return send_from_directory(images_dir, filename)
+    return send_from_directory(IMAGES_DIR, filename)
+
+# Thumbnail of an image: /thumbs/<filename>?size=320&format=webp (or jpeg). Responses
+# carry an ETag and Last-Modified so browsers revalidate with a cheap 304.
+@app.route('/thumbs/<path:filename>')
+def thumbs(filename):
+    source_path = safe_join(IMAGES_DIR, filename)
+    if source_path is None or not os.path.isfile(source_path):
+        abort(404)
+    try:
+        size = int_arg("size", 320)
+    except ValueError:
+        abort(400)
+    if size <= 0:
+        abort(400)
+    size = thumbnail_size(size)
+    fmt = request.args.get("format", "webp")
+    if fmt not in FORMATS:
+        abort(400)
+
+    source_stat = os.stat(source_path)
+    key = ThumbnailCache.key(source_path, source_stat, size, fmt)
+    if key in request.if_none_match:
+        # The browser's copy is current; don't even touch the cache
+        response = app.response_class(status=304)
+        response.set_etag(key)
+        return response
+
+    thumb_path, key = get_thumbnail_cache().get(source_path, source_stat, size, fmt)
+    return send_file(thumb_path, mimetype=FORMATS[fmt][1], etag=key, conditional=True,
+                     last_modified=source_stat.st_mtime, max_age=0)
 
 # Home route – will load the main review interface (the grid view)
 @app.route('/')
@@ -19,34 +121,58 @@ def index():
 # Endpoint to update image quality
 @app.route('/update_quality', methods=['POST'])
 def update_quality():
-    image_id = int(request.form.get('id'))
+    image_id = request.form.get('id', type=int)
+    if image_id is None:
+        return jsonify(success=False, error="id must be an integer"), 400
     quality = request.form.get('quality')
     if quality == "null" or quality == "":
         quality = None
-    # Load, update, and save the JSON file.
-    with open('images.json', 'r') as f:
-        images = json.load(f)
-    for img in images:
-        if img['id'] == image_id:
-            img['quality'] = quality
-            break
-    with open('images.json', 'w') as f:
-        json.dump(images, f, indent=4)
+    # Single-row update in its own transaction
+    if not set_quality(get_db(), image_id, quality):
+        return jsonify(success=False, error=f"Unknown image id {image_id}"), 404
     return jsonify(success=True)
 
-# Endpoint to get paginated images
+def request_filters():
+    # Server-side filters shared by /get_images and /count_images
+    quality = request.args.get("quality") or None
+    if quality is not None and quality not in QUALITY_FILTERS:
+        raise ValueError(f"quality must be one of {', '.join(QUALITY_FILTERS)}")
+    return {
+        'quality': quality,
+        'filename_from': request.args.get("filename_from") or None,
+        'filename_to': request.args.get("filename_to") or None,
+    }
+
+# Endpoint to get paginated images: pass after_id and after_filename (of the last image
+# of the previous page) for keyset pagination; page is still accepted for page jumps
 @app.route('/get_images')
 def get_images():
-    page = int(request.args.get("page", 1))
-    limit = int(request.args.get("limit", 50))
-    with open('images.json', 'r') as f:
-        images = json.load(f)
-    # Compute start and end indices for pagination
-    start = (page - 1) * limit
-    end = start + limit
-    paged_images = images[start:end]
+    try:
+        limit = min(max(int_arg("limit", 50), 1), MAX_PAGE_SIZE)
+        after_id = int_arg("after_id")
+        page = max(int_arg("page", 1), 1)
+        filters = request_filters()
+    except ValueError as e:
+        return jsonify(success=False, error=str(e)), 400
+    if after_id is not None:
+        paged_images = get_page(get_db(), limit, after_id=after_id,
+                                after_filename=request.args.get("after_filename"), **filters)
+    else:
+        paged_images = get_page(get_db(), limit, offset=(page - 1) * limit, **filters)
     return jsonify(paged_images)
 
+# Endpoint to count the images matching the filters
+@app.route('/count_images')
+def count_images_route():
+    try:
+        filters = request_filters()
+    except ValueError as e:
+        return jsonify(success=False, error=str(e)), 400
+    # Not cached: labels also change in other processes (other annotators' servers,
+    # meta_data.py), and the count is an index scan
+    return jsonify(count=count_images(get_db(), **filters))
+
 if __name__ == '__main__':
+    init_app()
     app.run(debug=True, port=5001)
 
@@ -0,0 +1,79 @@
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+# Page latency of /get_images and /count_images for catalogs of different sizes,
+# measured through Flask's test client against freshly generated databases.
+# Also times the old approach (parse images.json, slice a page) for reference.
+
+# === Configuration ===
+CATALOG_SIZES = [10_000, 100_000, 1_000_000]
+PAGE_SIZE = 100
+REPEATS = 20
+LOW_FRACTION = 0.1  # fraction of images labeled 'low'
+
+def build_catalog(db_path, json_path, size):
+    random.seed(0)
+    rows = [(i, f"/hr_images/{i:08d}.jpg", 'low' if random.random() < LOW_FRACTION else None, f"{i:08d}.jpg")
+            for i in range(1, size + 1)]
+    conn = connect(db_path)
+    init_db(conn)
+    with conn:
+        conn.executemany("INSERT INTO images (id, url, quality, filename) VALUES (?, ?, ?, ?)", rows)
+    conn.close()
+    with open(json_path, 'w') as f:
+        json.dump([{'id': i, 'url': url, 'quality': quality} for i, url, quality, _ in rows], f, indent=4)
+
+def timed(fn):
+    # Median milliseconds over REPEATS calls
+    times = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return sorted(times)[len(times) // 2]
+
+def legacy_page(json_path, page):
+    with open(json_path, 'r') as f:
+        images = json.load(f)
+    start = (page - 1) * PAGE_SIZE
+    return images[start:start + PAGE_SIZE]
+
+if __name__ == "__main__":
+    work_dir = tempfile.mkdtemp()
+    tool_dir = os.path.dirname(os.path.abspath(__file__))
+    sys.path.append(tool_dir)
+    import app as review_app  # each catalog below gets its own database
+    from label_store import connect, init_db
+    client = review_app.app.test_client()
+
+    print(f"{'entries':>10} {'first page':>11} {'last page':>10} {'last (offset)':>14} "
+          f"{'unlabeled':>10} {'name range':>11} {'count':>8} {'legacy json':>12}   (median ms)")
+    for size in CATALOG_SIZES:
+        db_path = os.path.join(work_dir, f"images_{size}.db")
+        json_path = os.path.join(work_dir, f"images_{size}.json")
+        build_catalog(db_path, json_path, size)
+        review_app.DB_FILE = db_path
+
+        last_page = size // PAGE_SIZE
+        last_after = size - PAGE_SIZE
+        last_name = f"{last_after:08d}.jpg"
+        mid = f"{size // 2:08d}.jpg"
+        results = [
+            timed(lambda: client.get(f"/get_images?after_id=0&limit={PAGE_SIZE}")),
+            timed(lambda: client.get(f"/get_images?after_id={last_after}&limit={PAGE_SIZE}")),
+            timed(lambda: client.get(f"/get_images?page={last_page}&limit={PAGE_SIZE}")),
+            timed(lambda: client.get(f"/get_images?after_id={last_after - 5 * PAGE_SIZE}&limit={PAGE_SIZE}&quality=unlabeled")),
+            timed(lambda: client.get(f"/get_images?after_id={last_after}&after_filename={last_name}"
+                                     f"&limit={PAGE_SIZE}&filename_from={mid}")),
+            timed(lambda: client.get("/count_images?quality=low")),
+        ]
+        legacy = timed(lambda: legacy_page(json_path, last_page))
+        # Sanity check: the keyset and offset routes return the same last page
+        assert client.get(f"/get_images?after_id={last_after}&limit={PAGE_SIZE}").json == \
+            client.get(f"/get_images?page={last_page}&limit={PAGE_SIZE}").json
+        print(f"{size:>10} " + " ".join(f"{value:>{width}.2f}" for value, width in zip(results, [11, 10, 14, 10, 11, 8]))
+              + f" {legacy:>12.1f}")
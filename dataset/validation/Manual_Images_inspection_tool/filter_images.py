@@ -1,9 +1,162 @@
+import errno
 import json
 import os
-import shutil  # For moving files
+import shutil  # For moving files across filesystems
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from tqdm import tqdm  # For progress bars (requires pip install tqdm)
 
-def filter_low_quality_images(json_file_path, image_base_dir, low_quality_dest_dir, action='move'):
+# Files are processed in batches on a thread pool, so on network filesystems many
+# per-file round-trips are in flight at once. Existence checks are done in memory
+# against one os.scandir listing of each directory instead of one stat per file.
+#
+# Every move / delete is appended to a JSONL manifest ({"op", "src", "dst"}) by the
+# thread doing it, one flushed line per file; moves are recorded just before the rename,
+# so a crash never leaves a moved file out of the manifest. An interrupted run can
+# simply be started again (files already moved are no longer in the base directory),
+# and action 'undo' moves the files listed in the manifest back (skipping records whose
+# file is not at its destination, e.g. a move that failed or never ran).
+
+def scan_names(directory):
+    """Names of the regular files in `directory` (empty if it doesn't exist)."""
+    try:
+        with os.scandir(directory) as entries:
+            return {entry.name for entry in entries if entry.is_file()}
+    except FileNotFoundError:
+        return set()
+
+def same_filesystem(path_a, path_b):
+    return os.stat(path_a).st_dev == os.stat(path_b).st_dev
+
+def batched(items, batch_size):
+    for start in range(0, len(items), batch_size):
+        yield items[start:start + batch_size]
+
+class ManifestWriter:
+    """Appends manifest records from the worker threads, one flushed line per record."""
+
+    def __init__(self, path):
+        self._file = open(path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def write(self, record):
+        with self._lock:
+            self._file.write(json.dumps(record) + '\n')
+            self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+def move_file(src, dst):
+    # One metadata operation on the same filesystem; copy + delete across filesystems
+    try:
+        os.rename(src, dst)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        shutil.move(src, dst)
+
+def _move_batch(pairs, manifest=None):
+    # Returns (files moved, errors) for a batch of (src, dst) paths
+    moved, errors = 0, []
+    for src, dst in pairs:
+        try:
+            if manifest is not None:
+                manifest.write({'op': 'move', 'src': os.path.abspath(src), 'dst': os.path.abspath(dst)})
+            move_file(src, dst)
+            moved += 1
+        except Exception as e:
+            errors.append((os.path.basename(src), e))
+    return moved, errors
+
+def _delete_batch(paths, manifest=None):
+    deleted, errors = 0, []
+    for path in paths:
+        try:
+            os.remove(path)
+            deleted += 1
+            if manifest is not None:
+                manifest.write({'op': 'delete', 'src': os.path.abspath(path), 'dst': None})
+        except Exception as e:
+            errors.append((os.path.basename(path), e))
+    return deleted, errors
+
+def _total_bytes(paths, num_workers):
+    def size(path):
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+    with ThreadPoolExecutor(max_workers=num_workers) as pool:
+        return sum(pool.map(size, paths, chunksize=256))
+
+def run_batches(batches, worker, desc, manifest_path, num_workers):
+    """
+    Run worker(batch, manifest) over the batches on a thread pool; the worker appends a
+    record to the manifest (None when manifest_path is None) for every file it handles.
+    Returns (number of files handled, errors).
+    """
+    done, all_errors = 0, []
+    manifest = ManifestWriter(manifest_path) if manifest_path else None
+    try:
+        with ThreadPoolExecutor(max_workers=num_workers) as pool:
+            futures = [pool.submit(worker, batch, manifest) for batch in batches]
+            for future in tqdm(as_completed(futures), total=len(futures), desc=desc):
+                count, errors = future.result()
+                done += count
+                all_errors.extend(errors)
+    finally:
+        if manifest is not None:
+            manifest.close()
+    for name, e in all_errors:
+        print(f"Error processing file '{name}': {e}")
+    return done, all_errors
+
+def undo_from_manifest(manifest_path, num_workers=16, batch_size=256, dry_run=False):
+    """
+    Move the files recorded in a manifest back to where they came from. Deletions
+    cannot be undone and are only counted.
+    """
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            records = [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        print(f"Error: Manifest file not found at '{manifest_path}'.")
+        return
+
+    # A move retried after a failure is recorded again; restore each file once
+    moves = list(dict.fromkeys((record['dst'], record['src']) for record in records if record['op'] == 'move'))
+    num_deleted = sum(record['op'] == 'delete' for record in records)
+    if num_deleted:
+        print(f"Warning: {num_deleted} files in the manifest were deleted and cannot be restored.")
+    # Only restore files that are still at their destination and whose original name is free
+    present = {}
+    for dst, src in moves:
+        directory = os.path.dirname(dst)
+        if directory not in present:
+            present[directory] = scan_names(directory)
+    originals = {}
+    pairs = []
+    for dst, src in moves:
+        directory = os.path.dirname(src)
+        if directory not in originals:
+            originals[directory] = scan_names(directory)
+        if os.path.basename(dst) in present[os.path.dirname(dst)] and os.path.basename(src) not in originals[directory]:
+            pairs.append((dst, src))
+    print(f"{len(pairs)} of {len(moves)} moved files can be restored.")
+    if dry_run or not pairs:
+        return
+
+    # Each file is renamed back, or copied back when it moved across filesystems
+    restored, errors = run_batches(list(batched(pairs, batch_size)), _move_batch,
+                                   "Restoring files", None, num_workers)
+    print(f"\nUndo completed. Restored {restored} files, {len(errors)} errors occurred.")
+    if not errors:
+        os.replace(manifest_path, f"{manifest_path}.undone")
+        print(f"Manifest renamed to '{manifest_path}.undone'.")
+
+def filter_low_quality_images(json_file_path, image_base_dir, low_quality_dest_dir, action='move',
+                              manifest_path=None, dry_run=False, num_workers=16, batch_size=256):
     """
     Filter images marked as 'low' quality based on JSON metadata file.
 
@@ -13,6 +166,10 @@ def filter_low_quality_images(json_file_path, image_base_dir, low_quality_dest_d
         low_quality_dest_dir (str): Destination directory for low quality images (only needed when action='move').
         action (str): Operation to perform: 'move' (move), 'list' (list only), 'delete' (delete, use with caution!).
                       Default is 'move'.
+        manifest_path (str): JSONL file every move / delete is appended to (None disables it).
+        dry_run (bool): Only report how many files and bytes would be moved or deleted.
+        num_workers (int): Threads running batches concurrently.
+        batch_size (int): Files per batch.
     """
 
     # --- Safety checks ---
@@ -22,7 +179,7 @@ def filter_low_quality_images(json_file_path, image_base_dir, low_quality_dest_d
     if action == 'move' and not low_quality_dest_dir:
         print("Error: 'low_quality_dest_dir' must be provided when action is 'move'.")
         return
-    if action == 'delete':
+    if action == 'delete' and not dry_run:
         confirm = input(f"Warning: Action 'delete' will permanently remove files from '{image_base_dir}'.\n"
                        f"Are you sure you want to continue? (Type 'yes' to confirm): ")
         if confirm.lower() != 'yes':
@@ -46,6 +203,8 @@ def filter_low_quality_images(json_file_path, image_base_dir, low_quality_dest_d
         return
 
     # 2. Identify low quality files and build paths
+    print(f"Listing files in '{image_base_dir}'...")
+    files_in_dir = scan_names(image_base_dir)
     low_quality_files_to_process = []
     low_quality_filenames_in_json = []
     print("Scanning metadata for low quality images...")
@@ -65,17 +224,14 @@ def filter_low_quality_images(json_file_path, image_base_dir, low_quality_dest_d
             if not filename:
                 # print(f"Warning: Cannot extract filename from URL '{url}' (ID: {entry.get('id', 'N/A')}).")
                 continue  # Skip entries where filename cannot be extracted
-                
-            low_quality_filenames_in_json.append(filename)  # Record filenames marked in JSON
 
-            # Build full actual path of the file
-            full_image_path = os.path.join(image_base_dir, filename)
+            low_quality_filenames_in_json.append(filename)  # Record filenames marked in JSON
 
-            # Check if file actually exists
-            if os.path.isfile(full_image_path):
-                low_quality_files_to_process.append(full_image_path)
+            # Check if file actually exists (in memory, against the directory listing)
+            if filename in files_in_dir:
+                low_quality_files_to_process.append(os.path.join(image_base_dir, filename))
             # else:
-            #     # File marked as low in JSON but doesn't exist in actual folder, print warning (optional)
+            #     # File marked as low in JSON but doesn't exist in actual folder (or was already moved by an earlier run)
             #     print(f"Warning: File '{filename}' marked as low quality in JSON not found in directory '{image_base_dir}'.")
 
     num_json_low = len(low_quality_filenames_in_json)
@@ -94,37 +250,46 @@ def filter_low_quality_images(json_file_path, image_base_dir, low_quality_dest_d
             print(os.path.basename(file_path))
 
     elif action == 'move':
-        print(f"\nPreparing to move {num_files_found} low quality files to '{low_quality_dest_dir}'...")
         os.makedirs(low_quality_dest_dir, exist_ok=True)  # Ensure destination directory exists
-        moved_count = 0
-        error_count = 0
-        for file_path in tqdm(low_quality_files_to_process, desc="Moving files"):
-            try:
-                destination_path = os.path.join(low_quality_dest_dir, os.path.basename(file_path))
-                # Avoid overwriting files that already exist in destination folder
-                if not os.path.exists(destination_path):
-                    shutil.move(file_path, destination_path)
-                    moved_count += 1
-                else:
-                    print(f"Skipped: File '{os.path.basename(file_path)}' already exists in destination directory.")
-                    # If you want to overwrite, remove the if not os.path.exists(...) check
-            except Exception as e:
-                print(f"\nError moving file '{os.path.basename(file_path)}': {e}")
-                error_count += 1
-        print(f"\nMove operation completed. Successfully moved {moved_count} files, {error_count} errors occurred.")
+        # Avoid overwriting files that already exist in destination folder
+        files_in_dest = scan_names(low_quality_dest_dir)
+        pairs = []
+        for file_path in low_quality_files_to_process:
+            if os.path.basename(file_path) in files_in_dest:
+                print(f"Skipped: File '{os.path.basename(file_path)}' already exists in destination directory.")
+            else:
+                pairs.append((file_path, os.path.join(low_quality_dest_dir, os.path.basename(file_path))))
+        if not pairs:
+            print("No low quality image files left to move.")
+            return
+
+        if dry_run:
+            use_rename = same_filesystem(image_base_dir, low_quality_dest_dir)
+            total_bytes = _total_bytes([src for src, _ in pairs], num_workers)
+            print(f"\nDry run: would move {len(pairs)} files ({total_bytes / 1024 ** 3:.2f} GiB) to "
+                  f"'{low_quality_dest_dir}' by {'rename' if use_rename else 'copy + delete'}; "
+                  f"{num_files_found - len(pairs)} skipped.")
+            return
+
+        print(f"\nPreparing to move {len(pairs)} low quality files to '{low_quality_dest_dir}'...")
+        moved_count, errors = run_batches(list(batched(pairs, batch_size)), _move_batch,
+                                          "Moving files", manifest_path, num_workers)
+        print(f"\nMove operation completed. Successfully moved {moved_count} files, {len(errors)} errors occurred.")
 
     elif action == 'delete':
+        if dry_run:
+            total_bytes = _total_bytes(low_quality_files_to_process, num_workers)
+            print(f"\nDry run: would delete {num_files_found} files ({total_bytes / 1024 ** 3:.2f} GiB) "
+                  f"from '{image_base_dir}'.")
+            return
+
         print(f"\nPreparing to delete {num_files_found} low quality files from '{image_base_dir}'...")
-        deleted_count = 0
-        error_count = 0
-        for file_path in tqdm(low_quality_files_to_process, desc="Deleting files"):
-            try:
-                os.remove(file_path)
-                deleted_count += 1
-            except Exception as e:
-                print(f"\nError deleting file '{os.path.basename(file_path)}': {e}")
-                error_count += 1
-        print(f"\nDelete operation completed. Successfully deleted {deleted_count} files, {error_count} errors occurred.")
+        deleted_count, errors = run_batches(list(batched(low_quality_files_to_process, batch_size)), _delete_batch,
+                                            "Deleting files", manifest_path, num_workers)
+        print(f"\nDelete operation completed. Successfully deleted {deleted_count} files, {len(errors)} errors occurred.")
+
+    if manifest_path:
+        print(f"Manifest of the operations appended to '{manifest_path}'.")
 
 
 # --- Configuration Section ---
@@ -140,6 +305,7 @@ if __name__ == "__main__":
     #    'move'   - Move low quality images to the 'LOW_QUALITY_FOLDER' below (recommended, safest)
     #    'list'   - Only print the names of low quality image files found, don't move or delete
     #    'delete' - **Permanently delete** low quality images (please be very careful!)
+    #    'undo'   - Move the files recorded in MANIFEST_FILE back to where they came from
     ACTION_TO_PERFORM = 'move'
 
     # 4. If ACTION_TO_PERFORM = 'move', set the destination folder path
@@ -147,10 +313,28 @@ if __name__ == "__main__":
     LOW_QUALITY_FOLDER = ''
     # Example: LOW_QUALITY_FOLDER = '/path/to/separate/low_quality_storage'
 
+    # 5. Manifest of moves / deletes (used by 'undo'); re-running after an
+    #    interruption resumes and keeps appending to it
+    MANIFEST_FILE = 'filter_manifest.jsonl'
+
+    # 6. Set DRY_RUN = True to only report how many files / bytes would be moved or deleted
+    DRY_RUN = False
+
+    # 7. Concurrency: files per batch and batches in flight (raise on network filesystems)
+    BATCH_SIZE = 256
+    NUM_WORKERS = 16
+
     # --- Run processing function ---
-    filter_low_quality_images(
-        json_file_path=JSON_FILE,
-        image_base_dir=IMAGE_FOLDER,
-        low_quality_dest_dir=LOW_QUALITY_FOLDER if ACTION_TO_PERFORM == 'move' else None,
-        action=ACTION_TO_PERFORM
-    )
\ No newline at end of file
+    if ACTION_TO_PERFORM == 'undo':
+        undo_from_manifest(MANIFEST_FILE, num_workers=NUM_WORKERS, batch_size=BATCH_SIZE, dry_run=DRY_RUN)
+    else:
+        filter_low_quality_images(
+            json_file_path=JSON_FILE,
+            image_base_dir=IMAGE_FOLDER,
+            low_quality_dest_dir=LOW_QUALITY_FOLDER if ACTION_TO_PERFORM == 'move' else None,
+            action=ACTION_TO_PERFORM,
+            manifest_path=MANIFEST_FILE,
+            dry_run=DRY_RUN,
+            num_workers=NUM_WORKERS,
+            batch_size=BATCH_SIZE
+        )
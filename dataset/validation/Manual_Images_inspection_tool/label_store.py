@@ -0,0 +1,191 @@
+import json
+import os
+import sqlite3
+
+# SQLite label store for the inspection app.
+#
+# One row per image (id, url, quality) in a WAL-mode database: readers never block the
+# writer, and every label update is its own single-row transaction, so concurrent
+# annotators cannot overwrite each other's labels the way rewriting images.json did.
+# import_json / export_json convert to and from the images.json format used by
+# filter_images.py (meta_data.py now syncs the store with the images directory directly).
+#
+# Pages are read with keyset pagination (WHERE id > after_id ORDER BY id LIMIT n), so a
+# page costs the same at the start and at the end of a million-image catalog. With a
+# filename range, pages are ordered by (filename, id) instead so they can walk the
+# filename index; the quality filter is served by the (quality, id) index.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    id INTEGER PRIMARY KEY,
+    url TEXT NOT NULL,
+    quality TEXT,
+    filename TEXT,
+    width INTEGER,
+    height INTEGER,
+    format TEXT
+);
+CREATE INDEX IF NOT EXISTS images_quality ON images (quality, id);
+"""
+
+# Columns added after the first version of the schema, added to older databases by init_db
+ADDED_COLUMNS = {'filename': 'TEXT', 'width': 'INTEGER', 'height': 'INTEGER', 'format': 'TEXT'}
+
+# Created after the migration below, since older databases lack the column
+FILENAME_INDEX = "CREATE INDEX IF NOT EXISTS images_filename ON images (filename)"
+
+# Values of the 'quality' filter; 'unlabeled' selects images without a label
+QUALITY_FILTERS = ('unlabeled', 'low', 'high')
+
+
+def _filename(url):
+    return url.rsplit('/', 1)[-1]
+
+
+def connect(db_path):
+    """Open a connection (cheap enough to do per request; call init_db once per database)."""
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA synchronous=NORMAL")  # durable at checkpoints, safe with WAL
+    return conn
+
+
+def init_db(conn):
+    """Switch the database to WAL journaling and create or migrate the schema."""
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+
+    # Databases created by an older version: add the missing columns and fill filename
+    columns = [row['name'] for row in conn.execute("PRAGMA table_info(images)")]
+    with conn:
+        for column, column_type in ADDED_COLUMNS.items():
+            if column not in columns:
+                conn.execute(f"ALTER TABLE images ADD COLUMN {column} {column_type}")
+    with conn:
+        rows = conn.execute("SELECT id, url FROM images WHERE filename IS NULL").fetchall()
+        conn.executemany("UPDATE images SET filename = ? WHERE id = ?",
+                         ((_filename(row['url']), row['id']) for row in rows))
+    conn.execute(FILENAME_INDEX)
+
+
+def set_quality(conn, image_id, quality):
+    """Set one image's label (None clears it). Returns False if the id is unknown."""
+    with conn:
+        cursor = conn.execute("UPDATE images SET quality = ? WHERE id = ?", (quality, image_id))
+    return cursor.rowcount == 1
+
+
+def _where(quality=None, filename_from=None, filename_to=None, after_id=None, after_filename=None):
+    # SQL WHERE clause and parameters for the page / count filters
+    clauses, params = [], []
+    if quality == 'unlabeled':
+        clauses.append("quality IS NULL")
+    elif quality is not None:
+        clauses.append("quality = ?")
+        params.append(quality)
+    by_filename = bool(filename_from or filename_to)
+    if by_filename and after_id is not None:
+        # Fold the cursor into the range's lower bound so the index search starts at it
+        after_filename = after_filename or ''
+        filename_from = max(filename_from or '', after_filename)
+        clauses.append("(filename > ? OR id > ?)")
+        params.extend([after_filename, after_id])
+    elif after_id is not None:
+        clauses.append("id > ?")
+        params.append(after_id)
+    if filename_from:
+        clauses.append("filename >= ?")
+        params.append(filename_from)
+    if filename_to:
+        clauses.append("filename <= ?")
+        params.append(filename_to)
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+
+def get_page(conn, limit, after_id=None, after_filename=None, offset=None, quality=None,
+             filename_from=None, filename_to=None):
+    """
+    Up to `limit` images matching the filters, in id order, or in (filename, id) order
+    when a filename range is given.
+
+    Args:
+        after_id / after_filename: Keyset cursor, the id and filename of the last image
+                                   of the previous page (after_filename is only used
+                                   with a filename range).
+        offset (int): Skip this many matching images instead (page jumps; cost grows
+                      with the offset, so prefer the cursor).
+        quality (str): 'unlabeled', 'low' or 'high'.
+        filename_from / filename_to (str): Inclusive filename range.
+    """
+    where, params = _where(quality, filename_from, filename_to, after_id, after_filename)
+    order = "filename, id" if filename_from or filename_to else "id"
+    sql = f"SELECT id, url, quality, filename FROM images{where} ORDER BY {order} LIMIT ?"
+    params.append(limit)
+    if offset:
+        sql += " OFFSET ?"
+        params.append(offset)
+    return [dict(row) for row in conn.execute(sql, params)]
+
+
+def count_images(conn, quality=None, filename_from=None, filename_to=None):
+    where, params = _where(quality, filename_from, filename_to)
+    return conn.execute(f"SELECT COUNT(*) FROM images{where}", params).fetchone()[0]
+
+
+def import_json(conn, json_path, overwrite_labels=False):
+    """
+    Load images.json into the store. Entries are upserted by id, so re-importing
+    updates urls without duplicating rows. Returns the number of entries.
+
+    A label from the JSON only fills images that have none in the store, so importing
+    a stale or regenerated images.json never reverts newer labels; overwrite_labels=True
+    makes the JSON labels win instead.
+    """
+    with open(json_path, 'r', encoding='utf-8') as f:
+        images = json.load(f)
+    quality = "excluded.quality" if overwrite_labels else "COALESCE(images.quality, excluded.quality)"
+    with conn:
+        conn.executemany(
+            "INSERT INTO images (id, url, quality, filename) VALUES (:id, :url, :quality, :filename) "
+            f"ON CONFLICT(id) DO UPDATE SET url = excluded.url, quality = {quality}, "
+            "filename = excluded.filename",
+            ({'id': img['id'], 'url': img['url'], 'quality': img.get('quality'),
+              'filename': _filename(img['url'])} for img in images),
+        )
+    return len(images)
+
+
+def export_json(conn, json_path):
+    """Write the store in the images.json format (atomically). Returns the number of entries."""
+    images = [dict(row) for row in conn.execute("SELECT id, url, quality FROM images ORDER BY id")]
+    tmp_path = f"{json_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(images, f, indent=4)
+    os.replace(tmp_path, json_path)
+    return len(images)
+
+
+# --- Configuration Section ---
+if __name__ == "__main__":
+    DB_FILE = 'images.db'
+    JSON_FILE = 'images.json'
+
+    # 'import' - load JSON_FILE (e.g. an older images.json) into DB_FILE
+    # 'export' - write DB_FILE's labels to JSON_FILE (e.g. before running filter_images.py)
+    ACTION_TO_PERFORM = 'export'
+
+    # On import, replace labels already in DB_FILE with the ones in JSON_FILE (by default
+    # the JSON only fills images that are still unlabeled in the database)
+    OVERWRITE_LABELS = False
+
+    conn = connect(DB_FILE)
+    init_db(conn)
+    if ACTION_TO_PERFORM == 'import':
+        count = import_json(conn, JSON_FILE, overwrite_labels=OVERWRITE_LABELS)
+        print(f"Imported {count} entries from '{JSON_FILE}' into '{DB_FILE}'.")
+    elif ACTION_TO_PERFORM == 'export':
+        count = export_json(conn, JSON_FILE)
+        print(f"Exported {count} entries from '{DB_FILE}' to '{JSON_FILE}'.")
+    else:
+        print(f"Error: Invalid action '{ACTION_TO_PERFORM}'. Please choose 'import' or 'export'.")
+    conn.close()
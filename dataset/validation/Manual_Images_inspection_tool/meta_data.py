@@ -1,25 +1,98 @@
 import os
-import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from label_store import connect, init_db, import_json, export_json
+
+# Incrementally sync the image catalog in the label store with the images directory:
+#   * the directory is streamed with os.scandir,
+#   * files not yet in the catalog are added with new ids after the current maximum
+#     (in filename order) and no label,
+#   * files already in the catalog keep their id and label,
+#   * catalog entries whose file has vanished are dropped,
+#   * width, height and format come from the image header only (PIL opens files lazily
+#     and does not decode pixels until asked), probed on a thread pool.
 
 # Path to your images directory (adjust this path accordingly)
 images_dir = ''
 
+# Label store used by app.py, and optionally images.json for filter_images.py ('' skips it)
+db_file = 'images.db'
+json_file = 'images.json'
+
 # List all image files (you can filter by file extension)
 allowed_extensions = ('.jpg', '.jpeg', '.png', '.gif')
-files = [f for f in os.listdir(images_dir) if f.lower().endswith(allowed_extensions)]
-
-# Build a list of image metadata dictionaries
-images_metadata = []
-for idx, filename in enumerate(sorted(files), start=1):
-    image_path = f"/hr_images/{filename}"  # This URL will work with Flask's static files
-    images_metadata.append({
-        "id": idx,
-        "url": image_path,
-        "quality": None  # Initially, no quality decision has been made
-    })
-
-# Save the metadata to a JSON file
-with open('images.json', 'w') as json_file:
-    json.dump(images_metadata, json_file, indent=4)
-
-print(f"Generated JSON file with {len(images_metadata)} entries.")
+
+probe_workers = 32
+insert_batch_size = 10000
+
+def scan_filenames(directory):
+    # Stream the directory instead of materializing and sorting os.listdir up front
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name.lower().endswith(allowed_extensions) and entry.is_file():
+                yield entry.name
+
+def probe_header(filename):
+    # (width, height, format) from the header, or Nones if the file can't be parsed
+    try:
+        with Image.open(os.path.join(images_dir, filename)) as im:
+            return im.width, im.height, im.format
+    except Exception as e:
+        print(f"Warning: cannot read header of '{filename}': {e}")
+        return None, None, None
+
+def probe_all(rows):
+    # rows: (id, filename) pairs; yields (width, height, format, id) update tuples
+    with ThreadPoolExecutor(max_workers=probe_workers) as pool:
+        for (image_id, _), (width, height, fmt) in zip(rows, pool.map(probe_header, (name for _, name in rows))):
+            yield width, height, fmt, image_id
+
+def main():
+    start = time.perf_counter()
+    is_new = not os.path.exists(db_file)
+    conn = connect(db_file)
+    init_db(conn)
+    if is_new and json_file and os.path.exists(json_file):
+        # First run against an existing images.json: keep its ids and labels, which
+        # the export at the end would otherwise overwrite with an unlabeled catalog
+        print(f"Imported {import_json(conn, json_file)} entries from '{json_file}' into '{db_file}'.")
+
+    catalog = {row['filename']: row['id'] for row in conn.execute("SELECT id, filename FROM images")}
+    on_disk = set(scan_filenames(images_dir))
+    print(f"Scanned {len(on_disk)} image files in {time.perf_counter() - start:.1f}s.")
+
+    # Drop entries whose file is gone
+    vanished = [(catalog[name],) for name in catalog.keys() - on_disk]
+    with conn:
+        conn.executemany("DELETE FROM images WHERE id = ?", vanished)
+
+    # Add new files after the current maximum id
+    next_id = (conn.execute("SELECT MAX(id) FROM images").fetchone()[0] or 0) + 1
+    new_rows = [(image_id, name) for image_id, name in enumerate(sorted(on_disk - catalog.keys()), start=next_id)]
+    with conn:
+        conn.executemany("INSERT INTO images (id, url, quality, filename) VALUES (?, ?, NULL, ?)",
+                         ((image_id, f"/hr_images/{name}", name) for image_id, name in new_rows))
+
+    # Probe headers of every entry without dimensions (new files and entries from older catalogs)
+    missing = [(row['id'], row['filename']) for row in
+               conn.execute("SELECT id, filename FROM images WHERE width IS NULL ORDER BY id")]
+    for batch_start in range(0, len(missing), insert_batch_size):
+        batch = missing[batch_start:batch_start + insert_batch_size]
+        with conn:
+            conn.executemany("UPDATE images SET width = ?, height = ?, format = ? WHERE id = ?", probe_all(batch))
+        print(f"Probed {batch_start + len(batch)}/{len(missing)} headers")
+
+    total = conn.execute("SELECT COUNT(*) FROM images").fetchone()[0]
+    print(f"Catalog has {total} entries: {len(new_rows)} added, {len(vanished)} removed, "
+          f"{len(missing)} headers probed in {time.perf_counter() - start:.1f}s.")
+
+    if json_file:
+        export_json(conn, json_file)
+        print(f"Exported the catalog to '{json_file}'.")
+    conn.close()
+
+if __name__ == "__main__":
+    main()
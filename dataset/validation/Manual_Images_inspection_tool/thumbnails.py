@@ -0,0 +1,114 @@
+import hashlib
+import os
+import threading
+import uuid
+
+from PIL import Image
+
+# On-disk thumbnail cache for the review grid.
+#
+# A thumbnail is identified by the source file's name, mtime and size plus the requested
+# size and format, so editing or replacing an original simply produces a new key (the
+# stale thumbnail ages out). The key doubles as the HTTP ETag. Thumbnails are written
+# to a temporary file and renamed into place; serving one refreshes its mtime, which
+# eviction uses as the LRU order once the cache grows past max_bytes.
+
+# Longest-side sizes that are generated; requests are rounded up to one of these so a
+# client cannot fill the cache with arbitrary sizes
+SIZES = (160, 320, 640, 1280)
+FORMATS = {'webp': ('WEBP', 'image/webp'), 'jpeg': ('JPEG', 'image/jpeg')}
+
+
+def thumbnail_size(requested):
+    for size in SIZES:
+        if requested <= size:
+            return size
+    return SIZES[-1]
+
+
+class ThumbnailCache:
+    def __init__(self, cache_dir, max_bytes=5 * 1024 ** 3, quality=80):
+        """
+        Args:
+            cache_dir (str): Directory holding the thumbnails (created if missing).
+            max_bytes (int): Size budget; least recently served thumbnails are evicted
+                             down to 90% of it when exceeded.
+            quality (int): WebP/JPEG encoder quality.
+        """
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_bytes = max_bytes
+        self.quality = quality
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._size = sum(size for _, _, size in self._scan())
+
+    def _scan(self):
+        # (path, mtime, size) of every cached thumbnail
+        for shard in os.scandir(self.cache_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith('.tmp'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                yield entry.path, stat.st_mtime, stat.st_size
+
+    @staticmethod
+    def key(source_path, source_stat, size, fmt):
+        """Cache key / ETag of a thumbnail of source_path as it is on disk now."""
+        identity = f"{os.path.abspath(source_path)}\0{source_stat.st_mtime_ns}\0{source_stat.st_size}\0{size}\0{fmt}"
+        return hashlib.sha256(identity.encode('utf-8')).hexdigest()
+
+    def path(self, key, fmt):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.{fmt}")
+
+    def get(self, source_path, source_stat, size, fmt):
+        """
+        Return (path, key) of the thumbnail, generating it on a miss.
+        """
+        key = self.key(source_path, source_stat, size, fmt)
+        thumb_path = self.path(key, fmt)
+        try:
+            os.utime(thumb_path)  # mark as recently used
+            return thumb_path, key
+        except FileNotFoundError:
+            pass
+
+        with Image.open(source_path) as im:
+            im.draft('RGB', (size, size))  # JPEG: decode at reduced size directly
+            im = im.convert('RGB')
+            im.thumbnail((size, size), Image.LANCZOS)
+            os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+            tmp_path = f"{thumb_path}.{uuid.uuid4().hex}.tmp"
+            im.save(tmp_path, FORMATS[fmt][0], quality=self.quality)
+        os.replace(tmp_path, thumb_path)
+
+        with self._lock:
+            self._size += os.path.getsize(thumb_path)
+        if self._size > self.max_bytes:
+            self.evict(keep=thumb_path)
+        return thumb_path, key
+
+    def evict(self, target_bytes=None, keep=None):
+        # Delete least recently served thumbnails until the cache is below target_bytes,
+        # never the one at `keep` (about to be served)
+        if target_bytes is None:
+            target_bytes = int(self.max_bytes * 0.9)
+        with self._lock:
+            entries = sorted(self._scan(), key=lambda item: item[1])
+            total = sum(size for _, _, size in entries)
+            for path, _, size in entries:
+                if total <= target_bytes:
+                    break
+                if path == keep:
+                    continue
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+            self._size = total
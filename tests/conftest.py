@@ -0,0 +1,46 @@
+import os
+import sys
+import threading
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# The pipeline scripts import their shared modules by putting their own directories
+# on sys.path; the tests do the same for every directory holding a module under test.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PREPROCESSING = os.path.join(ROOT, 'dataset', 'preprocessing')
+MODULE_DIRS = [
+    PREPROCESSING,
+    os.path.join(PREPROCESSING, 'images_filtering'),
+    os.path.join(PREPROCESSING, 'images_filtering', 'Laion2b_filteirng'),
+    os.path.join(PREPROCESSING, 'images_filtering', 'Laplacian_Sobel_filtiering'),
+    os.path.join(PREPROCESSING, 'images_filtering', 'Perceptual_dedup'),
+    os.path.join(PREPROCESSING, 'images_scoring'),
+    os.path.join(ROOT, 'dataset', 'validation', 'Manual_Images_inspection_tool'),
+]
+for module_dir in MODULE_DIRS:
+    if module_dir not in sys.path:
+        sys.path.insert(0, module_dir)
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def serve_directory():
+    """Serve directories over HTTP on localhost; serve(directory) returns the base URL."""
+    servers = []
+
+    def serve(directory, handler_class=QuietHandler):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), partial(handler_class, directory=str(directory)))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}"
+
+    yield serve
+    for server in servers:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,119 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+from PIL import Image
+
+from conftest import MODULE_DIRS
+
+TOOL_DIR = MODULE_DIRS[-1]
+
+
+def test_import_creates_no_files(tmp_path):
+    # Importing the app (tests, benchmarks, WSGI servers) must not create images.db or
+    # the thumbnail cache in the working directory
+    code = f"import sys; sys.path.insert(0, {TOOL_DIR!r}); import app"
+    subprocess.run([sys.executable, '-c', code], cwd=tmp_path, check=True)
+    assert os.listdir(tmp_path) == []
+
+
+def test_first_request_sets_up_the_store(tmp_path, monkeypatch):
+    # e.g. flask run or a WSGI server, where init_app() is never called
+    import app as review_app
+
+    json_path = tmp_path / 'images.json'
+    json_path.write_text(json.dumps([{'id': 1, 'url': '/hr_images/a.jpg', 'quality': 'low'},
+                                     {'id': 2, 'url': '/hr_images/b.jpg', 'quality': None}]))
+    monkeypatch.setattr(review_app, 'DB_FILE', str(tmp_path / 'images.db'))
+    monkeypatch.setattr(review_app, 'JSON_FILE', str(json_path))
+    client = review_app.app.test_client()
+
+    response = client.get('/get_images?after_id=0&limit=10')
+    assert response.status_code == 200
+    assert [(image['id'], image['quality']) for image in response.json] == [(1, 'low'), (2, None)]
+    assert client.get('/count_images?quality=low').json == {'count': 1}
+    assert client.post('/update_quality', data={'id': 2, 'quality': 'high'}).json == {'success': True}
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    import app as review_app
+
+    images_dir = tmp_path / 'images'
+    images_dir.mkdir()
+    Image.new('RGB', (800, 600), (200, 100, 50)).save(images_dir / 'a.jpg')
+    json_path = tmp_path / 'images.json'
+    json_path.write_text(json.dumps([{'id': i, 'url': f"/hr_images/{i}.jpg", 'quality': None} for i in range(1, 6)]))
+    monkeypatch.setattr(review_app, 'IMAGES_DIR', str(images_dir))
+    monkeypatch.setattr(review_app, 'DB_FILE', str(tmp_path / 'images.db'))
+    monkeypatch.setattr(review_app, 'JSON_FILE', str(json_path))
+    monkeypatch.setattr(review_app, 'THUMBNAIL_CACHE_DIR', str(tmp_path / 'thumbs'))
+    monkeypatch.setattr(review_app, 'thumbnail_cache', None)
+    monkeypatch.setattr(review_app, 'MAX_PAGE_SIZE', 3)
+    return review_app.app.test_client()
+
+
+def test_init_app_sets_up_eagerly(tmp_path, monkeypatch):
+    import app as review_app
+    from thumbnails import ThumbnailCache
+
+    monkeypatch.setattr(review_app, 'DB_FILE', str(tmp_path / 'images.db'))
+    monkeypatch.setattr(review_app, 'THUMBNAIL_CACHE_DIR', str(tmp_path / 'thumbs'))
+    monkeypatch.setattr(review_app, 'thumbnail_cache', None)
+    review_app.init_app()
+    assert isinstance(review_app.thumbnail_cache, ThumbnailCache)
+    assert os.path.exists(tmp_path / 'images.db')
+    assert os.path.isdir(tmp_path / 'thumbs')
+
+
+def test_thumbnail(client):
+    # The thumbnail cache is opened by the first thumbnail request (no init_app())
+    response = client.get('/thumbs/a.jpg?size=300&format=jpeg')
+    assert response.status_code == 200
+    assert response.mimetype == 'image/jpeg'
+    assert client.get('/thumbs/missing.jpg').status_code == 404
+
+
+@pytest.mark.parametrize('size', ['abc', '', '1.5', '0', '-320'])
+def test_thumbnail_invalid_size(client, size):
+    assert client.get(f'/thumbs/a.jpg?size={size}').status_code == 400
+
+
+def ids(response):
+    assert response.status_code == 200
+    return [image['id'] for image in response.json]
+
+
+def test_page_limit_is_clamped(client):
+    assert ids(client.get('/get_images?after_id=0&limit=100000')) == [1, 2, 3]
+    assert ids(client.get('/get_images?after_id=0&limit=-5')) == [1]
+    assert ids(client.get('/get_images?after_id=0&limit=0')) == [1]
+    assert ids(client.get('/get_images?page=-1&limit=2')) == [1, 2]
+    assert ids(client.get('/get_images?page=2&limit=2')) == [3, 4]
+
+
+@pytest.mark.parametrize('query', ['after_id=abc', 'after_id=', 'after_id=1.5', 'limit=ten', 'page=x'])
+def test_listing_invalid_integers(client, query):
+    response = client.get(f'/get_images?{query}')
+    assert response.status_code == 400
+    assert response.json['success'] is False
+
+
+def test_update_quality_invalid_id(client):
+    assert client.post('/update_quality', data={'id': 'x', 'quality': 'low'}).status_code == 400
+    assert client.post('/update_quality', data={'quality': 'low'}).status_code == 400
+
+
+def test_count_sees_labels_written_by_other_processes(client):
+    import app as review_app
+    from label_store import connect, set_quality
+
+    assert client.get('/count_images?quality=low').json == {'count': 0}
+    # Another annotator's server (or meta_data.py) writes through its own connection
+    conn = connect(review_app.DB_FILE)
+    assert set_quality(conn, 3, 'low')
+    conn.close()
+    assert client.get('/count_images?quality=low').json == {'count': 1}
+    assert client.get('/count_images?quality=unlabeled').json == {'count': 4}
@@ -0,0 +1,163 @@
+import random
+import time
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from batch_scoring import SharedImageEncoding, iter_batch_scores, score_images, verify_shared_encoding
+
+
+class StubQAlign:
+    """
+    Small CPU stand-in for the one-align model with the same call structure:
+    score() preprocesses the images, and its forward pass reaches the vision tower
+    through self.encode_images before a task-specific head turns the features into
+    one score per image.
+    """
+
+    def __init__(self):
+        rng = np.random.default_rng(0)
+        self.projection = rng.normal(size=(3 * 8 * 8, 16))
+        self.heads = {'quality': rng.normal(size=16), 'aesthetics': rng.normal(size=16)}
+        self.encoder_calls = 0
+
+    def preprocess(self, images):
+        # Deterministic like the model's image processor: same images, equal tensors
+        return np.stack([np.asarray(image.convert('RGB').resize((8, 8)), dtype=np.float32) / 255
+                         for image in images])
+
+    def encode_images(self, images):
+        self.encoder_calls += 1
+        return np.tanh(images.reshape(len(images), -1) @ self.projection)
+
+    def score(self, images, task_='aesthetic', input_='image'):
+        features = self.encode_images(self.preprocess(images))
+        return features @ self.heads[task_]
+
+
+class StubWithoutEncoder:
+    def score(self, images, task_='aesthetic', input_='image'):
+        return [float(np.asarray(image).mean()) + (task_ == 'quality') for image in images]
+
+
+def make_images(count, seed=0):
+    rng = np.random.default_rng(seed)
+    return [Image.fromarray(rng.integers(0, 255, (24, 32, 3), dtype=np.uint8)) for _ in range(count)]
+
+
+def test_shared_encoding_encodes_each_batch_once():
+    images = make_images(5)
+    unshared_model = StubQAlign()
+    unshared = score_images(unshared_model, images)
+    assert unshared_model.encoder_calls == 2  # one forward pass per task
+
+    model = StubQAlign()
+    with SharedImageEncoding(model) as shared_encoding:
+        shared = score_images(model, images)
+    assert model.encoder_calls == 1
+    assert (shared_encoding.encodes, shared_encoding.reuses) == (1, 1)
+    assert shared == unshared
+    # The memoized encoder is only installed inside the block
+    assert 'encode_images' not in vars(model)
+
+
+def test_batched_scores_match_the_unshared_path():
+    images = make_images(10, seed=1)
+    urls = [f"https://example.com/{i}.jpg" for i in range(len(images))]
+    loaded = dict(zip(urls, images))
+    items = list(enumerate(urls))
+
+    results = {}
+    for share_encoding in (False, True):
+        model = StubQAlign()
+        results[share_encoding] = list(iter_batch_scores(model, items, loaded.__getitem__, batch_size=4,
+                                                         num_workers=2, share_encoding=share_encoding))
+        # 3 batches (4 + 4 + 2 images), each encoded once per task or once in total
+        assert model.encoder_calls == (3 if share_encoding else 6)
+
+    assert [result[:2] for result in results[True]] == items
+    for (_, _, shared, shared_error), (_, _, unshared, unshared_error) in zip(results[True], results[False]):
+        assert shared_error is None and unshared_error is None
+        assert shared == pytest.approx(unshared, abs=0)
+
+
+def test_a_changed_batch_is_encoded_again():
+    model = StubQAlign()
+    with SharedImageEncoding(model):
+        score_images(model, make_images(3, seed=2))
+        score_images(model, make_images(3, seed=3))
+    assert model.encoder_calls == 2
+
+
+def test_scorers_without_encode_images_fall_back_to_separate_calls():
+    images = make_images(3)
+    model = StubWithoutEncoder()
+    assert not SharedImageEncoding(model).enabled
+    assert score_images(model, images, share_encoding=True) == score_images(model, images)
+    assert verify_shared_encoding(StubQAlign(), images) == 0
+
+
+class RecordingScorer:
+    """Scores an image by its mean pixel value; a batch holding a poison image raises."""
+
+    def __init__(self, poison=()):
+        self.poison = set(poison)
+        self.batches = []
+
+    def score(self, images, task_='aesthetic', input_='image'):
+        names = [image.info['name'] for image in images]
+        self.batches.append((task_, names))
+        if self.poison & set(names):
+            raise RuntimeError(f"cannot score {sorted(self.poison & set(names))}")
+        return [float(np.asarray(image).mean()) + (task_ == 'quality') for image in images]
+
+
+def test_batches_keep_input_order_with_failed_loads_and_a_failing_batch():
+    images = {}
+    for i, image in enumerate(make_images(11, seed=4)):
+        image.info['name'] = f"{i}.jpg"
+        images[f"https://example.com/{i}.jpg"] = image
+    items = [(i * 10, url) for i, url in enumerate(images)]
+    failed_loads = {'https://example.com/2.jpg', 'https://example.com/9.jpg'}
+    rng = random.Random(0)
+
+    def load(url):
+        time.sleep(rng.random() * 0.01)  # loads finish out of order
+        if url in failed_loads:
+            raise IOError(f"404 for {url}")
+        return images[url]
+
+    scorer = RecordingScorer(poison={'6.jpg'})
+    results = list(iter_batch_scores(scorer, items, load, batch_size=4, num_workers=4))
+
+    # One result per input, in input order
+    assert [result[:2] for result in results] == items
+    for index, url, scores, error in results:
+        image = images[url]
+        if url in failed_loads:
+            # A failed load keeps its own slot with its error
+            assert scores is None and isinstance(error, IOError)
+        elif image.info['name'] == '6.jpg':
+            assert scores is None and isinstance(error, RuntimeError)
+        else:
+            assert error is None
+            mean = float(np.asarray(image).mean())
+            assert scores == {'quality': mean + 1, 'aesthetics': mean}
+
+    # Failed loads don't shrink the batches: 4 + 4 loaded images, then the last one. The
+    # second batch holds the poison image and falls back to one call per image.
+    batched = [names for task, names in scorer.batches if task == 'quality' and len(names) > 1]
+    assert batched == [['0.jpg', '1.jpg', '3.jpg', '4.jpg'], ['5.jpg', '6.jpg', '7.jpg', '8.jpg']]
+    singles = [names[0] for task, names in scorer.batches if task == 'quality' and len(names) == 1]
+    assert singles == ['5.jpg', '6.jpg', '7.jpg', '8.jpg', '10.jpg']
+
+
+def test_a_final_batch_of_only_failed_loads():
+    def load(url):
+        raise IOError(url)
+
+    scorer = RecordingScorer()
+    results = list(iter_batch_scores(scorer, [(0, 'a'), (1, 'b')], load, batch_size=4, num_workers=2))
+    assert [(index, url, scores) for index, url, scores, _ in results] == [(0, 'a', None), (1, 'b', None)]
+    assert scorer.batches == []
@@ -0,0 +1,51 @@
+from checkpoint_journal import ACCEPTED, ERROR, REJECTED, CheckpointJournal
+
+
+def test_resume_skips_decided_rows_and_drops_torn_tail(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    journal = CheckpointJournal(path)
+    journal.append(0, ACCEPTED, lap=500.0, flat=False)
+    journal.append(1, REJECTED, lap=5.0, flat=True)
+    journal.close()
+    with open(path, 'ab') as f:
+        f.write(b'{"i": 2, "s": "acc')
+
+    resumed = CheckpointJournal(path)
+    assert resumed.is_done(0) and resumed.is_done(1) and not resumed.is_done(2)
+    resumed.append(2, ACCEPTED)
+    resumed.close()
+    assert CheckpointJournal(path).status == {0: ACCEPTED, 1: REJECTED, 2: ACCEPTED}
+
+
+def test_download_errors_are_retried_on_resume(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    journal = CheckpointJournal(path, retry_stages=('download',), max_attempts=2)
+    journal.append(0, ERROR, stage='download', error='timed out')
+    journal.append(1, ERROR, stage='score', error='cannot identify image file')
+    journal.append(2, ERROR, error='missing url')
+    journal.close()
+
+    resumed = CheckpointJournal(path, retry_stages=('download',), max_attempts=2)
+    assert resumed.retry == {0}
+    assert not resumed.is_done(0)
+    assert resumed.is_done(1) and resumed.is_done(2)
+    # A failure in this run keeps the row done for the rest of the run
+    resumed.append(0, ERROR, stage='download', error='timed out')
+    assert resumed.is_done(0)
+    resumed.close()
+
+    # Second failure reaches max_attempts: the row is no longer retried
+    assert CheckpointJournal(path, retry_stages=('download',), max_attempts=2).retry == set()
+
+
+def test_successful_retry_replaces_the_error(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    journal = CheckpointJournal(path, retry_stages=('download',))
+    journal.append(0, ERROR, stage='download', error='timed out')
+    journal.close()
+
+    resumed = CheckpointJournal(path, retry_stages=('download',))
+    resumed.append(0, ACCEPTED, lap=500.0, flat=False)
+    resumed.close()
+    final = CheckpointJournal(path, retry_stages=('download',))
+    assert final.status == {0: ACCEPTED} and final.retry == set() and final.num_accepted() == 1
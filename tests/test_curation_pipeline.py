@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import filtered_laion2b_error as error_script
+import filtered_laion2b_high_resolution as high_resolution_script
+import filtered_laion2b_pipeline as pipeline_script
+import filtered_laion2b_unknown as unknown_script
+
+NUM_ROWS = 400
+LABELS = ['close-up', 'medium', 'Error', 'error', 'Unknown', 'unknown', 'ERROR', None]
+
+
+@pytest.fixture
+def shard(tmp_path):
+    # Annotated LAION shard: sizes around the 4K and aspect ratio limits (some missing),
+    # every label the error/unknown stages look at, and near-misses like 'ERROR'
+    rng = np.random.default_rng(0)
+    width = rng.choice([2160, 3000, 3840, 4000, 5000, 6000, 7680], NUM_ROWS).astype(float)
+    height = rng.choice([0, 2000, 2160, 2880, 3840, 4000, 6000], NUM_ROWS).astype(float)
+    width[rng.random(NUM_ROWS) < 0.05] = np.nan
+    df = pd.DataFrame({
+        'URL': [f"https://example.com/{i}.jpg" for i in range(NUM_ROWS)],
+        'TEXT': [f"caption {i}" for i in range(NUM_ROWS)],
+        'WIDTH': width,
+        'HEIGHT': height,
+        'aesthetic': rng.random(NUM_ROWS) * 10,
+        'punsafe': rng.random(NUM_ROWS),  # not used by any stage
+        'shot_distance': rng.choice(np.array(LABELS, dtype=object), NUM_ROWS),
+        'style': rng.choice(np.array(LABELS, dtype=object), NUM_ROWS),
+    })
+    path = tmp_path / 'part-00000.parquet'
+    df.to_parquet(path, index=False, row_group_size=64)
+    return df, str(path)
+
+
+def run_chain(df, path, tmp_path, monkeypatch, streaming):
+    # high_resolution -> labels joined back by URL (the annotation step) -> error -> unknown
+    step_dirs = {name: tmp_path / name for name in ('high_resolution', 'annotated', 'error', 'unknown')}
+    for step_dir in step_dirs.values():
+        step_dir.mkdir()
+    monkeypatch.setattr(high_resolution_script, 'streaming', streaming)
+    monkeypatch.setattr(high_resolution_script, 'output_parquet_dir', str(step_dirs['high_resolution']))
+    monkeypatch.setattr(error_script, 'output_parquet_dir', str(step_dirs['error']))
+    monkeypatch.setattr(unknown_script, 'output_parquet_dir', str(step_dirs['unknown']))
+
+    high_resolution_counts, [output] = high_resolution_script.process_shard(path)
+    labels = df[['URL', 'shot_distance', 'style']].rename(columns={'URL': 'url'})
+    annotated = pd.read_parquet(output).merge(labels, on='url', how='left', validate='one_to_one')
+    annotated_path = str(step_dirs['annotated'] / 'part-00000.parquet')
+    annotated.to_parquet(annotated_path, index=False)
+
+    error_counts, [output] = error_script.process_shard(annotated_path)
+    unknown_counts, [output] = unknown_script.process_shard(output)
+    counts = {
+        'total_num': high_resolution_counts['total_num'],
+        'high_resolution_rejected': high_resolution_counts['total_num'] - high_resolution_counts['kept_num'],
+        'error_rejected': error_counts['error_num'],
+        'unknown_rejected': unknown_counts['error_num'],
+        'kept_num': unknown_counts['total_num'] - unknown_counts['error_num'],
+    }
+    return pd.read_parquet(output), counts
+
+
+@pytest.mark.parametrize('streaming', [True, False])
+def test_fused_pipeline_matches_the_chained_scripts(shard, tmp_path, monkeypatch, streaming):
+    df, path = shard
+    expected, expected_counts = run_chain(df, path, tmp_path, monkeypatch, streaming)
+    # The fixture exercises every stage
+    assert all(expected_counts[key] > 0 for key in expected_counts)
+
+    fused_dir = tmp_path / 'fused'
+    fused_dir.mkdir()
+    monkeypatch.setattr(pipeline_script, 'output_parquet_dir', str(fused_dir))
+    counts, [output] = pipeline_script.process_shard(path)
+
+    pd.testing.assert_frame_equal(pd.read_parquet(output), expected)
+    assert counts == expected_counts
@@ -0,0 +1,152 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from filter_engine import (
+    ERROR_COLUMNS, ERROR_LABELS, LAION_HIGH_RESOLUTION_COLUMNS, PD12M_HIGH_RESOLUTION_COLUMNS,
+    UNKNOWN_COLUMNS, UNKNOWN_LABELS, filter_high_resolution, filter_labels, high_resolution_mask,
+    label_mask,
+)
+
+
+# Per-row predicates of the original LAION-2B / PD12M scripts, applied with df.apply(axis=1)
+
+def old_high_resolution(row, width_col, height_col):
+    w = row[width_col]
+    h = row[height_col]
+    aspect_ratio = w / h
+    resolution = h * w
+    tested_side = max(h, w)
+    return bool((resolution >= 3840 * 2160) and (tested_side >= 3840) and (0.6 <= aspect_ratio <= 1.5))
+
+
+def old_high_resolution_keep(df, width_col, height_col):
+    # A zero dimension raised ZeroDivisionError in the original scripts and aborted the
+    # whole shard; the masks reject such rows instead, which is what is compared here
+    def keep(row):
+        try:
+            return old_high_resolution(row, width_col, height_col)
+        except ZeroDivisionError:
+            return False
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return df.apply(keep, axis=1).to_numpy(dtype=bool)
+
+
+def old_error(row):
+    shot_type = row['shot_distance']
+    style = row['style']
+    return not (shot_type == 'Error' or shot_type == 'error' or style == 'Error' or style == 'error')
+
+
+def old_unknown(row):
+    shot_type = row['shot_type']
+    style = row['style']
+    return not (shot_type == 'Unknown' or shot_type == 'unknown' or style == 'Unknown' or style == 'unknown')
+
+
+def old_output(df, keep, columns, aspect_ratio=False):
+    # The original scripts built one dict per kept row and collected them with pd.DataFrame
+    rows = []
+    for _, row in df[keep].iterrows():
+        record = {out: row[col] for out, col in columns.items()}
+        if aspect_ratio:
+            record['aespect_ratio'] = row['width'] / row['height']
+        rows.append(record)
+    return pd.DataFrame(rows)
+
+
+# Boundary sizes around 3840x2160 and the 0.6 / 1.5 aspect ratios, plus missing and zero dimensions
+SIZES = [
+    (3840, 2160), (3840, 2159), (3839, 2161), (2160, 3840), (3840, 2560), (3840, 2561),
+    (3840, 5760), (3840, 6400), (3840, 6401), (5760, 3840), (5761, 3840), (4000, 3000),
+    (0, 2160), (3840, 0), (0, 0), (np.nan, 2160), (3840, np.nan), (np.nan, np.nan),
+]
+LABELS = ['Error', 'error', 'ERROR', 'Unknown', 'unknown', 'UNKNOWN', 'portrait', 'Close-up', None]
+
+
+def resolution_frame(width_col, height_col, url_col, caption_col, extra=None):
+    widths, heights = zip(*SIZES)
+    df = pd.DataFrame({
+        width_col: np.array(widths, dtype=np.float64),
+        height_col: np.array(heights, dtype=np.float64),
+        url_col: [f"https://example.com/{i}.jpg" for i in range(len(SIZES))],
+        caption_col: [f"caption {i}" for i in range(len(SIZES))],
+    })
+    if extra:
+        df[extra] = np.linspace(4.0, 7.0, len(SIZES))
+    return df
+
+
+def label_frame(shot_col, with_aspect_ratio=False):
+    shots, styles = zip(*[(shot, style) for shot in LABELS for style in LABELS])
+    n = len(shots)
+    df = pd.DataFrame({
+        'width': np.arange(3840, 3840 + n),
+        'height': np.full(n, 2160),
+        'url': [f"https://example.com/{i}.jpg" for i in range(n)],
+        'caption': [f"caption {i}" for i in range(n)],
+        'aesthetic_score': np.linspace(4.0, 7.0, n),
+        shot_col: list(shots),
+        'style': list(styles),
+    })
+    if with_aspect_ratio:
+        df['aespect_ratio'] = df['width'] / df['height']
+    return df
+
+
+def assert_same_output(new, old):
+    assert list(new.columns) == list(old.columns)
+    assert new.dtypes.to_dict() == old.dtypes.to_dict()
+    pd.testing.assert_frame_equal(new, old)
+
+
+@pytest.mark.parametrize('width_col, height_col, url_col, caption_col, extra, columns', [
+    ('WIDTH', 'HEIGHT', 'URL', 'TEXT', 'aesthetic', LAION_HIGH_RESOLUTION_COLUMNS),
+    ('width', 'height', 'url', 'caption', None, PD12M_HIGH_RESOLUTION_COLUMNS),
+])
+def test_high_resolution_matches_per_row_filter(width_col, height_col, url_col, caption_col, extra, columns):
+    df = resolution_frame(width_col, height_col, url_col, caption_col, extra)
+    old_keep = old_high_resolution_keep(df, width_col, height_col)
+
+    mask = high_resolution_mask(df[width_col], df[height_col])
+    assert mask.dtype == bool
+    np.testing.assert_array_equal(mask, old_keep)
+    # Aspect ratios of exactly 1.5 and 0.6 pass; 16:9 (1.78) fails even at 3840x2160
+    kept = set(zip(df[width_col][mask], df[height_col][mask]))
+    assert kept == {(3840, 2560), (3840, 2561), (3840, 5760), (3840, 6400), (5760, 3840), (4000, 3000)}
+
+    assert_same_output(filter_high_resolution(df, columns, width_col, height_col),
+                       old_output(df, old_keep, columns))
+
+
+def test_high_resolution_mask_accepts_arrow_columns():
+    pa = pytest.importorskip('pyarrow')
+    widths, heights = zip(*SIZES)
+    table = pa.table({'w': pa.array(widths, from_pandas=True), 'h': pa.array(heights, from_pandas=True)})
+    np.testing.assert_array_equal(high_resolution_mask(table['w'], table['h']),
+                                  high_resolution_mask(np.array(widths), np.array(heights)))
+
+
+def test_error_labels_match_per_row_filter():
+    df = label_frame('shot_distance')
+    old_keep = df.apply(old_error, axis=1).to_numpy(dtype=bool)
+
+    mask = label_mask(df['shot_distance'], df['style'], ERROR_LABELS)
+    np.testing.assert_array_equal(mask, old_keep)
+    # Matching is exact-case: 'ERROR' is not an error label
+    assert mask[(df['shot_distance'] == 'ERROR') & (df['style'] == 'portrait')].all()
+
+    assert_same_output(filter_labels(df, ERROR_LABELS, ERROR_COLUMNS, shot_col='shot_distance', add_aspect_ratio=True),
+                       old_output(df, old_keep, ERROR_COLUMNS, aspect_ratio=True))
+
+
+def test_unknown_labels_match_per_row_filter():
+    df = label_frame('shot_type', with_aspect_ratio=True)
+    old_keep = df.apply(old_unknown, axis=1).to_numpy(dtype=bool)
+
+    mask = label_mask(df['shot_type'], df['style'], UNKNOWN_LABELS)
+    np.testing.assert_array_equal(mask, old_keep)
+    assert mask[(df['shot_type'] == 'UNKNOWN') & (df['style'] == 'Close-up')].all()
+
+    assert_same_output(filter_labels(df, UNKNOWN_LABELS, UNKNOWN_COLUMNS, shot_col='shot_type'),
+                       old_output(df, old_keep, UNKNOWN_COLUMNS))
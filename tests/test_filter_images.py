@@ -0,0 +1,131 @@
+import errno
+import json
+import os
+import threading
+
+import pytest
+
+import filter_images
+from filter_images import filter_low_quality_images, undo_from_manifest
+
+NUM_IMAGES = 20
+
+
+class Crash(BaseException):
+    pass
+
+
+@pytest.fixture
+def images(tmp_path):
+    # Every image but each third one is labeled low quality
+    base_dir = tmp_path / 'images'
+    base_dir.mkdir()
+    metadata = []
+    for i in range(NUM_IMAGES):
+        (base_dir / f"{i}.jpg").write_bytes(bytes([i]) * (i + 1))
+        metadata.append({'id': i, 'url': f"/hr_images/{i}.jpg", 'quality': 'high' if i % 3 == 0 else 'low'})
+    json_path = tmp_path / 'images.json'
+    json_path.write_text(json.dumps(metadata))
+    return {'json': str(json_path), 'base': str(base_dir), 'dest': str(tmp_path / 'low'),
+            'manifest': str(tmp_path / 'manifest.jsonl'),
+            'low': {f"{i}.jpg" for i in range(NUM_IMAGES) if i % 3 != 0}}
+
+
+def read_manifest(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def move(images, **kwargs):
+    kwargs = dict(dict(num_workers=3, batch_size=2), **kwargs)
+    filter_low_quality_images(images['json'], images['base'], images['dest'], action='move',
+                              manifest_path=images['manifest'], **kwargs)
+
+
+def test_move_in_batches_and_undo(images):
+    before = {name: open(os.path.join(images['base'], name), 'rb').read() for name in os.listdir(images['base'])}
+    move(images)
+
+    assert set(os.listdir(images['dest'])) == images['low']
+    assert set(os.listdir(images['base'])) == set(before) - images['low']
+    records = read_manifest(images['manifest'])
+    assert len(records) == len(images['low'])
+    assert {os.path.basename(record['dst']) for record in records} == images['low']
+    assert all(record['op'] == 'move' and os.path.dirname(record['src']) == images['base'] for record in records)
+
+    undo_from_manifest(images['manifest'], num_workers=3, batch_size=2)
+    after = {name: open(os.path.join(images['base'], name), 'rb').read() for name in os.listdir(images['base'])}
+    assert after == before
+    assert os.listdir(images['dest']) == []
+    assert os.path.exists(f"{images['manifest']}.undone")
+
+
+def test_crash_mid_run_leaves_every_moved_file_in_the_manifest(images, monkeypatch):
+    rename = os.rename
+    renames = []
+    lock = threading.Lock()
+
+    def crashing_rename(src, dst):
+        with lock:
+            if len(renames) == 5:
+                raise Crash()  # killed in the middle of the second batch
+            renames.append(src)
+        rename(src, dst)
+
+    monkeypatch.setattr(os, 'rename', crashing_rename)
+    with pytest.raises(Crash):
+        move(images, num_workers=1, batch_size=4)
+    monkeypatch.undo()
+
+    moved = set(os.listdir(images['dest']))
+    assert len(moved) == 5
+    assert moved <= {os.path.basename(record['dst']) for record in read_manifest(images['manifest'])}
+
+    undo_from_manifest(images['manifest'])
+    assert os.listdir(images['dest']) == []
+    assert len(os.listdir(images['base'])) == NUM_IMAGES
+
+    # The failed move's record is harmless: a rerun moves the file and records it again
+    move(images)
+    assert set(os.listdir(images['dest'])) == images['low']
+
+
+def test_undo_copies_back_pairs_on_another_filesystem(images, monkeypatch):
+    move(images)
+    rename = os.rename
+    cross_device = {f"{i}.jpg" for i in range(NUM_IMAGES) if i % 3 == 2}
+
+    def rename_or_exdev(src, dst):
+        if os.path.basename(src) in cross_device:
+            raise OSError(errno.EXDEV, os.strerror(errno.EXDEV))
+        rename(src, dst)
+
+    # The first restored pair is on the same filesystem, the others mixed
+    assert '1.jpg' not in cross_device
+    monkeypatch.setattr(os, 'rename', rename_or_exdev)
+    undo_from_manifest(images['manifest'], num_workers=2, batch_size=3)
+    assert os.listdir(images['dest']) == []
+    assert len(os.listdir(images['base'])) == NUM_IMAGES
+
+
+def test_delete_records_every_file(images, monkeypatch):
+    monkeypatch.setattr('builtins.input', lambda prompt: 'yes')
+    filter_low_quality_images(images['json'], images['base'], None, action='delete',
+                              manifest_path=images['manifest'], num_workers=3, batch_size=2)
+    assert not images['low'] & set(os.listdir(images['base']))
+    records = read_manifest(images['manifest'])
+    assert sorted(os.path.basename(record['src']) for record in records) == sorted(images['low'])
+    assert all(record['op'] == 'delete' for record in records)
+
+
+def test_manifest_writer_keeps_lines_whole_across_threads(tmp_path):
+    manifest = filter_images.ManifestWriter(str(tmp_path / 'manifest.jsonl'))
+    threads = [threading.Thread(target=lambda t=t: [manifest.write({'op': 'move', 'src': f"{t}/{i}", 'dst': 'x' * 500})
+                                                    for i in range(200)])
+               for t in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    manifest.close()
+    assert len(read_manifest(str(tmp_path / 'manifest.jsonl'))) == 8 * 200
@@ -0,0 +1,137 @@
+import numpy as np
+import pytest
+
+from hash_index import cluster_ids, hamming, near_duplicate_pairs, tables
+
+# The thresholds and table layout perceptual_dedup.py runs with
+PHASH_MAX_DISTANCE = 6
+DHASH_MAX_DISTANCE = 10
+NUM_BLOCKS = 8
+KEY_BLOCKS = 3
+BLOCKS = sorted(tables(NUM_BLOCKS, KEY_BLOCKS)[0][0])  # (lo, width) of each block
+
+
+def random_hashes(rng, n):
+    return rng.integers(0, 2 ** 64, size=n, dtype=np.uint64)
+
+
+def flip(value, bits):
+    return value ^ np.uint64(sum(1 << int(bit) for bit in bits))
+
+
+def block_of(bit):
+    return next(i for i, (lo, width) in enumerate(BLOCKS) if lo <= bit < lo + width)
+
+
+def found_pairs(hashes, **kwargs):
+    kwargs = dict(dict(num_blocks=NUM_BLOCKS, key_blocks=KEY_BLOCKS, window=64), **kwargs)
+    left, right = near_duplicate_pairs(hashes, PHASH_MAX_DISTANCE, **kwargs)
+    return {(min(a, b), max(a, b)) for a, b in zip(left.tolist(), right.tolist())}
+
+
+def brute_force_pairs(hashes, max_distance):
+    n = len(hashes)
+    i, j = np.triu_indices(n, k=1)
+    close = hamming(hashes[i], hashes[j]) <= max_distance
+    return set(zip(i[close].tolist(), j[close].tolist()))
+
+
+def test_every_pair_within_the_guaranteed_distance_is_found():
+    # Planted near-duplicates at every distance up to num_blocks - key_blocks = 5 bits,
+    # among random hashes
+    rng = np.random.default_rng(0)
+    base = random_hashes(rng, 400)
+    variants = np.array([flip(value, rng.choice(64, size=i % 6, replace=False)) for i, value in enumerate(base)],
+                        dtype=np.uint64)
+    hashes = np.concatenate([base, variants, random_hashes(rng, 1200)])
+
+    expected = brute_force_pairs(hashes, NUM_BLOCKS - KEY_BLOCKS)
+    assert {(i, i + len(base)) for i in range(len(base))} <= expected
+    found = found_pairs(hashes)
+    assert expected <= found
+    # No pair beyond the threshold is ever reported
+    assert found <= brute_force_pairs(hashes, PHASH_MAX_DISTANCE)
+
+
+@pytest.mark.parametrize('num_blocks_touched', [3, 5, 6])
+def test_pairs_at_the_threshold(num_blocks_touched):
+    # 6 differing bits are found when they fall in at most 5 blocks (3 blocks stay
+    # untouched, which is one table's key), and missed when they touch 6 blocks
+    rng = np.random.default_rng(num_blocks_touched)
+    blocks = BLOCKS
+    hits = 0
+    for _ in range(50):
+        chosen = rng.choice(len(blocks), size=num_blocks_touched, replace=False)
+        bits = [blocks[i][0] + int(rng.integers(blocks[i][1])) for i in chosen]
+        while len(bits) < PHASH_MAX_DISTANCE:
+            i = chosen[int(rng.integers(len(chosen)))]
+            bit = blocks[i][0] + int(rng.integers(blocks[i][1]))
+            if bit not in bits:
+                bits.append(bit)
+        assert len({block_of(bit) for bit in bits}) == num_blocks_touched
+        value = random_hashes(rng, 1)[0]
+        hits += (0, 1) in found_pairs(np.array([value, flip(value, bits)], dtype=np.uint64))
+    assert hits == (50 if num_blocks_touched <= NUM_BLOCKS - KEY_BLOCKS else 0)
+
+
+def test_dhash_verification_rejects_candidates():
+    rng = np.random.default_rng(1)
+    phashes = random_hashes(rng, 2)
+    phashes[1] = flip(phashes[0], [3, 40])
+    dhashes = random_hashes(rng, 2)
+    dhashes[1] = flip(dhashes[0], range(DHASH_MAX_DISTANCE))
+    assert found_pairs(phashes, verify=[(dhashes, DHASH_MAX_DISTANCE)]) == {(0, 1)}
+    dhashes[1] = flip(dhashes[0], range(DHASH_MAX_DISTANCE + 1))
+    assert found_pairs(phashes, verify=[(dhashes, DHASH_MAX_DISTANCE)]) == set()
+
+
+def test_large_buckets_of_equal_hashes_form_one_cluster():
+    # e.g. thousands of blank images: only window neighbours are compared, which still
+    # chains them into one cluster
+    hashes = np.full(500, 12345, dtype=np.uint64)
+    left, right = near_duplicate_pairs(hashes, PHASH_MAX_DISTANCE, window=8)
+    assert len({(min(a, b), max(a, b)) for a, b in zip(left.tolist(), right.tolist())}) <= 500 * 8
+    assert set(cluster_ids(len(hashes), left, right).tolist()) == {0}
+
+
+def union_find_components(n, left, right):
+    parent = list(range(n))
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for a, b in zip(left, right):
+        parent[find(a)] = find(b)
+    return [find(x) for x in range(n)]
+
+
+def test_cluster_ids_small_graph():
+    left = np.array([0, 1, 5, 7], dtype=np.int64)
+    right = np.array([1, 2, 3, 5], dtype=np.int64)
+    # Components {0, 1, 2}, {3, 5, 7}, {4}, {6}, numbered by their first member
+    assert cluster_ids(8, left, right).tolist() == [0, 0, 0, 1, 2, 1, 3, 1]
+    assert cluster_ids(3, np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)).tolist() == [0, 1, 2]
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_cluster_ids_match_union_find(seed):
+    rng = np.random.default_rng(seed)
+    n = 300
+    num_edges = int(rng.integers(50, 400))
+    left = rng.integers(0, n, size=num_edges)
+    right = rng.integers(0, n, size=num_edges)
+    # Long chains in reverse order need several propagation rounds
+    chain = np.arange(n - 1, 200, -1)
+    left = np.concatenate([left, chain[:-1]])
+    right = np.concatenate([right, chain[1:]])
+
+    ids = cluster_ids(n, left, right)
+    roots = union_find_components(n, left.tolist(), right.tolist())
+    # Same partition
+    assert len(set(zip(ids.tolist(), roots))) == len(set(roots)) == len(set(ids.tolist()))
+    # Numbered 0..k-1 in order of each cluster's first member
+    first_seen = list(dict.fromkeys(ids.tolist()))
+    assert first_seen == list(range(len(first_seen)))
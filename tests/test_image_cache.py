@@ -0,0 +1,88 @@
+import itertools
+import os
+import sqlite3
+import types
+
+import pytest
+
+import image_cache
+from image_cache import ImageCache
+
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    # Strictly increasing timestamps, so the LRU order never depends on clock resolution
+    monkeypatch.setattr(image_cache, 'time', types.SimpleNamespace(time=itertools.count(1).__next__))
+
+
+def object_files(cache):
+    return {entry.name: entry.stat().st_size
+            for shard in os.scandir(cache.objects_dir) for entry in os.scandir(shard.path)}
+
+
+def test_same_content_is_stored_once(tmp_path):
+    cache = ImageCache(str(tmp_path / 'cache'))
+    first = cache.put('http://a/1.jpg', b'x' * 100)
+    assert cache.put('http://b/mirror.jpg', b'x' * 100) == first
+    cache.put('http://a/2.jpg', b'y' * 50)
+
+    assert object_files(cache) == {first: 100, image_cache._sha256(b'y' * 50): 50}
+    assert cache.size() == 150
+    assert cache.get('http://b/mirror.jpg') == b'x' * 100
+    assert cache.path('http://a/1.jpg') == cache.path('http://b/mirror.jpg')
+    assert cache.get('http://a/3.jpg') is None
+
+
+def test_least_recently_used_objects_are_evicted_first(tmp_path):
+    cache = ImageCache(str(tmp_path / 'cache'), max_bytes=350)
+    for name in 'abc':
+        cache.put(f"http://x/{name}", name.encode() * 100)
+    assert cache.path('http://x/a') is not None  # a is now more recent than b and c
+
+    # 400 bytes > 350: evicted down to 315, which takes only the oldest, b
+    cache.put('http://x/d', b'd' * 100)
+    assert [cache.get(f"http://x/{name}") is not None for name in 'abcd'] == [True, False, True, True]
+    assert cache.size() == sum(object_files(cache).values()) == 300
+
+    cache.evict(target_bytes=100)
+    assert [cache.get(f"http://x/{name}") is not None for name in 'abcd'] == [False, False, False, True]
+    assert cache.size() == sum(object_files(cache).values()) == 100
+
+
+def test_evicting_an_object_drops_every_url_pointing_at_it(tmp_path):
+    cache = ImageCache(str(tmp_path / 'cache'), max_bytes=1000)
+    cache.put('http://a/1.jpg', b'x' * 100)
+    cache.put('http://b/1.jpg', b'x' * 100)
+    cache.put('http://a/2.jpg', b'y' * 100)
+    cache.evict(target_bytes=100)
+
+    assert cache.content_hash('http://a/1.jpg') is None
+    assert cache.content_hash('http://b/1.jpg') is None
+    conn = sqlite3.connect(cache.index_path)
+    dangling = conn.execute("SELECT COUNT(*) FROM urls WHERE hash NOT IN (SELECT hash FROM objects)").fetchone()[0]
+    assert dangling == 0
+    assert conn.execute("SELECT url FROM urls").fetchall() == [('http://a/2.jpg',)]
+
+
+def test_size_cap_is_shared_by_caches_on_the_same_directory(tmp_path):
+    # Two instances stand in for two worker processes: each has its own connection
+    # and no shared Python state, only the directory
+    caches = [ImageCache(str(tmp_path / 'cache'), max_bytes=1000) for _ in range(2)]
+    for i in range(30):
+        caches[i % 2].put(f"http://x/{i}", bytes([i]) * 100)
+        assert caches[0].size() == caches[1].size() == sum(object_files(caches[0]).values()) <= 1000
+
+    # The most recent puts survive, whichever instance made them
+    assert all(caches[0].get(f"http://x/{i}") is not None for i in range(25, 30))
+    assert ImageCache(str(tmp_path / 'cache')).size() == caches[0].size()
+
+
+def test_missing_object_file_is_a_miss_and_is_written_again(tmp_path):
+    cache = ImageCache(str(tmp_path / 'cache'))
+    content_hash = cache.put('http://x/a', b'a' * 10)
+    os.remove(cache._object_path(content_hash))
+    assert cache.path('http://x/a') is None
+
+    assert cache.fetch('http://x/a', lambda url: b'a' * 10) == b'a' * 10
+    assert cache.get('http://x/a') == b'a' * 10
+    assert cache.size() == 10
@@ -0,0 +1,79 @@
+import os
+
+import numpy as np
+import pytest
+import requests
+from PIL import Image
+
+from image_cache import ImageCache
+from image_decode import decode_gray
+from image_pipeline import iter_scored
+from quality_metrics import laplacian_variance
+
+PATCH_SIZE = 64
+SIZES = {'a.png': (320, 240), 'b.jpg': (256, 384), 'c.png': (200, 200)}
+
+
+@pytest.fixture
+def image_dir(tmp_path):
+    rng = np.random.default_rng(0)
+    for name, (width, height) in SIZES.items():
+        pixels = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+        Image.fromarray(pixels).save(tmp_path / name)
+    (tmp_path / 'broken.jpg').write_bytes(b'\xff\xd8 not really a JPEG')
+    return tmp_path
+
+
+def test_results_come_back_in_input_order(image_dir, serve_directory):
+    base_url = serve_directory(image_dir)
+    names = ['a.png', 'missing.jpg', 'b.jpg', 'broken.jpg', 'c.png', 'a.png']
+    items = [(index, f"{base_url}/{name}") for index, name in zip([3, 4, 7, 8, 10, 11], names)]
+
+    # A window smaller than the input makes results resolve while later items are in flight
+    results = list(iter_scored(items, PATCH_SIZE, download_workers=4, score_workers=2, max_in_flight=2))
+
+    assert [(result['index'], result['url']) for result in results] == items
+    by_name = dict(zip(names, results))
+
+    missing = by_name['missing.jpg']
+    assert missing['stage'] == 'download'
+    assert isinstance(missing['error'], requests.HTTPError)
+    assert missing['error'].response.status_code == 404
+
+    broken = by_name['broken.jpg']
+    assert broken['stage'] == 'score'
+    assert broken['error'] is not None
+
+    for name, (width, height) in SIZES.items():
+        result = by_name[name]
+        assert result['stage'] == 'done' and result['error'] is None
+        assert (result['width'], result['height']) == (width, height)
+        gray = decode_gray(str(image_dir / name))
+        assert result['lap'] == pytest.approx(laplacian_variance(gray))
+        assert result['variances'].ndim == 2
+    assert results[-1]['lap'] == results[0]['lap']
+
+
+class EvictingCache(ImageCache):
+    """Cache whose objects are evicted right after every lookup, like a concurrent evict()."""
+
+    def path(self, url):
+        object_path = super().path(url)
+        if object_path is not None:
+            os.remove(object_path)
+        return object_path
+
+
+def test_cache_hits_evicted_before_scoring_are_downloaded_again(image_dir, serve_directory, tmp_path):
+    base_url = serve_directory(image_dir)
+    urls = [f"{base_url}/{name}" for name in SIZES]
+    cache = EvictingCache(str(tmp_path / 'cache'))
+    for url in urls:
+        cache.fetch(url, lambda u: requests.get(u).content)
+
+    results = list(iter_scored(enumerate(urls), PATCH_SIZE, download_workers=2, score_workers=2, cache=cache))
+
+    assert [result['stage'] for result in results] == ['done'] * len(urls)
+    assert [(result['width'], result['height']) for result in results] == list(SIZES.values())
+    # The lookups really did hand the workers paths that no longer existed
+    assert all(cache.path(url) is None for url in urls)
@@ -0,0 +1,58 @@
+import json
+
+import pytest
+
+from label_store import connect, export_json, get_page, import_json, init_db, set_quality
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = connect(str(tmp_path / 'images.db'))
+    init_db(conn)
+    yield conn
+    conn.close()
+
+
+def write_json(path, images):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(images, f)
+
+
+def labels(conn):
+    return {row['id']: row['quality'] for row in get_page(conn, 100)}
+
+
+def test_reimporting_a_stale_json_keeps_newer_labels(conn, tmp_path):
+    json_path = str(tmp_path / 'images.json')
+    write_json(json_path, [{'id': 1, 'url': '/a/1.jpg', 'quality': None},
+                           {'id': 2, 'url': '/a/2.jpg', 'quality': 'low'}])
+    import_json(conn, json_path)
+    export_json(conn, json_path)  # e.g. the images.json meta_data.py exports
+
+    set_quality(conn, 1, 'high')
+    set_quality(conn, 2, 'high')
+    write_json(json_path, [{'id': 1, 'url': '/b/1.jpg', 'quality': None},
+                           {'id': 2, 'url': '/b/2.jpg', 'quality': 'low'},
+                           {'id': 3, 'url': '/b/3.jpg', 'quality': 'low'}])
+    assert import_json(conn, json_path) == 3
+
+    assert labels(conn) == {1: 'high', 2: 'high', 3: 'low'}
+    assert [row['url'] for row in get_page(conn, 100)] == ['/b/1.jpg', '/b/2.jpg', '/b/3.jpg']
+
+
+def test_json_labels_fill_unlabeled_images(conn, tmp_path):
+    json_path = str(tmp_path / 'images.json')
+    write_json(json_path, [{'id': 1, 'url': '/a/1.jpg'}])
+    import_json(conn, json_path)
+    write_json(json_path, [{'id': 1, 'url': '/a/1.jpg', 'quality': 'low'}])
+    import_json(conn, json_path)
+    assert labels(conn) == {1: 'low'}
+
+
+def test_overwrite_labels_lets_the_json_win(conn, tmp_path):
+    json_path = str(tmp_path / 'images.json')
+    write_json(json_path, [{'id': 1, 'url': '/a/1.jpg', 'quality': 'low'}])
+    import_json(conn, json_path)
+    set_quality(conn, 1, 'high')
+    import_json(conn, json_path, overwrite_labels=True)
+    assert labels(conn) == {1: 'low'}
@@ -0,0 +1,35 @@
+import json
+
+from PIL import Image
+
+import meta_data
+
+
+def test_first_run_keeps_the_labels_in_images_json(tmp_path, monkeypatch):
+    images_dir = tmp_path / 'images'
+    images_dir.mkdir()
+    for name in ('a.jpg', 'b.jpg', 'c.png'):
+        Image.new('RGB', (64, 48)).save(images_dir / name)
+    json_path = tmp_path / 'images.json'
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump([{'id': 1, 'url': '/hr_images/a.jpg', 'quality': 'low'},
+                   {'id': 2, 'url': '/hr_images/b.jpg', 'quality': 'low'},
+                   {'id': 3, 'url': '/hr_images/gone.jpg', 'quality': 'high'}], f)
+    monkeypatch.setattr(meta_data, 'images_dir', str(images_dir))
+    monkeypatch.setattr(meta_data, 'db_file', str(tmp_path / 'images.db'))
+    monkeypatch.setattr(meta_data, 'json_file', str(json_path))
+
+    meta_data.main()
+
+    with open(json_path, encoding='utf-8') as f:
+        images = json.load(f)
+    # Labeled files keep their id and label, the vanished file is dropped and the new
+    # one is added unlabeled after the maximum remaining id
+    assert images == [{'id': 1, 'url': '/hr_images/a.jpg', 'quality': 'low'},
+                      {'id': 2, 'url': '/hr_images/b.jpg', 'quality': 'low'},
+                      {'id': 3, 'url': '/hr_images/c.png', 'quality': None}]
+
+    # Later runs sync against the store and leave the labels alone
+    meta_data.main()
+    with open(json_path, encoding='utf-8') as f:
+        assert json.load(f) == images
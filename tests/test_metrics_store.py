@@ -0,0 +1,45 @@
+import os
+
+import numpy as np
+
+from checkpoint_journal import ACCEPTED, REJECTED, CheckpointJournal
+from metrics_store import MetricsStoreWriter, missing_urls, read_metrics
+
+
+def add_rows(writer, urls):
+    for i, url in enumerate(urls):
+        writer.add(url, lap=100.0 + i, variances=np.full((2, 3), 50.0 + i), width=3840, height=2160)
+
+
+def test_new_parts_continue_after_the_highest_index(tmp_path):
+    store_dir = str(tmp_path / 'store')
+    writer = MetricsStoreWriter(store_dir, patch_size=240, flat_threshold=100, rows_per_part=2)
+    add_rows(writer, ['a', 'b', 'c', 'd', 'e', 'f'])
+    writer.close()
+    os.remove(os.path.join(store_dir, 'part-00001.parquet'))  # gap in the numbering
+
+    writer = MetricsStoreWriter(store_dir, patch_size=240, flat_threshold=100)
+    add_rows(writer, ['g'])
+    writer.close()
+    assert sorted(os.listdir(store_dir)) == ['part-00000.parquet', 'part-00002.parquet', 'part-00003.parquet']
+    assert read_metrics(store_dir).column('url').to_pylist() == ['a', 'b', 'e', 'f', 'g']
+
+
+def test_buffered_rows_lost_in_a_crash_are_found_and_rescored(tmp_path):
+    store_dir = str(tmp_path / 'store')
+    journal = CheckpointJournal(str(tmp_path / 'journal.jsonl'))
+    writer = MetricsStoreWriter(store_dir, patch_size=240, flat_threshold=100, rows_per_part=2)
+    urls = ['a', 'b', 'c']
+    add_rows(writer, urls)  # 'c' is still buffered
+    for index in range(3):
+        journal.append(index, ACCEPTED, lap=100.0 + index, flat=False)
+    journal.append(3, REJECTED, stage='probe')  # never scored, so never in the store
+    journal.close()
+    # Crash: the writer is never closed
+
+    resumed = CheckpointJournal(str(tmp_path / 'journal.jsonl'))
+    assert resumed.scored == {0, 1, 2}
+    missing = missing_urls(store_dir, [urls[index] for index in sorted(resumed.scored)])
+    assert missing == {'c'}
+    resumed.reopen([2])
+    assert [index for index in range(4) if not resumed.is_done(index)] == [2]
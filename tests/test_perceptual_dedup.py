@@ -0,0 +1,36 @@
+import numpy as np
+from PIL import Image
+
+import perceptual_dedup
+from perceptual_dedup import hash_pending, load_hashes, pending_urls, settled_urls
+
+
+def test_failed_downloads_are_hashed_again(serve_directory, tmp_path, monkeypatch):
+    image_dir = tmp_path / 'www'
+    image_dir.mkdir()
+    rng = np.random.default_rng(0)
+    image = Image.fromarray(rng.integers(0, 256, (96, 128, 3), dtype=np.uint8))
+    image.save(image_dir / 'a.jpg')
+    base_url = serve_directory(image_dir)
+    urls = {f"{base_url}/a.jpg": 'laion2b', f"{base_url}/b.jpg": 'pd12m'}
+    monkeypatch.setattr(perceptual_dedup, 'HASH_FILE', str(tmp_path / 'hashes.csv'))
+    monkeypatch.setattr(perceptual_dedup, 'DOWNLOAD_WORKERS', 2)
+
+    # b.jpg is not there yet (e.g. a timeout or a 503): recorded with its error
+    hash_pending(list(urls.items()))
+    hashes = load_hashes(perceptual_dedup.HASH_FILE)
+    assert hashes.set_index('url')['error'].fillna('').to_dict()[f"{base_url}/a.jpg"] == ''
+    assert settled_urls(hashes) == {f"{base_url}/a.jpg"}
+
+    # The next run hashes only the failed URL, and its new row wins
+    image.save(image_dir / 'b.jpg')
+    pending = pending_urls(urls, load_hashes(perceptual_dedup.HASH_FILE))
+    assert pending == [(f"{base_url}/b.jpg", 'pd12m')]
+    hash_pending(pending)
+
+    hashes = load_hashes(perceptual_dedup.HASH_FILE)
+    assert len(hashes) == 3
+    assert settled_urls(hashes) == set(urls)
+    latest = hashes.drop_duplicates('url', keep='last').set_index('url')
+    assert latest.loc[f"{base_url}/b.jpg", 'phash'] == latest.loc[f"{base_url}/a.jpg", 'phash']
+    assert (latest.loc[f"{base_url}/b.jpg", ['width', 'height']] == [128, 96]).all()
@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from quantile_sketch import QuantileSketch, load_sketches, merge_sketches, save_sketches
+
+QUANTILES = [0.0, 0.01, 0.2, 0.25, 0.5, 0.8, 0.999, 1.0]
+
+
+def float16_scores(n, seed):
+    # Q-Align scores: float16 values in [1, 5]
+    rng = np.random.default_rng(seed)
+    return np.clip(rng.normal(3.2, 0.6, n), 1, 5).astype(np.float16).astype(np.float64)
+
+
+@pytest.mark.parametrize('n', [1, 2, 7, 1000, 100_003])
+def test_matches_pandas_quantile_on_float16_scores(n):
+    scores = pd.Series(float16_scores(n, seed=n))
+    sketch = QuantileSketch()
+    for chunk in np.array_split(scores.to_numpy(), 7):
+        sketch.update(chunk)
+    for q in QUANTILES:
+        cutoff = sketch.quantile(q)
+        assert cutoff == scores.quantile(q)
+        # So the streaming and exact modes keep exactly the same rows
+        assert ((scores >= cutoff) == (scores >= scores.quantile(q))).all()
+
+
+def test_within_one_bucket_of_pandas_on_continuous_scores():
+    rng = np.random.default_rng(1)
+    scores = pd.Series(rng.uniform(1, 5, 50_000))
+    sketch = QuantileSketch()
+    sketch.update(scores)
+    width = (sketch.hi - sketch.lo) / sketch.bins
+    for q in QUANTILES:
+        assert abs(sketch.quantile(q) - scores.quantile(q)) <= width
+
+
+def test_merged_and_saved_sketches_agree_with_one_pass(tmp_path):
+    scores = float16_scores(20_000, seed=2)
+    parts = np.array_split(scores, 3)
+    sketches = {}
+    for i, part in enumerate(parts):
+        sketch = QuantileSketch()
+        sketch.update(part)
+        path = str(tmp_path / f"sketch{i}.npz")
+        save_sketches(path, {'quality_score': sketch})
+        merge_sketches(sketches, load_sketches(path))
+
+    one_pass = QuantileSketch()
+    one_pass.update(scores)
+    merged = sketches['quality_score']
+    assert merged.count == len(scores)
+    for q in QUANTILES:
+        assert merged.quantile(q) == one_pass.quantile(q) == pd.Series(scores).quantile(q)
+
+
+def test_nan_scores_are_ignored_and_empty_sketches_have_no_cutoff():
+    sketch = QuantileSketch()
+    assert np.isnan(sketch.quantile(0.2))
+    sketch.update([np.nan, 2.5, np.nan])
+    assert sketch.count == 1 and sketch.quantile(0.2) == 2.5
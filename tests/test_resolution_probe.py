@@ -0,0 +1,100 @@
+import os
+import re
+
+import numpy as np
+import pytest
+import requests
+from PIL import Image
+
+from conftest import QuietHandler
+from resolution_probe import probe_url, ProbeCache, OK, ERROR
+
+PROBE_BYTES = 16 * 1024
+MAX_PROBE_BYTES = 256 * 1024
+
+
+class RangeHandler(QuietHandler):
+    # SimpleHTTPRequestHandler ignores Range (200 with the whole file); this one answers
+    # single byte ranges with 206, or 416 when the range starts past the end of the file
+    def do_GET(self):
+        match = re.fullmatch(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        path = self.translate_path(self.path)
+        if match is None or not os.path.isfile(path):
+            return super().do_GET()
+        with open(path, 'rb') as f:
+            data = f.read()
+        start = int(match.group(1))
+        end = min(int(match.group(2)) if match.group(2) else len(data) - 1, len(data) - 1)
+        if start >= len(data):
+            self.send_response(416)
+            self.send_header('Content-Range', f"bytes */{len(data)}")
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(206)
+        self.send_header('Content-Type', self.guess_type(path))
+        self.send_header('Content-Range', f"bytes {start}-{end}/{len(data)}")
+        self.send_header('Content-Length', str(end - start + 1))
+        self.end_headers()
+        self.wfile.write(data[start:end + 1])
+
+
+@pytest.fixture
+def image_dir(tmp_path):
+    rng = np.random.default_rng(0)
+    noise = Image.fromarray(rng.integers(0, 256, (359, 641, 3), dtype='uint8'))
+    # JPEG whose EXIF and ICC segments push the frame header past 128 KB, so the probe
+    # has to double its range several times
+    noise.save(tmp_path / 'exif.jpg', quality=90,
+               exif=b'Exif\x00\x00' + b'\x00' * 60000, icc_profile=b'\x00' * 100000)
+    noise.save(tmp_path / 'plain.png')
+    noise.save(tmp_path / 'lossy.webp', quality=80)
+    noise.save(tmp_path / 'lossless.webp', lossless=True)
+    noise.save(tmp_path / 'extended.webp', quality=80, exif=b'Exif\x00\x00' + b'\x00' * 64)
+    return tmp_path
+
+
+@pytest.mark.parametrize('name', ['exif.jpg', 'plain.png', 'lossy.webp', 'lossless.webp', 'extended.webp'])
+def test_probe_with_and_without_range_support(serve_directory, image_dir, name):
+    with Image.open(image_dir / name) as im:
+        expected = im.size
+    with_range = serve_directory(image_dir, RangeHandler)
+    without_range = serve_directory(image_dir)
+
+    session = requests.Session()
+    ranged = probe_url(session, f"{with_range}/{name}", PROBE_BYTES, MAX_PROBE_BYTES)
+    full = probe_url(session, f"{without_range}/{name}", PROBE_BYTES, MAX_PROBE_BYTES)
+
+    assert ranged['status'] == full['status'] == OK
+    assert (ranged['width'], ranged['height']) == (full['width'], full['height']) == expected
+    assert ranged['format'] == full['format']
+    assert ranged['range'] is True and full['range'] is False
+    # Only the start of the file is fetched either way
+    assert ranged['bytes'] <= MAX_PROBE_BYTES
+    assert full['bytes'] <= MAX_PROBE_BYTES
+    if name == 'exif.jpg':
+        assert ranged['bytes'] > 128 * 1024
+
+
+def test_failed_probes_are_probed_again(serve_directory, image_dir, tmp_path):
+    base_url = serve_directory(image_dir, RangeHandler)
+    session = requests.Session()
+    cache_path = str(tmp_path / 'probe.jsonl')
+    missing = probe_url(session, f"{base_url}/missing.png")
+    found = probe_url(session, f"{base_url}/plain.png")
+    assert missing['status'] == ERROR and found['status'] == OK
+
+    cache = ProbeCache(cache_path)
+    cache.add([dict(missing, passed=None), dict(found, passed=False)])
+    cache.close()
+
+    cache = ProbeCache(cache_path)
+    assert missing['url'] in cache and not cache.settled(missing['url'])
+    assert cache.settled(found['url']) and cache.rejected(found['url'])
+
+    # The rerun's result replaces the failed one
+    cache.add([dict(missing, status=OK, error=None, passed=True)])
+    cache.close()
+    cache = ProbeCache(cache_path)
+    assert cache.settled(missing['url']) and not cache.rejected(missing['url'])
+    cache.close()
@@ -0,0 +1,33 @@
+import os
+
+import pandas as pd
+
+from score_shards import ScoreShardWriter, load_scores, merge_scores
+
+
+def test_new_shards_continue_after_the_highest_index(tmp_path):
+    score_dir = str(tmp_path / 'scores')
+    writer = ScoreShardWriter(score_dir, rows_per_shard=2)
+    for i in range(6):
+        writer.add(i, f"u{i}", 0.5 + i, 0.25 + i)
+    writer.close()
+    os.remove(os.path.join(score_dir, 'scores-00001.csv'))  # gap in the numbering
+
+    writer = ScoreShardWriter(score_dir, rows_per_shard=2)
+    writer.add(0, 'u0', 9.0, 9.0)  # rescored URL: the newer shard wins
+    assert writer.close() == os.path.join(score_dir, 'scores-00003.csv')
+    assert sorted(os.listdir(score_dir)) == ['scores-00000.csv', 'scores-00002.csv', 'scores-00003.csv']
+
+    scores = load_scores(score_dir).set_index('url')
+    assert sorted(scores.index) == ['u0', 'u1', 'u4', 'u5']
+    assert scores.loc['u0', 'quality_score'] == 9.0
+
+
+def test_merge_scores_fills_rows_by_url(tmp_path):
+    score_dir = str(tmp_path / 'scores')
+    writer = ScoreShardWriter(score_dir)
+    writer.add(1, 'b', 3.0, 4.0)
+    writer.close()
+    merged = merge_scores(pd.DataFrame({'url': ['a', 'b']}), score_dir)
+    assert merged['quality_score'].isna().tolist() == [True, False]
+    assert merged.loc[1, 'aesthetic_score'] == 4.0
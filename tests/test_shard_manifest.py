@@ -0,0 +1,106 @@
+import json
+import os
+
+import pytest
+
+import shard_manifest
+from shard_manifest import ShardManifest, run_incremental_shards
+
+CONFIG = {'stage': 'test', 'min_width': 512}
+
+
+@pytest.fixture
+def shards(tmp_path):
+    input_dir = tmp_path / 'input'
+    input_dir.mkdir()
+    files = []
+    for shard in range(3):
+        path = input_dir / f"shard-{shard}.csv"
+        path.write_text('url\n' + ''.join(f"https://example.com/{shard}/{i}.jpg\n" for i in range(4)))
+        files.append(str(path))
+    return files
+
+
+def run(files, tmp_path, config=CONFIG):
+    # Returns the shards that were (re)processed
+    output_dir = tmp_path / 'output'
+    output_dir.mkdir(exist_ok=True)
+    processed = []
+
+    def process_shard(file):
+        processed.append(os.path.basename(file))
+        output = os.path.join(output_dir, os.path.basename(file))
+        with open(file) as src, open(output, 'w') as dst:
+            dst.write(src.read())
+        return {'rows': 1}, [output]
+
+    manifest = ShardManifest(str(tmp_path / 'shard_manifest.json'), config)
+    summary = run_incremental_shards(process_shard, files, manifest, num_workers=1)
+    assert summary['unchanged_shards'] == len(files) - len(processed)
+    return sorted(processed)
+
+
+def touch(path, seconds=10):
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + seconds * 10 ** 9))
+
+
+def test_unchanged_shards_are_skipped(shards, tmp_path):
+    assert run(shards, tmp_path) == ['shard-0.csv', 'shard-1.csv', 'shard-2.csv']
+    assert run(shards, tmp_path) == []
+
+
+def test_touched_shard_with_the_same_content_is_skipped(shards, tmp_path, monkeypatch):
+    run(shards, tmp_path)
+    touch(shards[1])
+    assert run(shards, tmp_path) == []
+
+    # The new mtime was saved, so the next run does not hash the shard again
+    def no_hashing(path):
+        raise AssertionError(f"hashed {path}")
+    monkeypatch.setattr(shard_manifest, 'content_hash', no_hashing)
+    assert run(shards, tmp_path) == []
+
+
+def test_changed_content_is_reprocessed(shards, tmp_path):
+    run(shards, tmp_path)
+    # Same size, new bytes and a new mtime
+    with open(shards[2], 'r+') as f:
+        text = f.read()
+        f.seek(0)
+        f.write(text.replace('example', 'EXAMPLE'))
+    touch(shards[2])
+    assert run(shards, tmp_path) == ['shard-2.csv']
+    with open(tmp_path / 'output' / 'shard-2.csv') as f:
+        assert 'EXAMPLE' in f.read()
+
+    # Grown shard: the size alone gives it away
+    with open(shards[0], 'a') as f:
+        f.write('https://example.com/0/new.jpg\n')
+    assert run(shards, tmp_path) == ['shard-0.csv']
+
+
+def test_config_change_reprocesses_everything(shards, tmp_path):
+    run(shards, tmp_path)
+    assert run(shards, tmp_path, config=dict(CONFIG, min_width=1024)) == ['shard-0.csv', 'shard-1.csv', 'shard-2.csv']
+    assert run(shards, tmp_path, config=dict(CONFIG, min_width=1024)) == []
+
+
+def test_missing_output_is_reprocessed(shards, tmp_path):
+    run(shards, tmp_path)
+    os.remove(tmp_path / 'output' / 'shard-1.csv')
+    assert run(shards, tmp_path) == ['shard-1.csv']
+
+
+@pytest.mark.parametrize('damage', ['truncated', 'garbage', 'not an object'])
+def test_unreadable_manifest_reprocesses_everything(shards, tmp_path, damage):
+    run(shards, tmp_path)
+    path = tmp_path / 'shard_manifest.json'
+    text = path.read_text()
+    path.write_bytes({'truncated': text[:len(text) // 2].encode(), 'garbage': b'\xff\xfe\x00junk',
+                      'not an object': b'[1, 2]'}[damage])
+
+    assert run(shards, tmp_path) == ['shard-0.csv', 'shard-1.csv', 'shard-2.csv']
+    with open(path) as f:
+        assert len(json.load(f)['shards']) == 3
+    assert run(shards, tmp_path) == []
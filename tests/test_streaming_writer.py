@@ -0,0 +1,128 @@
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from streaming_writer import CsvStreamWriter, ParquetPartWriter
+
+
+def shard_frame(shard, rows):
+    return pd.DataFrame({
+        'width': range(shard * 100, shard * 100 + rows),
+        'height': [2160] * rows,
+        'url': [f"https://example.com/{shard}/{i}.jpg" for i in range(rows)],
+    })
+
+
+def part_files(output_dir):
+    return sorted(name for name in os.listdir(output_dir) if name.startswith('part-'))
+
+
+def test_parquet_parts_write_each_shard_through(tmp_path):
+    output_dir = str(tmp_path / 'parts')
+    writer = ParquetPartWriter(output_dir, rows_per_part=5)
+    writer.write('a.parquet', shard_frame(0, 3))
+    # The shard went straight to the open part instead of a buffer
+    assert writer.part_rows == 3 and part_files(output_dir) == ['part-00000.parquet.tmp']
+    writer.write('b.parquet', shard_frame(1, 3))
+    writer.write('c.parquet', shard_frame(2, 0))
+    writer.write('d.parquet', shard_frame(3, 2))
+    writer.close()
+
+    assert part_files(output_dir) == ['part-00000.parquet', 'part-00001.parquet']
+    merged = pd.concat([pd.read_parquet(os.path.join(output_dir, name)) for name in part_files(output_dir)],
+                       ignore_index=True)
+    expected = pd.concat([shard_frame(0, 3), shard_frame(1, 3), shard_frame(3, 2)], ignore_index=True)
+    pd.testing.assert_frame_equal(merged, expected)
+    # A completed run leaves no progress behind, so the next run starts over
+    assert not os.path.exists(os.path.join(output_dir, 'progress.json'))
+    assert ParquetPartWriter(output_dir).done == set()
+
+
+def test_parquet_parts_resume_after_crash(tmp_path):
+    output_dir = str(tmp_path / 'parts')
+    writer = ParquetPartWriter(output_dir, rows_per_part=4)
+    writer.write('a.parquet', shard_frame(0, 4))
+    writer.write('b.parquet', shard_frame(1, 2))
+    # Crash: the open part for b is never finished
+
+    resumed = ParquetPartWriter(output_dir, rows_per_part=4)
+    assert resumed.done == {os.path.abspath('a.parquet')}
+    assert part_files(output_dir) == ['part-00000.parquet']
+    resumed.write('b.parquet', shard_frame(1, 2))
+    resumed.close(complete=False)
+    assert resumed.done == {os.path.abspath('a.parquet'), os.path.abspath('b.parquet')}
+    assert os.path.exists(os.path.join(output_dir, 'progress.json'))
+    assert len(pd.read_parquet(os.path.join(output_dir, 'part-00001.parquet'))) == 2
+
+
+def test_csv_writer_resumes_and_finishes(tmp_path):
+    path = str(tmp_path / 'out.csv')
+    writer = CsvStreamWriter(path)
+    writer.write('a.parquet', shard_frame(0, 2))
+    # Rows appended by a shard that never recorded its progress are dropped on restart
+    with open(path, 'a') as f:
+        f.write('torn,row')
+
+    resumed = CsvStreamWriter(path)
+    assert resumed.done == {os.path.abspath('a.parquet')}
+    resumed.write('b.parquet', shard_frame(1, 2))
+    resumed.close()
+    expected = pd.concat([shard_frame(0, 2), shard_frame(1, 2)], ignore_index=True)
+    pd.testing.assert_frame_equal(pd.read_csv(path), expected)
+    assert not os.path.exists(f"{path}.progress.json")
+
+
+def read_parts(output_dir):
+    return pd.concat([pd.read_parquet(os.path.join(output_dir, name)) for name in part_files(output_dir)],
+                     ignore_index=True)
+
+
+def test_parquet_parts_cast_later_all_null_columns(tmp_path):
+    output_dir = str(tmp_path / 'parts')
+    writer = ParquetPartWriter(output_dir, rows_per_part=100)
+    writer.write('a.parquet', shard_frame(0, 3))
+    no_urls = shard_frame(1, 2).assign(url=None)
+    writer.write('b.parquet', no_urls)
+    writer.close()
+
+    # Still one part: the all-null column fits the string column it already has
+    assert part_files(output_dir) == ['part-00000.parquet']
+    merged = read_parts(output_dir)
+    assert merged['url'][:3].tolist() == shard_frame(0, 3)['url'].tolist()
+    assert merged['url'].isna().tolist() == [False] * 3 + [True] * 2
+    assert merged['width'].tolist() == list(range(3)) + [100, 101]
+
+
+def test_parquet_parts_widen_the_schema(tmp_path):
+    output_dir = str(tmp_path / 'parts')
+    writer = ParquetPartWriter(output_dir, rows_per_part=100)
+    writer.write('a.parquet', shard_frame(0, 2).assign(url=None))
+    writer.write('b.parquet', shard_frame(1, 2))
+    writer.write('c.parquet', shard_frame(2, 2).assign(width=[2.5, 3.5]))
+    # Crash, then resume with the schema of the last finished part
+    resumed = ParquetPartWriter(output_dir, rows_per_part=100)
+    assert resumed.done == {os.path.abspath('a.parquet'), os.path.abspath('b.parquet')}
+    resumed.write('c.parquet', shard_frame(2, 2).assign(width=[2.5, 3.5]))
+    resumed.write('d.parquet', shard_frame(3, 2))
+    resumed.close()
+
+    # The null url column and the int widths each finished a part early
+    assert part_files(output_dir) == ['part-00000.parquet', 'part-00001.parquet', 'part-00002.parquet']
+    merged = read_parts(output_dir)
+    assert merged['url'].isna().tolist() == [True] * 2 + [False] * 6
+    assert merged['url'][2:].tolist() == [f"https://example.com/{shard}/{i}.jpg" for shard in (1, 2, 3) for i in range(2)]
+    assert merged['width'].tolist() == [0, 1, 100, 101, 2.5, 3.5, 300, 301]
+
+
+def test_parquet_parts_with_an_explicit_schema(tmp_path):
+    output_dir = str(tmp_path / 'parts')
+    schema = pa.schema([('width', pa.float64()), ('height', pa.int64()), ('url', pa.string())])
+    writer = ParquetPartWriter(output_dir, rows_per_part=100, schema=schema)
+    writer.write('a.parquet', shard_frame(0, 2).assign(url=None))
+    writer.write('b.parquet', shard_frame(1, 2).assign(width=[2.5, 3.5]))
+    writer.close()
+
+    assert part_files(output_dir) == ['part-00000.parquet']
+    assert pq.read_schema(os.path.join(output_dir, 'part-00000.parquet')).remove_metadata().equals(schema)
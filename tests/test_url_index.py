@@ -0,0 +1,85 @@
+import json
+import os
+
+import pandas as pd
+import pytest
+
+from shard_manifest import ShardManifest, run_incremental_shards
+from url_index import UrlIndex, ShardUrlDedup
+
+NUM_SHARDS = 8
+
+
+class Crash(Exception):
+    pass
+
+
+def make_shards(tmp_path):
+    # Every URL appears in two neighbouring shards, so the later shard must drop it
+    input_dir = tmp_path / 'input'
+    input_dir.mkdir()
+    files = []
+    for shard in range(NUM_SHARDS):
+        urls = [f"https://example.com/{shard}/{i}.jpg" for i in range(5)]
+        urls += [f"https://example.com/{shard - 1}/{i}.jpg" for i in range(5) if shard > 0]
+        path = input_dir / f"shard-{shard}.csv"
+        pd.DataFrame({'url': urls}).to_csv(path, index=False)
+        files.append(str(path))
+    return files
+
+
+def make_process_shard(output_dir):
+    def process_shard(file):
+        output = os.path.join(output_dir, os.path.basename(file))
+        df = pd.read_csv(file)
+        df.to_csv(output, index=False)
+        return {'rows': len(df)}, [output]
+    return process_shard
+
+
+def run(files, tmp_path, crash_after=None):
+    output_dir = tmp_path / 'output'
+    output_dir.mkdir(exist_ok=True)
+    manifest = ShardManifest(str(tmp_path / 'shard_manifest.json'), {'stage': 'test'})
+    url_dedup = ShardUrlDedup(UrlIndex(str(tmp_path / 'url_index.npz')), 'test', save_interval=3,
+                              manifest=manifest)
+
+    def on_result(file, outputs):
+        if crash_after is not None and url_dedup.shards == crash_after:
+            raise Crash()  # killed between two index saves: close() never runs
+        url_dedup(file, outputs)
+
+    summary = run_incremental_shards(make_process_shard(str(output_dir)), files, manifest,
+                                     num_workers=1, on_result=on_result)
+    url_dedup.close()
+    return summary
+
+
+def test_crash_between_index_saves_keeps_manifest_and_index_consistent(tmp_path):
+    files = make_shards(tmp_path)
+    with pytest.raises(Crash):
+        run(files, tmp_path, crash_after=5)
+
+    # The index was last saved while the third shard was deduplicated, before it was
+    # recorded; the manifest saved with it lists only the two shards before it
+    with open(tmp_path / 'shard_manifest.json') as f:
+        recorded = json.load(f)['shards']
+    assert sorted(os.path.basename(path) for path in recorded) == [f"shard-{i}.csv" for i in range(2)]
+
+    summary = run(files, tmp_path)
+    assert summary['unchanged_shards'] == 2
+    assert summary['shards'] == NUM_SHARDS - 2
+
+    # Every URL survives in exactly one output
+    outputs = pd.concat(pd.read_csv(tmp_path / 'output' / f"shard-{i}.csv") for i in range(NUM_SHARDS))
+    assert outputs['url'].is_unique
+    assert len(outputs) == NUM_SHARDS * 5
+
+
+def test_manifest_autosaves_without_dedup(tmp_path):
+    files = make_shards(tmp_path)[:2]
+    output_dir = tmp_path / 'output'
+    output_dir.mkdir()
+    manifest = ShardManifest(str(tmp_path / 'shard_manifest.json'), {'stage': 'test'})
+    run_incremental_shards(make_process_shard(str(output_dir)), files, manifest, num_workers=1)
+    assert len(ShardManifest(str(tmp_path / 'shard_manifest.json'), {'stage': 'test'}).entries) == 2